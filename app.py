@@ -1,17 +1,30 @@
 # app.py
 import os
-import cv2
 import sqlite3
-import pandas as pd
 import io
 import csv
+import json
 
-from io import BytesIO
 from flask import (
     Flask, Response, jsonify, send_from_directory,
     request, send_file
 )
+from werkzeug.security import safe_join
+from camera_alert import exporter, metrics
+from camera_alert.live_feed import LiveFeed, publish
 from camera_alert.logger import init_db
+from camera_alert.queries import (
+    attendance_cursor, attendance_query, event_cursor, events_query, iter_rows
+)
+from camera_alert.snapshot_store import SNAPSHOT_DIR, thumbnail_path
+from camera_alert.streaming import STREAM_MAX_FPS, _broadcasters, get_broadcaster, make_profile
+
+# Snapshots are written once and never change, so browsers may keep them
+SNAPSHOT_CACHE_MAX_AGE = int(os.getenv("SNAPSHOT_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+
+# Rows per page when no date range is given, and the most a client may ask for
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE     = 1000
 
 # ── Flask setup ─────────────────────────────────────────────────────────────────
 app = Flask(
@@ -31,100 +44,143 @@ def dashboard():
 
 
 # ── MJPEG Stream via OpenCV (no FFmpeg) ─────────────────────────────────────────
-def gen_mjpeg():
-    rtsp = os.getenv("CAMERA_RTSP")
-    cap  = cv2.VideoCapture(rtsp)
-    if not cap.isOpened():
-        raise RuntimeError("Cannot open RTSP stream")
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        ok, buf = cv2.imencode(
-            ".jpg", frame,
-            [int(cv2.IMWRITE_JPEG_QUALITY), 60]
-        )
-        if not ok:
-            continue
-        jpg = buf.tobytes()
+def gen_mjpeg(rtsp, max_fps=STREAM_MAX_FPS, profile=None, auto=False):
+    # One shared capture loop serves every viewer of the camera
+    frames = get_broadcaster(rtsp).frames(max_fps, profile, auto)
+    for jpg in frames:
         yield (
             b"--frame\r\n"
             b"Content-Type: image/jpeg\r\n\r\n"
             + jpg +
             b"\r\n"
         )
-    cap.release()
 
 
 @app.route("/api/stream")
 def mjpeg_stream():
+    rtsp = os.getenv("CAMERA_RTSP")
+    if not rtsp:
+        return jsonify({"error": "CAMERA_RTSP is not configured"}), 503
+
+    # Optional per-client tuning: ?fps=5&width=640&quality=50, or ?quality=auto
+    quality = request.args.get("quality", "")
+    auto    = quality.lower() == "auto" or request.args.get("auto") == "1"
+    try:
+        fps = float(request.args.get("fps", STREAM_MAX_FPS))
+        fps = max(0.5, min(STREAM_MAX_FPS, fps))
+        profile = make_profile(
+            request.args.get("width", type=int),
+            None if auto or not quality else int(quality)
+        )
+    except ValueError:
+        return jsonify({"error": "invalid stream parameters"}), 400
+
     return Response(
-        gen_mjpeg(),
+        gen_mjpeg(rtsp, fps, profile, auto),
         mimetype="multipart/x-mixed-replace; boundary=frame"
     )
 
 
+# ── Paging and streaming helpers ───────────────────────────────────────────────
+def page_limit(default):
+    """?limit=N clamped to MAX_PAGE_SIZE, or `default` (None = no limit)."""
+    raw = request.args.get("limit")
+    if raw is None:
+        return default
+    return max(1, min(MAX_PAGE_SIZE, int(raw)))
+
+
+def json_array(items, chunk_size=64 * 1024):
+    """Stream an iterable of dicts as one JSON array, in ~chunk_size pieces."""
+    parts, size, sep = ["["], 1, ""
+    for item in items:
+        part = sep + json.dumps(item)
+        parts.append(part)
+        size += len(part)
+        sep = ","
+        if size >= chunk_size:
+            yield "".join(parts)
+            parts, size = [], 0
+    parts.append("]")
+    yield "".join(parts)
+
+
+def csv_stream(header, rows, chunk_size=64 * 1024):
+    """Stream CSV: the header at once, then rows in ~chunk_size pieces."""
+    si     = io.StringIO()
+    writer = csv.writer(si)
+    writer.writerow(header)
+    yield si.getvalue()
+    si.seek(0)
+    si.truncate()
+    for row in rows:
+        writer.writerow(row)
+        if si.tell() >= chunk_size:
+            yield si.getvalue()
+            si.seek(0)
+            si.truncate()
+    yield si.getvalue()
+
+
+def list_response(sql, params, to_dict, cursor_of, limit):
+    """
+    JSON list of rows. A page (limit set) is sent whole, with X-Next-Cursor
+    when more rows may follow; pass it back as ?cursor= for the next page.
+    Without a limit the array is streamed straight from the cursor.
+    """
+    if limit is None:
+        return Response(
+            json_array(to_dict(r) for r in iter_rows(sql, params)),
+            mimetype="application/json"
+        )
+    rows = list(iter_rows(sql, params, limit=limit))
+    response = jsonify([to_dict(r) for r in rows])
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = cursor_of(rows[-1])
+    return response
+
+
 # ── Unknown-Face Events API ─────────────────────────────────────────────────────
+def event_dict(r):
+    url = snapshot_url(r["snapshot_path"])
+    return {
+        "id":            r["id"],
+        "name":          r["name"] or "",
+        "timestamp":     r["timestamp"],
+        "snapshot_path": f"{url}?size=full",
+        "thumbnail":     url
+    }
+
+
 @app.route("/api/events")
 def get_events():
+    # ?start=&end= (dates, inclusive), ?limit=, ?cursor= from X-Next-Cursor
     start = request.args.get("start")
     end   = request.args.get("end")
     fmt   = request.args.get("format", "").lower()
 
-    conn = sqlite3.connect("alerts.db")
-    conn.row_factory = sqlite3.Row
-    cur  = conn.cursor()
-
-    if start and end:
-        cur.execute("""
-            SELECT id, name, timestamp, snapshot_path
-              FROM unknown_faces
-             WHERE date(timestamp) BETWEEN ? AND ?
-             ORDER BY timestamp DESC
-        """, (start, end))
-    else:
-        cur.execute("""
-            SELECT id, name, timestamp, snapshot_path
-              FROM unknown_faces
-             ORDER BY timestamp DESC
-             LIMIT 50
-        """)
-
-    rows = cur.fetchall()
-    conn.close()
-
-    # Build a simple list of dicts, *defining fname* for each row*
-    events = []
-    for r in rows:
-        fname = os.path.basename(r["snapshot_path"])
-        events.append({
-            "id":            r["id"],
-            "name":          r["name"] or "",
-            "timestamp":     r["timestamp"],
-            "snapshot_path": f"/snapshots/{fname}"
-        })
+    try:
+        # A date range returns every matching event unless ?limit= is given
+        limit = page_limit(None if start and end else DEFAULT_PAGE_SIZE)
+        sql, params = events_query(start, end, request.args.get("cursor"))
+    except ValueError:
+        return jsonify({"error": "invalid query parameters"}), 400
 
     # If ?format=csv, stream a CSV
     if fmt == "csv":
-        si     = io.StringIO()
-        writer = csv.writer(si)
-        writer.writerow(["ID", "Name", "Timestamp", "Snapshot"])
-        for e in events:
-            # use the same key names as above
-            writer.writerow([
-                e["id"],
-                e["name"],
-                e["timestamp"],
-                os.path.basename(e["snapshot_path"])
-            ])
+        rows = (
+            [r["id"], r["name"] or "", r["timestamp"],
+             snapshot_url(r["snapshot_path"])[len("/snapshots/"):]]
+            for r in iter_rows(sql, params, limit=limit)
+        )
         return Response(
-            si.getvalue(),
+            csv_stream(["ID", "Name", "Timestamp", "Snapshot"], rows),
             mimetype="text/csv",
             headers={"Content-Disposition": "attachment; filename=unknown_events.csv"}
         )
 
     # Otherwise return JSON
-    return jsonify(events)
+    return list_response(sql, params, event_dict, event_cursor, limit)
 
 
 @app.route("/api/delete_event/<int:event_id>", methods=["DELETE"])
@@ -135,6 +191,7 @@ def delete_event(event_id):
         "DELETE FROM unknown_faces WHERE id=?",
         (event_id,)
     )
+    publish(conn, "event_deleted", {"id": event_id})
     conn.commit()
     conn.close()
     return jsonify({"status": "success"})
@@ -145,62 +202,65 @@ def clear_events():
     conn = sqlite3.connect("alerts.db")
     cur  = conn.cursor()
     cur.execute("DELETE FROM unknown_faces")
+    publish(conn, "events_cleared", {})
     conn.commit()
     conn.close()
     return jsonify({"status": "success"})
 
 
+def snapshot_url(path):
+    """/snapshots/ URL for a stored path (per-day subfolder or legacy flat file)."""
+    rel = os.path.relpath(path, SNAPSHOT_DIR)
+    if rel.startswith(".."):
+        rel = os.path.basename(path)
+    return "/snapshots/" + rel.replace(os.sep, "/")
+
+
 @app.route("/snapshots/<path:filename>")
 def serve_snapshots(filename):
-    return send_from_directory(
-        os.path.join(os.getcwd(), "snapshots"),
-        filename
-    )
+    # Thumbnail by default; ?size=full for the original image
+    folder  = os.path.join(os.getcwd(), SNAPSHOT_DIR)
+    max_age = SNAPSHOT_CACHE_MAX_AGE
+    if request.args.get("size") != "full":
+        thumb = thumbnail_path(filename)
+        full_thumb = safe_join(folder, thumb)
+        if full_thumb and os.path.isfile(full_thumb):
+            filename = thumb
+        else:
+            # Legacy snapshot, or the thumbnail is not written yet
+            max_age = 60
+
+    response = send_from_directory(folder, filename, max_age=max_age)
+    if max_age == SNAPSHOT_CACHE_MAX_AGE:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
 
 
 # ── Employee Attendance API ────────────────────────────────────────────────────
 @app.route("/api/employee_log")
 def employee_log():
+    # ?start=&end= (dates, inclusive), ?limit=, ?cursor= from X-Next-Cursor
     start = request.args.get("start")
     end   = request.args.get("end")
 
-    conn = sqlite3.connect("alerts.db")
-    conn.row_factory = sqlite3.Row
-    cur  = conn.cursor()
-
-    if start and end:
-        cur.execute("""
-            SELECT employee_name AS name,
-                   date            AS date,
-                   first_seen,
-                   last_seen
-              FROM employee_log
-             WHERE date BETWEEN ? AND ?
-             ORDER BY date DESC, employee_name
-        """, (start, end))
-    else:
-        cur.execute("""
-            SELECT employee_name AS name,
-                   date            AS date,
-                   first_seen,
-                   last_seen
-              FROM employee_log
-             ORDER BY date DESC, employee_name
-        """)
-
-    rows = cur.fetchall()
-    conn.close()
+    try:
+        limit = page_limit(None)
+        sql, params = attendance_query(start, end, request.args.get("cursor"))
+    except ValueError:
+        return jsonify({"error": "invalid query parameters"}), 400
 
-    # Return list of dicts
-    return jsonify([
-        {
+    # List of dicts, streamed unless a page was requested
+    return list_response(
+        sql, params,
+        lambda r: {
             "name":       r["name"] or "",
             "date":       r["date"],
             "first_seen": r["first_seen"],
             "last_seen":  r["last_seen"],
-        }
-        for r in rows
-    ])
+        },
+        attendance_cursor, limit
+    )
 
 
 @app.route("/api/delete_employee_log", methods=["DELETE"])
@@ -215,52 +275,78 @@ def delete_employee_log():
         "DELETE FROM employee_log WHERE employee_name=? AND date=?",
         (name, date_)
     )
+    publish(conn, "attendance_deleted", {"name": name, "date": date_})
     conn.commit()
     conn.close()
     return jsonify({"status": "success"})
 
 
-# ── Export Attendance as Excel ─────────────────────────────────────────────────
+# ── Live Updates (server-sent events) ───────────────────────────────────────────
+def render_live(kind, payload):
+    # Give pushed events the same shape as /api/events rows
+    return event_dict(payload) if kind == "unknown_face" else payload
+
+
+# One poller per process shared by every connected dashboard
+live_feed = LiveFeed(render=render_live)
+
+
+@app.route("/api/live")
+def live_updates():
+    # EventSource resends Last-Event-ID on reconnect; ?last_id= for other clients
+    raw = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    try:
+        last_id = int(raw) if raw else None
+    except ValueError:
+        return jsonify({"error": "invalid last event id"}), 400
+
+    return Response(
+        live_feed.stream(last_id),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ── Metrics (Prometheus text format) ──────────────────────────────────────────
+metrics.gauge_fn(
+    "camera_alert_live_subscribers", "Dashboards connected to /api/live",
+    lambda: live_feed.snapshot()["subscribers"]
+)
+metrics.gauge_fn(
+    "camera_alert_stream_viewers", "Viewers of the MJPEG stream",
+    lambda: sum(b.snapshot()["subscribers"] for b in list(_broadcasters.values()))
+)
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Covers this web process only; the monitor serves its own on METRICS_PORT
+    if not metrics.registry.enabled:
+        return jsonify({"error": "metrics disabled"}), 404
+    return Response(metrics.registry.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+# ── Export Attendance (Excel, Parquet, gzip CSV) ───────────────────────────────
 @app.route("/api/export_attendance")
 def export_attendance():
     start = request.args.get("start")
     end   = request.args.get("end")
+    fmt   = request.args.get("format", "xlsx").lower()
 
-    conn = sqlite3.connect("alerts.db")
-    df   = pd.read_sql_query(
-        f"""
-        SELECT employee_name as Employee,
-               date          as Date,
-               first_seen    as FirstSeen,
-               last_seen     as LastSeen
-          FROM employee_log
-         {"WHERE date BETWEEN ? AND ?" if start and end else ""}
-         ORDER BY date, employee_name
-        """,
-        conn,
-        params=(start, end) if start and end else None
-    )
-    conn.close()
-
-    buf = BytesIO()
-    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
-        df.to_excel(
-            writer,
-            index=False,
-            sheet_name="Attendance"
-        )
-    buf.seek(0)
+    # Rows are read in batches into a temp file that spills to disk when large
+    try:
+        out = exporter.export_attendance(fmt, start, end)
+    except (exporter.ExportError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
 
+    mimetype, ext = exporter.EXPORT_FORMATS[fmt]
     return send_file(
-        buf,
-        mimetype=(
-            "application/vnd.openxmlformats"
-            "-officedocument.spreadsheetml.sheet"
-        ),
+        out,
+        mimetype=mimetype,
         as_attachment=True,
         download_name=(
             f"attendance_{start or 'all'}_"
-            f"{end or ''}.xlsx"
+            f"{end or ''}.{ext}"
         )
     )
 
@@ -0,0 +1,166 @@
+# camera_alert/analysis.py
+
+import os
+import time
+import threading
+
+from camera_alert import metrics
+from camera_alert.clips import request_clip
+from camera_alert.face_recognizer import DETECTION_MODEL, DETECTION_UPSAMPLE, recognize_faces
+from camera_alert.logger import log_event
+from camera_alert.matcher import GalleryMatcher
+from camera_alert.scheduler import AnalysisScheduler
+from camera_alert.tracker import FaceTracker
+from camera_alert.unknown_clusters import UnknownClusterStore
+from camera_alert.notifier import send_alert
+from camera_alert.utils import save_snapshot
+from camera_alert.time_utils import get_timestamped_filename
+
+ALERT_INTERVAL    = float(os.getenv("ALERT_INTERVAL", "300"))
+DETECTION_SCALE   = float(os.getenv("DETECTION_SCALE", "0.5"))  # frame downscale before detection
+# Fraction of the frame above which motion regions are ignored and the
+# whole frame is searched instead
+FULL_FRAME_RATIO  = float(os.getenv("FULL_FRAME_RATIO", "0.6"))
+# Set FACE_TRACKING=0 to encode every detected face on every frame
+FACE_TRACKING     = os.getenv("FACE_TRACKING", "1") != "0"
+
+_CLUSTER_SECONDS = metrics.histogram(
+    "camera_alert_cluster_seconds", "Unknown-face clustering time per frame"
+)
+_ALERTS = metrics.counter("camera_alert_alerts_total", "Unknown-face alerts raised", ["camera"])
+
+
+class AlertJob:
+    """Snapshot/log/notify work handed from analysis to the I/O stage."""
+
+    __slots__ = ("face_label", "frame", "captured_at", "camera")
+
+    def __init__(self, face_label, frame, captured_at, camera=None):
+        self.face_label = face_label
+        self.frame = frame
+        self.captured_at = captured_at
+        self.camera = camera
+
+
+class FaceAnalyzer:
+    """
+    Recognition plus unknown-face clustering and alert throttling.
+    One instance is shared by every camera, so the known-face gallery and
+    the unknown clusters exist only once per process.
+
+    scheduler (an AnalysisScheduler) decides which frames callers pass to
+    analyze() and lowers the detection setting when analysis falls behind.
+    """
+
+    def __init__(self, known_encs, known_names,
+                 alert_interval=ALERT_INTERVAL,
+                 clusters=None, pool=None, scale=DETECTION_SCALE,
+                 model=DETECTION_MODEL, upsample=DETECTION_UPSAMPLE, scheduler=None):
+        self.gallery = GalleryMatcher(known_encs, known_names)
+        self.pool = pool            # optional RecognitionPool
+        self.alert_interval = alert_interval
+        self.scale = scale
+        self.model = model
+        self.upsample = upsample
+        self.clusters = clusters or UnknownClusterStore()
+        self.scheduler = scheduler or AnalysisScheduler()
+        self._lock = threading.Lock()
+
+        self.trackers = {}          # camera -> FaceTracker
+
+    def swap_gallery(self, gallery):
+        """
+        Replace the known-face gallery; frames already in flight keep the old
+        one. Tracked faces are matched again, so a removed or renamed person
+        is not reported under the old name until TRACK_IDENTITY_TTL runs out.
+        """
+        self.gallery = gallery
+        if self.pool is not None:
+            self.pool.set_gallery(gallery.matrix, gallery.names)
+        with self._lock:
+            trackers = list(self.trackers.values())
+        for tracker in trackers:
+            tracker.forget_identities(gallery)
+
+    def tracker_for(self, camera):
+        """The FaceTracker for camera (None when tracking is disabled)."""
+        if not FACE_TRACKING:
+            return None
+        with self._lock:
+            tracker = self.trackers.get(camera)
+            if tracker is None:
+                tracker = self.trackers[camera] = FaceTracker()
+            return tracker
+
+    def admit(self, packet):
+        """
+        True if packet (after the motion gate) should be analysed now. Frames
+        are skipped to hold each camera to the scheduler's rate.
+        """
+        return self.scheduler.admit(packet.camera, bool(packet.motion))
+
+    def analyze(self, packet):
+        """
+        Run recognition on a motion frame, restricted to the moving regions
+        in packet.motion when there is one.
+        Boxes are drawn on packet.frame itself, which is returned as the
+        annotated frame. Returns (annotated_frame, [AlertJob, ...]).
+        """
+        started = time.perf_counter()
+        frame = packet.frame
+        gallery = self.gallery      # one consistent gallery for this frame
+        scale, upsample = self.scheduler.settings(self.scale, self.upsample)
+
+        # Downscale for performance; the RGB view is converted from this once
+        small_frame = packet.context.small(scale)
+
+        regions = None
+        if packet.motion:
+            regions = packet.motion.regions(small_frame.shape, scale=scale)
+            covered = sum((b - t) * (r - l) for t, r, b, l in regions)
+            if covered > FULL_FRAME_RATIO * small_frame.shape[0] * small_frame.shape[1]:
+                regions = None
+
+        enc_list, raw_ids, annotated, fresh = recognize_faces(
+            small_frame, gallery, regions=regions,
+            tracker=self.tracker_for(packet.camera), pool=self.pool,
+            upsample=upsample, model=self.model, seq=packet.seq, scale=scale,
+            rgb=packet.context.rgb(scale),
+            canvas=frame, canvas_scale=1.0 / scale
+        )
+
+        now = time.time()
+        jobs = []
+
+        # Cluster similar unknowns in one batched nearest-centroid query. Only
+        # new encodings count: a steady track reuses its encoding, and feeding
+        # it again every frame would pull the cluster mean towards that one face
+        unknown = [enc for enc, raw_id, new in zip(enc_list, raw_ids, fresh)
+                   if new and raw_id not in gallery]
+        with _CLUSTER_SECONDS.time():
+            cluster_ids = self.clusters.assign(unknown, now)
+        for cluster_id in cluster_ids:
+            # Alert throttling
+            if self.clusters.should_alert(cluster_id, self.alert_interval, now):
+                face_label = f"Unknown_{cluster_id}"
+                where = f" on {packet.camera}" if packet.camera else ""
+                print(f"[ALERT] {face_label} detected{where}! Saving snapshot...")
+                _ALERTS.labels(packet.camera or "").inc()
+                jobs.append(AlertJob(
+                    face_label, annotated, packet.captured_at, packet.camera
+                ))
+
+        self.scheduler.record(time.perf_counter() - started)
+        return annotated, jobs
+
+
+def dispatch_alert(job):
+    """I/O stage handler: snapshot → clip → DB → notification."""
+    prefix = f"{job.camera}_{job.face_label}" if job.camera else job.face_label
+    fname = get_timestamped_filename(prefix=prefix, ext="jpg")
+    path = save_snapshot(job.frame, fname)
+    # Frames around the trigger, cut from the camera's ring in the background
+    request_clip(job.camera, path, job.captured_at)
+
+    log_event(job.face_label, path)
+    send_alert(job.face_label, path)
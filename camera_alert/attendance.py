@@ -0,0 +1,104 @@
+# camera_alert/attendance.py
+
+import os
+import atexit
+import threading
+from datetime import datetime
+
+from camera_alert.logger import upsert_attendance
+
+# How often pending last_seen updates are written, in seconds
+ATTENDANCE_FLUSH_INTERVAL = float(os.getenv("ATTENDANCE_FLUSH_INTERVAL", "60"))
+
+
+class AttendanceTracker:
+    """
+    In-memory attendance for the current day: {name: [first_seen, last_seen]}.
+
+    The first sighting of an employee is written right away; later sightings
+    only move last_seen in memory and are written every flush_interval
+    seconds, at day rollover and on shutdown. A person in view for an hour
+    costs a handful of writes instead of one per frame.
+    """
+
+    def __init__(self, db_path="alerts.db", flush_interval=ATTENDANCE_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.sightings = 0
+        self.writes = 0
+        self._day = None
+        self._table = {}        # name -> [first_seen, last_seen]
+        self._dirty = set()     # names whose last_seen is not yet written
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stop_event = threading.Event()
+
+    def seen(self, name, when=None):
+        """Record a sighting of a known employee."""
+        when = when or datetime.now()
+        day = when.strftime("%Y-%m-%d")
+        t = when.strftime("%H:%M:%S")
+
+        with self._lock:
+            self.sightings += 1
+            if day != self._day:
+                self._flush_locked()
+                self._day = day
+                self._table = {}
+
+            entry = self._table.get(name)
+            if entry is None:
+                self._table[name] = [t, t]
+                upsert_attendance(name, day, t, t, self.db_path)
+                self.writes += 1
+            elif t > entry[1]:
+                entry[1] = t
+                self._dirty.add(name)
+
+        if self._flusher is None:
+            self._start_flusher()
+
+    def flush(self):
+        """Write every pending last_seen update."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        for name in self._dirty:
+            first_seen, last_seen = self._table[name]
+            upsert_attendance(name, self._day, first_seen, last_seen, self.db_path)
+            self.writes += 1
+        self._dirty.clear()
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="attendance-flusher", daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Flush pending updates and stop the background flusher."""
+        self._stop_event.set()
+        self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "day":       self._day,
+                "employees": len(self._table),
+                "pending":   len(self._dirty),
+                "sightings": self.sightings,
+                "writes":    self.writes,
+            }
+
+
+# Shared tracker used by the recognizer
+tracker = AttendanceTracker()
+atexit.register(tracker.close)
@@ -0,0 +1,441 @@
+# camera_alert/benchmark.py
+"""
+Replay a video file or synthetic frames through the monitoring pipeline and
+report throughput, per-stage latency, CPU and peak memory.
+
+    python -m camera_alert.benchmark --video lobby.mp4 --frames 500
+    python -m camera_alert.benchmark --synthetic --scale 0.25 0.5 --workers 1 2 \\
+        --output bench.json
+
+Frames go through the same MotionDetector -> FaceAnalyzer (recognition,
+clustering, alert throttling) -> dispatch_alert stages as camera_alert.main.
+Notifications are stubbed, and the database and snapshots are written to a
+temporary directory. Every combination of the listed --scale, --model,
+--upsample, --workers and --processes values is one run.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import itertools
+import subprocess
+import tempfile
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+try:
+    import resource         # peak RSS; not available on Windows
+except ImportError:
+    resource = None
+
+import camera_alert.analysis as analysis
+import camera_alert.face_recognizer as face_recognizer
+from camera_alert.analysis import FaceAnalyzer, dispatch_alert
+from camera_alert.attendance import tracker as attendance
+from camera_alert.encoding_cache import list_images
+from camera_alert.face_recognizer import TOLERANCE, load_known_faces
+from camera_alert.logger import close_writers, flush_writes, init_db
+from camera_alert.motion_detector import MotionDetector
+from camera_alert.pipeline import (
+    FRAME_QUEUE_SIZE, IO_QUEUE_SIZE, DropOldestQueue, FramePacket, Stage
+)
+from camera_alert.recognition_pool import RecognitionPool
+from camera_alert.scheduler import AnalysisScheduler
+from camera_alert.snapshot_store import close_snapshot_writers, get_snapshot_writer
+from camera_alert.unknown_clusters import UnknownClusterStore
+
+KNOWN_FACES_DIR = "camera_alert/known_faces"
+STAGES = ["capture", "motion", "recognize", "cluster", "analyze", "dispatch", "end_to_end"]
+
+
+# ── Frame sources ─────────────────────────────────────────────────────────────
+def video_frames(path, limit):
+    """Up to `limit` BGR frames decoded from a video file."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"[ERROR] Cannot open video: {path}")
+    try:
+        for _ in range(limit):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+
+def load_face_crops(directory, face_height=160):
+    """(name, BGR crop) for every image in directory with a detectable face."""
+    import face_recognition
+
+    crops = []
+    for fname in list_images(directory):
+        image = face_recognition.load_image_file(os.path.join(directory, fname))
+        locations = face_recognition.face_locations(image)
+        if not locations:
+            continue
+        top, right, bottom, left = locations[0]
+        pad = (bottom - top) // 3
+        top, left = max(0, top - pad), max(0, left - pad)
+        bottom, right = min(image.shape[0], bottom + pad), min(image.shape[1], right + pad)
+        crop = cv2.cvtColor(image[top:bottom, left:right], cv2.COLOR_RGB2BGR)
+        scale = face_height / crop.shape[0]
+        crop = cv2.resize(crop, (max(1, round(crop.shape[1] * scale)), face_height))
+        crops.append((os.path.splitext(fname)[0], crop))
+    return crops
+
+
+def synthetic_frames(crops, limit, size=(1280, 720), faces_per_frame=2,
+                     segment=50, idle=10, seed=0):
+    """
+    Static background with face crops drifting across it. Each segment of
+    `segment` frames shows a new set of faces and ends with `idle` frames
+    without any, so both the motion gate and recognition are exercised.
+    """
+    w, h = size
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(60, 160, w, dtype=np.float32)
+    background = np.repeat(ramp[None, :], h, axis=0)[..., None].repeat(3, axis=2)
+    background = np.clip(background + rng.normal(0, 6, background.shape), 0, 255).astype(np.uint8)
+
+    sprites = []
+    for i in range(limit):
+        pos = i % segment
+        if pos == 0:
+            sprites = []
+            for _ in range(min(faces_per_frame, len(crops))):
+                crop = crops[rng.integers(len(crops))][1]
+                ch, cw = crop.shape[:2]
+                x, y = rng.uniform(0, w - cw), rng.uniform(0, h - ch)
+                vx, vy = rng.uniform(-6, 6, 2)
+                sprites.append([crop, x, y, vx, vy])
+
+        frame = background.copy()
+        if pos < segment - idle:
+            for sprite in sprites:
+                crop, x, y, vx, vy = sprite
+                ch, cw = crop.shape[:2]
+                # Bounce off the edges
+                if not 0 <= x + vx <= w - cw:
+                    sprite[3] = vx = -vx
+                if not 0 <= y + vy <= h - ch:
+                    sprite[4] = vy = -vy
+                sprite[1], sprite[2] = x + vx, y + vy
+                xi, yi = int(x), int(y)
+                frame[yi:yi + ch, xi:xi + cw] = crop
+        yield frame
+
+
+# ── Measurement ───────────────────────────────────────────────────────────────
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "count": len(ms),
+        "mean":  round(float(ms.mean()), 2),
+        "p50":   round(float(p50), 2),
+        "p95":   round(float(p95), 2),
+        "p99":   round(float(p99), 2),
+        "max":   round(float(ms.max()), 2),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def children_cpu_seconds():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+@contextmanager
+def patched(module, name, value):
+    original = getattr(module, name)
+    setattr(module, name, value)
+    try:
+        yield
+    finally:
+        setattr(module, name, original)
+
+
+def timed(fn, samples, counter=None):
+    """Wrap fn so each call's duration is appended to samples."""
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        result = fn(*args, **kwargs)
+        samples.append(time.perf_counter() - t0)
+        if counter is not None:
+            counter(result)
+        return result
+    return wrapper
+
+
+# ── One configuration ─────────────────────────────────────────────────────────
+def run_config(config, frames, known_encs, known_names, realtime_fps=0):
+    """Replay frames through the pipeline with one configuration; returns the result dict."""
+    samples = defaultdict(list)
+    counts = defaultdict(int)
+    lock = threading.Lock()
+
+    def count(key, n=1):
+        with lock:
+            counts[key] += n
+
+    pool = None
+    if config["processes"]:
+        pool = RecognitionPool(known_encs, known_names, TOLERANCE, workers=config["processes"])
+    analyzer = FaceAnalyzer(
+        known_encs, known_names, pool=pool,
+        clusters=UnknownClusterStore(path=None), scheduler=AnalysisScheduler.unlimited(),
+        scale=config["scale"], model=config["model"], upsample=config["upsample"],
+    )
+    analyzer.clusters.assign = timed(analyzer.clusters.assign, samples["cluster"])
+    motion_detector = MotionDetector()
+    motion_lock = threading.Lock()
+
+    def analyze(packet):
+        t0 = time.perf_counter()
+        try:
+            with motion_lock:
+                packet.motion = motion_detector.detect(packet.context)
+            t1 = time.perf_counter()
+            samples["motion"].append(t1 - t0)
+            jobs = None
+            if analyzer.admit(packet):
+                count("motion_frames")
+                _, jobs = analyzer.analyze(packet)
+                samples["analyze"].append(time.perf_counter() - t1)
+                count("alerts", len(jobs))
+        finally:
+            packet.release()
+        samples["end_to_end"].append(time.time() - packet.captured_at)
+        return jobs
+
+    def dispatch(job):
+        t0 = time.perf_counter()
+        dispatch_alert(job)
+        samples["dispatch"].append(time.perf_counter() - t0)
+
+    # As fast as possible: the feeder waits for room instead of dropping
+    frame_q = DropOldestQueue(maxsize=FRAME_QUEUE_SIZE if realtime_fps else 2 * config["workers"])
+    io_q = DropOldestQueue(maxsize=IO_QUEUE_SIZE)
+    analysis_stage = Stage("analysis", analyze, frame_q, io_q, workers=config["workers"],
+                           ordered=True)
+    io_stage = Stage("io", dispatch, io_q)
+
+    count_faces = lambda result: count("faces", len(result[0]))
+    recognize = timed(analysis.recognize_faces, samples["recognize"], count_faces)
+    with patched(analysis, "recognize_faces", recognize), \
+         patched(analysis, "send_alert", lambda face_id, path: count("notifications")):
+        analysis_stage.start()
+        io_stage.start()
+        cpu0, children0 = time.process_time(), children_cpu_seconds()
+        rejected0 = dict(face_recognizer.quality_rejections)
+        started = time.time()
+        fed = 0
+        source = iter(frames)
+        while True:
+            t0 = time.perf_counter()
+            frame = next(source, None)
+            if frame is None:
+                break
+            samples["capture"].append(time.perf_counter() - t0)
+            if realtime_fps:
+                delay = started + fed / realtime_fps - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                while frame_q.depth() >= frame_q.maxsize:
+                    time.sleep(0.001)
+            fed += 1
+            frame_q.put(FramePacket(fed, frame))
+
+        # Wait until every frame and alert has been handled
+        def settled():
+            a, i = analysis_stage.stats, io_stage.stats
+            return (a.processed + a.errors + frame_q.dropped >= fed and
+                    i.processed + i.errors + io_q.dropped >= counts["alerts"])
+        while not settled():
+            time.sleep(0.01)
+        wall = time.time() - started
+        cpu = time.process_time() - cpu0
+
+        analysis_stage.stop()
+        io_stage.stop()
+
+    if pool:
+        pool.close()
+    cpu += children_cpu_seconds() - children0
+    get_snapshot_writer().flush()
+    flush_writes()
+
+    processed = analysis_stage.stats.processed
+    return {
+        "config":        config,
+        "frames":        fed,
+        "processed":     processed,
+        "dropped":       frame_q.dropped,
+        "errors":        analysis_stage.stats.errors + io_stage.stats.errors,
+        "motion_frames": counts["motion_frames"],
+        "faces":         counts["faces"],
+        "rejected_faces": {reason: n - rejected0[reason]
+                           for reason, n in face_recognizer.quality_rejections.items()},
+        "alerts":        counts["alerts"],
+        "wall_s":        round(wall, 3),
+        "fps":           round(processed / wall, 2) if wall else 0.0,
+        "cpu_percent":   round(100 * cpu / wall, 1) if wall else 0.0,
+        "peak_rss_mb":   peak_rss_mb(),
+        "latency_ms":    {stage: percentiles(samples[stage]) for stage in STAGES},
+    }
+
+
+def format_result(result):
+    c = result["config"]
+    e2e = result["latency_ms"]["end_to_end"]
+    return (
+        f"[BENCH] scale={c['scale']} model={c['model']} upsample={c['upsample']} "
+        f"workers={c['workers']} processes={c['processes']}: "
+        f"{result['fps']} fps, e2e p50/p95/p99 "
+        f"{e2e.get('p50')}/{e2e.get('p95')}/{e2e.get('p99')} ms, "
+        f"{result['motion_frames']} motion frames, {result['faces']} faces "
+        f"({sum(result['rejected_faces'].values())} rejected), "
+        f"{result['alerts']} alerts, cpu {result['cpu_percent']}%, "
+        f"peak RSS {result['peak_rss_mb']} MB"
+    )
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the monitoring pipeline on recorded or synthetic frames"
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--video", help="video file to replay")
+    source.add_argument("--synthetic", action="store_true",
+                        help="generate frames with pasted face crops (default)")
+    parser.add_argument("--frames", type=int, default=300, help="frames per run")
+    parser.add_argument("--faces", default=KNOWN_FACES_DIR,
+                        help="known faces directory (gallery, and crops for --synthetic)")
+    parser.add_argument("--known-ratio", type=float, default=0.5,
+                        help="synthetic: fraction of face crops enrolled; the rest are unknown")
+    parser.add_argument("--faces-per-frame", type=int, default=2)
+    parser.add_argument("--size", default="1280x720", help="synthetic frame size WxH")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--realtime", type=float, default=0, metavar="FPS",
+                        help="feed frames at this rate, dropping like a live camera "
+                             "(default: as fast as the pipeline accepts them)")
+    parser.add_argument("--scale", type=float, nargs="+", default=[analysis.DETECTION_SCALE])
+    parser.add_argument("--model", nargs="+", default=[analysis.DETECTION_MODEL])
+    parser.add_argument("--upsample", type=int, nargs="+", default=[analysis.DETECTION_UPSAMPLE])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1],
+                        help="analysis threads")
+    parser.add_argument("--processes", type=int, nargs="+", default=[0],
+                        help="recognition pool processes (0 = in-process)")
+    parser.add_argument("--label", help="free-form label stored with the results")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the temporary database and snapshots")
+    args = parser.parse_args(argv)
+    started = datetime.now().isoformat(timespec="seconds")
+
+    faces_dir = os.path.abspath(args.faces)
+    video = os.path.abspath(args.video) if args.video else None
+    output = os.path.abspath(args.output) if args.output else None
+
+    if video:
+        known_encs, known_names = load_known_faces(faces_dir)
+        frames = lambda: video_frames(video, args.frames)
+        source_info = {"video": video}
+    else:
+        import face_recognition
+
+        w, h = (int(v) for v in args.size.lower().split("x"))
+        crops = load_face_crops(faces_dir) if os.path.isdir(faces_dir) else []
+        if not crops:
+            print(f"[WARNING] No face crops in {faces_dir}; frames will contain motion only")
+        enrolled = crops[:round(len(crops) * args.known_ratio)]
+        known_encs, known_names = [], []
+        for name, crop in enrolled:
+            encs = face_recognition.face_encodings(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+            if encs:
+                known_encs.append(encs[0])
+                known_names.append(name)
+        frames = lambda: synthetic_frames(
+            crops, args.frames, (w, h), args.faces_per_frame, seed=args.seed
+        )
+        source_info = {"synthetic": {"size": [w, h], "faces": len(crops),
+                                     "enrolled": len(known_names), "seed": args.seed}}
+
+    # Database, attendance and snapshots go to a scratch directory
+    workdir = tempfile.mkdtemp(prefix="camera_alert_bench_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    results = []
+    try:
+        init_db()
+        for scale, model, upsample, workers, processes in itertools.product(
+            args.scale, args.model, args.upsample, args.workers, args.processes
+        ):
+            config = {"scale": scale, "model": model, "upsample": upsample,
+                      "workers": workers, "processes": processes}
+            result = run_config(config, frames(), known_encs, known_names, args.realtime)
+            print(format_result(result))
+            results.append(result)
+    finally:
+        attendance.close()
+        close_snapshot_writers()
+        close_writers()
+        os.chdir(cwd)
+        if args.keep:
+            print(f"[INFO] Benchmark database and snapshots kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "started":   started,
+        "label":     args.label,
+        "revision":  git_revision(),
+        "host":      {"platform": platform.platform(), "python": platform.python_version(),
+                      "cpus": os.cpu_count()},
+        "source":    source_info,
+        "frames":    args.frames,
+        "realtime":  args.realtime or None,
+        "known":     len(known_names),
+        "runs":      results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
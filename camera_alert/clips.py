@@ -0,0 +1,333 @@
+# camera_alert/clips.py
+
+import os
+import atexit
+import queue
+import shutil
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from camera_alert import metrics
+
+# ── Clip settings ─────────────────────────────────────────────────────────────
+CLIP_FPS          = float(os.getenv("CLIP_FPS", "5"))           # frames kept per second, 0 = off
+CLIP_PRE_SECONDS  = float(os.getenv("CLIP_PRE_SECONDS", "5"))   # before the alert
+CLIP_POST_SECONDS = float(os.getenv("CLIP_POST_SECONDS", "5"))  # after the alert
+CLIP_WIDTH        = int(os.getenv("CLIP_WIDTH", "960"))         # downscale wider frames, 0 = native
+CLIP_QUALITY      = int(os.getenv("CLIP_QUALITY", "70"))        # JPEG quality of buffered frames
+CLIP_BUFFER_MB    = float(os.getenv("CLIP_BUFFER_MB", "16"))    # ring memory per camera
+CLIP_FORMAT       = os.getenv("CLIP_FORMAT", "jpg")             # jpg (image sequence) | avi
+CLIP_MAX_PENDING  = int(os.getenv("CLIP_MAX_PENDING", "8"))     # clips collecting frames per camera
+
+CLIP_DIR = "clips"
+
+_rings = {}             # camera label -> FrameRing, for the memory gauge
+metrics.gauge_fn(
+    "camera_alert_clip_buffer_bytes", "Compressed frames held in each camera's clip ring",
+    lambda: {label: ring.nbytes for label, ring in list(_rings.items())}, ["camera"]
+)
+_CLIPS = metrics.counter("camera_alert_clips_total", "Alert clips by outcome", ["result"])
+
+
+def clip_path(snapshot_path, fmt=CLIP_FORMAT):
+    """Clip for a snapshot: <day>/clips/<name> (a directory of JPEGs, or <name>.avi)."""
+    head, name = os.path.split(snapshot_path)
+    base = os.path.join(head, CLIP_DIR, os.path.splitext(name)[0])
+    return base + ".avi" if fmt == "avi" else base
+
+
+class FrameRing:
+    """
+    Recent frames of one camera as (timestamp, JPEG bytes), oldest first.
+    Bounded by max_bytes of compressed data and by max_age seconds.
+    """
+
+    def __init__(self, max_bytes, max_age):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.nbytes = 0
+        self._frames = deque()
+        self._lock = threading.Lock()
+
+    def append(self, ts, jpeg):
+        with self._lock:
+            self._frames.append((ts, jpeg))
+            self.nbytes += len(jpeg)
+            while self._frames and (self.nbytes > self.max_bytes or
+                                    ts - self._frames[0][0] > self.max_age):
+                self.nbytes -= len(self._frames.popleft()[1])
+
+    def since(self, start):
+        """Frames with timestamp >= start."""
+        with self._lock:
+            return [f for f in self._frames if f[0] >= start]
+
+    def __len__(self):
+        return len(self._frames)
+
+
+class _PendingClip:
+    __slots__ = ("path", "start", "end", "deadline", "frames")
+
+    def __init__(self, path, start, end, deadline, frames):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.deadline = deadline    # wall time to give up waiting for post frames
+        self.frames = frames
+
+
+class ClipRecorder(threading.Thread):
+    """
+    Keeps a camera's last few seconds as JPEGs and cuts alert clips.
+
+    offer() is called by the capture thread with every frame and only hands
+    every 1/fps-th one to this thread, without blocking: encoding happens
+    here, and when it falls behind the older offered frame is replaced.
+    Recognition draws boxes on the captured frame in place, so the frames
+    kept are copies (downscaled to width, when that applies).
+    trigger() collects the frames from pre seconds before the alert to post
+    seconds after it; the finished clip goes to the shared clip writer.
+    """
+
+    def __init__(self, camera=None, fps=CLIP_FPS, pre=CLIP_PRE_SECONDS,
+                 post=CLIP_POST_SECONDS, width=CLIP_WIDTH, quality=CLIP_QUALITY,
+                 buffer_mb=CLIP_BUFFER_MB):
+        self.label = camera or "camera"
+        super().__init__(name=f"clip-recorder:{self.label}", daemon=True)
+        self.camera = camera
+        self.fps = fps
+        self.pre = pre
+        self.post = post
+        self.width = width
+        self.quality = quality
+        # Old enough frames for an alert that reached us after a slow analysis
+        self.ring = FrameRing(int(buffer_mb * 1024 * 1024), pre + post)
+        self.encoded = 0
+        self.dropped = 0
+        self.clips = 0
+        self._next_at = 0.0
+        self._offered = None
+        self._cond = threading.Condition()
+        self._pending = []
+        self._stop_event = threading.Event()
+        _rings[self.label] = self.ring
+
+    def offer(self, frame, ts):
+        """Capture thread: buffer this frame if one is due; never blocks."""
+        if ts < self._next_at:
+            return
+        interval = 1.0 / self.fps
+        # Keep to the schedule, but do not catch up after a gap in the stream
+        self._next_at = ts + interval if ts - self._next_at > interval else self._next_at + interval
+        frame = self._shrink(frame)
+        with self._cond:
+            if self._offered is not None:
+                self.dropped += 1
+            self._offered = (ts, frame)
+            self._cond.notify()
+
+    def trigger(self, snapshot_path, ts):
+        """Queue a clip around ts; returns its path, or None if too many are pending."""
+        path = clip_path(snapshot_path, get_clip_writer().fmt)
+        with self._cond:
+            if len(self._pending) >= CLIP_MAX_PENDING:
+                _CLIPS.labels("rejected").inc()
+                print(f"[WARNING] Clip skipped for {path}: {CLIP_MAX_PENDING} already pending.")
+                return None
+            frames = [f for f in self.ring.since(ts - self.pre) if f[0] <= ts + self.post]
+            self._pending.append(_PendingClip(
+                path, ts - self.pre, ts + self.post,
+                time.time() + self.post + 5.0, frames
+            ))
+            self._cond.notify()
+        return path
+
+    def _shrink(self, frame):
+        """A private copy of frame, no wider than width."""
+        h, w = frame.shape[:2]
+        if self.width and w > self.width:
+            return cv2.resize(frame, (self.width, max(1, round(h * self.width / w))),
+                              interpolation=cv2.INTER_AREA)
+        return frame.copy()
+
+    def _encode(self, frame):
+        ok, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        return buf.tobytes() if ok else None
+
+    def run(self):
+        while not self._stop_event.is_set():
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._offered is not None or self._stop_event.is_set(),
+                    timeout=1.0
+                )
+                item, self._offered = self._offered, None
+            if item is not None:
+                ts, frame = item
+                jpeg = self._encode(frame)
+                if jpeg is not None:
+                    self.ring.append(ts, jpeg)
+                    self.encoded += 1
+                    with self._cond:
+                        for clip in self._pending:
+                            if clip.start <= ts <= clip.end and (
+                                    not clip.frames or ts > clip.frames[-1][0]):
+                                clip.frames.append((ts, jpeg))
+            self._finish(item[0] if item is not None else None)
+        self._finish(None, flush=True)
+
+    def _finish(self, latest_ts, flush=False):
+        """Hand clips whose post window is covered (or timed out) to the writer."""
+        now = time.time()
+        with self._cond:
+            done = [c for c in self._pending
+                    if flush or now >= c.deadline
+                    or (latest_ts is not None and latest_ts >= c.end)]
+            self._pending = [c for c in self._pending if c not in done]
+        for clip in done:
+            self.clips += 1
+            get_clip_writer().submit(clip.path, clip.frames, self.fps)
+
+    def stop(self, timeout=5):
+        """Stop buffering; clips still collecting are written with what they have."""
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify()
+        self.join(timeout)
+
+    def snapshot(self):
+        return {
+            "frames":   len(self.ring),
+            "ring_kb":  round(self.ring.nbytes / 1024, 1),
+            "encoded":  self.encoded,
+            "dropped":  self.dropped,
+            "clips":    self.clips,
+        }
+
+
+def _write_sequence(path, frames):
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    t0 = frames[0][0]
+    for i, (ts, jpeg) in enumerate(frames):
+        # Names sort in time order and carry the offset from the first frame
+        with open(os.path.join(tmp, f"{i:04d}_{int((ts - t0) * 1000):06d}ms.jpg"), "wb") as f:
+            f.write(jpeg)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+
+def _write_avi(path, frames, fps):
+    tmp = path + ".tmp.avi"
+    writer = None
+    try:
+        for _, jpeg in frames:
+            img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                continue
+            if writer is None:
+                h, w = img.shape[:2]
+                writer = cv2.VideoWriter(tmp, cv2.VideoWriter_fourcc(*"MJPG"), fps, (w, h))
+            writer.write(img)
+    finally:
+        if writer is not None:
+            writer.release()
+    os.replace(tmp, path)
+
+
+class ClipWriter(threading.Thread):
+    """Writes finished clips to disk off the recorder threads."""
+
+    def __init__(self, fmt=CLIP_FORMAT):
+        super().__init__(name="clip-writer", daemon=True)
+        self.fmt = fmt
+        self.written = 0
+        self.errors = 0
+        self._queue = queue.Queue()
+
+    def submit(self, path, frames, fps):
+        self._queue.put((path, frames, fps))
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, frames, fps = item
+            if not frames:
+                _CLIPS.labels("empty").inc()
+                continue
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.fmt == "avi":
+                    _write_avi(path, frames, fps)
+                else:
+                    _write_sequence(path, frames)
+                self.written += 1
+                _CLIPS.labels("written").inc()
+            except (OSError, cv2.error) as e:
+                self.errors += 1
+                _CLIPS.labels("failed").inc()
+                print(f"[ERROR] Could not write clip {path}: {e}")
+
+    def close(self, timeout=10):
+        self._queue.put(None)
+        self.join(timeout)
+
+
+_recorders = {}
+_writer = None
+_lock = threading.Lock()
+
+
+def get_clip_writer():
+    global _writer
+    with _lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = ClipWriter()
+            _writer.start()
+        return _writer
+
+
+def get_clip_recorder(camera=None):
+    """The shared ClipRecorder for camera, started on first use; None when CLIP_FPS=0."""
+    if CLIP_FPS <= 0:
+        return None
+    with _lock:
+        recorder = _recorders.get(camera)
+        if recorder is None or not recorder.is_alive():
+            recorder = _recorders[camera] = ClipRecorder(camera)
+            recorder.start()
+        return recorder
+
+
+def request_clip(camera, snapshot_path, ts):
+    """Cut a clip around ts for camera's alert; returns its path or None."""
+    with _lock:
+        recorder = _recorders.get(camera)
+    if recorder is None:
+        return None
+    return recorder.trigger(snapshot_path, ts)
+
+
+def close_clip_recorders(timeout=10):
+    """Finish pending clips and stop the recorders and writer; called on shutdown."""
+    global _writer
+    with _lock:
+        recorders = list(_recorders.values())
+        _recorders.clear()
+    for recorder in recorders:
+        recorder.stop()
+    with _lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close(timeout)
+
+
+atexit.register(close_clip_recorders)
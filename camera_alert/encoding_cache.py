@@ -0,0 +1,163 @@
+# camera_alert/encoding_cache.py
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+import face_recognition
+
+KNOWN_FACES_DIR = "camera_alert/known_faces"
+IMAGE_EXTS      = ('.png', '.jpg', '.jpeg')
+CACHE_VERSION   = 1
+
+# Cache lives next to the images unless overridden
+CACHE_DIR = os.getenv("ENCODING_CACHE_DIR")
+
+
+def _cache_paths(directory, cache_dir=None):
+    cache_dir = cache_dir or CACHE_DIR or os.path.join(directory, ".cache")
+    return (
+        cache_dir,
+        os.path.join(cache_dir, "index.json"),
+        os.path.join(cache_dir, "encodings.npy"),
+    )
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def list_images(directory):
+    """Sorted image filenames in directory."""
+    return sorted(
+        f for f in os.listdir(directory)
+        if f.lower().endswith(IMAGE_EXTS)
+    )
+
+
+def encode_image(path):
+    """First face encoding in the image, or None if no face was found."""
+    image = face_recognition.load_image_file(path)
+    encs = face_recognition.face_encodings(image)
+    return encs[0] if encs else None
+
+
+def _read_cache(index_path, npy_path):
+    """Returns (entries, matrix) or ({}, None) if missing or inconsistent."""
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        matrix = np.load(npy_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return {}, None
+    if index.get("version") != CACHE_VERSION or index.get("rows") != len(matrix):
+        return {}, None
+    return index.get("entries", {}), matrix
+
+
+def _write_cache(cache_dir, index_path, npy_path, entries, rows):
+    os.makedirs(cache_dir, exist_ok=True)
+    matrix = np.asarray(rows, dtype=np.float64).reshape(-1, 128)
+
+    # Write both files under temp names, then swap them in
+    tmp_npy = npy_path + ".tmp.npy"
+    tmp_idx = index_path + ".tmp"
+    np.save(tmp_npy, matrix)
+    with open(tmp_idx, "w", encoding="utf-8") as f:
+        json.dump(
+            {"version": CACHE_VERSION, "rows": len(matrix), "entries": entries},
+            f, indent=1
+        )
+    os.replace(tmp_npy, npy_path)
+    os.replace(tmp_idx, index_path)
+
+
+def sync_cache(directory=KNOWN_FACES_DIR, cache_dir=None, rebuild=False):
+    """
+    Bring the on-disk cache in line with directory.
+
+    A file is reused when its size and mtime are unchanged, or when its
+    content hash still matches; otherwise it is re-encoded. Entries for
+    deleted files are dropped. Returns (encodings, names, stats).
+    """
+    cache_dir, index_path, npy_path = _cache_paths(directory, cache_dir)
+    old_entries, old_matrix = ({}, None) if rebuild else _read_cache(index_path, npy_path)
+
+    entries, rows, names = {}, [], []
+    stats = {"reused": 0, "encoded": 0, "no_face": 0, "removed": 0}
+    dirty = rebuild
+
+    for filename in list_images(directory):
+        path = os.path.join(directory, filename)
+        st = os.stat(path)
+        old = old_entries.get(filename)
+        enc = None
+        sha = None
+
+        if old and old["size"] == st.st_size and old["mtime"] == st.st_mtime:
+            sha = old["sha256"]
+        elif old:
+            sha = _file_sha256(path)
+            if sha != old["sha256"]:
+                old = None
+            dirty = True    # mtime changed or content changed
+
+        if old:
+            stats["reused"] += 1
+            if old["row"] is not None:
+                enc = np.array(old_matrix[old["row"]])
+        else:
+            sha = sha or _file_sha256(path)
+            enc = encode_image(path)
+            stats["encoded"] += 1
+            dirty = True
+
+        entry = {"sha256": sha, "size": st.st_size, "mtime": st.st_mtime, "row": None}
+        if enc is None:
+            stats["no_face"] += 1
+        else:
+            entry["row"] = len(rows)
+            rows.append(np.asarray(enc))
+            names.append(os.path.splitext(filename)[0])
+        entries[filename] = entry
+
+    stats["removed"] = len(set(old_entries) - set(entries))
+    if stats["removed"]:
+        dirty = True
+
+    # Release the memory map before the file is replaced (required on Windows)
+    old_matrix = None
+
+    if dirty:
+        _write_cache(cache_dir, index_path, npy_path, entries, rows)
+
+    return rows, names, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build or refresh the known-face encoding cache"
+    )
+    parser.add_argument("--dir", default=KNOWN_FACES_DIR,
+                        help="known faces directory")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="discard the cache and re-encode every image")
+    args = parser.parse_args(argv)
+
+    t0 = time.time()
+    encs, _, stats = sync_cache(args.dir, rebuild=args.rebuild)
+    print(
+        f"[INFO] Encoding cache: {len(encs)} faces, {stats['encoded']} encoded, "
+        f"{stats['reused']} reused, {stats['no_face']} without a face, "
+        f"{stats['removed']} removed in {time.time() - t0:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# camera_alert/exporter.py
+
+import os
+import csv
+import gzip
+import io
+import tempfile
+
+from camera_alert.queries import day_range, iter_rows
+
+# ── Export settings ───────────────────────────────────────────────────────────
+EXPORT_SPOOL_MB    = float(os.getenv("EXPORT_SPOOL_MB", "8"))       # in RAM before spilling to disk
+EXPORT_BATCH_SIZE  = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))    # rows per read / Parquet row group
+
+ATTENDANCE_COLUMNS = ["Employee", "Date", "FirstSeen", "LastSeen"]
+
+# format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    "xlsx":    ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "csv.gz":  ("application/gzip", "csv.gz"),
+}
+
+
+class ExportError(Exception):
+    """The requested export format cannot be produced here."""
+
+
+def attendance_rows(start=None, end=None, db_path="alerts.db", batch=EXPORT_BATCH_SIZE):
+    """Attendance rows oldest first, as tuples in ATTENDANCE_COLUMNS order."""
+    clauses, params = "", []
+    if start and end:
+        clauses = " WHERE date >= ? AND date < ?"
+        params = list(day_range(start, end))
+    sql = f"""
+        SELECT employee_name, date, first_seen, last_seen
+          FROM employee_log{clauses}
+         ORDER BY date, employee_name
+    """
+    return (tuple(r) for r in iter_rows(sql, params, db_path=db_path, batch=batch))
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_xlsx(rows, out, sheet_name="Attendance"):
+    """constant_memory keeps only the current row in memory."""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(out, {"constant_memory": True})
+    sheet = workbook.add_worksheet(sheet_name)
+    bold = workbook.add_format({"bold": True})
+    sheet.set_column(0, 0, 24)
+    sheet.set_column(1, 3, 12)
+    sheet.write_row(0, 0, ATTENDANCE_COLUMNS, bold)
+    for i, row in enumerate(rows, start=1):
+        sheet.write_row(i, 0, row)
+    workbook.close()
+
+
+def write_parquet(rows, out, batch=EXPORT_BATCH_SIZE):
+    """
+    One row group per batch, so memory stays at one batch of rows.
+    An empty selection still produces a valid file with the schema.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([(name, pa.string()) for name in ATTENDANCE_COLUMNS])
+    with pq.ParquetWriter(out, schema, compression="snappy") as writer:
+        for chunk in _batches(rows, batch):
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, pa.string()) for col in columns], schema=schema
+            ))
+
+
+def write_csv_gz(rows, out):
+    with gzip.GzipFile(fileobj=out, mode="wb") as gz:
+        text = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow(ATTENDANCE_COLUMNS)
+        writer.writerows(rows)
+        text.flush()
+        text.detach()
+
+
+_WRITERS = {
+    "xlsx":    write_xlsx,
+    "parquet": write_parquet,
+    "csv.gz":  write_csv_gz,
+}
+
+
+def export_attendance(fmt="xlsx", start=None, end=None, db_path="alerts.db",
+                      spool_mb=EXPORT_SPOOL_MB):
+    """
+    Write the attendance selection in `fmt` to a spooled temporary file,
+    reading employee_log in batches. Returns the file rewound to the start;
+    the caller closes it. Raises ExportError for unknown or unavailable
+    formats and ValueError for malformed dates.
+    """
+    if fmt not in _WRITERS:
+        raise ExportError(f"unknown export format {fmt!r}; use one of {', '.join(_WRITERS)}")
+    rows = attendance_rows(start, end, db_path)
+    out = tempfile.SpooledTemporaryFile(max_size=int(spool_mb * 1024 * 1024))
+    try:
+        _WRITERS[fmt](rows, out)
+    except BaseException:
+        out.close()
+        raise
+    finally:
+        rows.close()
+    out.seek(0)
+    return out
@@ -5,17 +5,63 @@ import hashlib
 import numpy as np
 import cv2
 import face_recognition
-from datetime import datetime, date
-import sqlite3
-from camera_alert.logger import update_employee_log
+from camera_alert import metrics
+from camera_alert.attendance import tracker as attendance
+from camera_alert.encoding_cache import sync_cache
+from camera_alert.matcher import GalleryMatcher
 # Configurable matching tolerance (distance threshold)
 TOLERANCE = float(os.getenv("FACE_TOLERANCE", "0.6"))
+# Set ENCODING_CACHE=0 to always re-encode every image on start
+USE_ENCODING_CACHE = os.getenv("ENCODING_CACHE", "1") != "0"
+# Face detector: "hog" (CPU) or "cnn" (dlib CNN, practical only with CUDA)
+DETECTION_MODEL    = os.getenv("DETECTION_MODEL", "hog")
+DETECTION_UPSAMPLE = int(os.getenv("DETECTION_UPSAMPLE", "1"))
+# Quality gate before encoding; 0 disables a check
+FACE_MIN_SIZE      = int(os.getenv("FACE_MIN_SIZE", "64"))           # px in the full frame
+FACE_MIN_SHARPNESS = float(os.getenv("FACE_MIN_SHARPNESS", "15"))    # Laplacian variance at 64x64
+FACE_MAX_YAW       = float(os.getenv("FACE_MAX_YAW", "0.5"))         # nose offset / eye distance
 
-def load_known_faces(directory: str):
+_RECOGNITION_SECONDS = metrics.histogram(
+    "camera_alert_recognition_seconds", "Face detection, encoding and matching time per frame",
+    ["step"]
+)
+_DETECT_SECONDS = _RECOGNITION_SECONDS.labels("detect")
+_ENCODE_SECONDS = _RECOGNITION_SECONDS.labels("encode")   # includes matching in the pool
+_MATCH_SECONDS  = _RECOGNITION_SECONDS.labels("match")
+_FACES_PER_FRAME = metrics.histogram(
+    "camera_alert_faces_per_frame", "Faces detected per analysed frame",
+    buckets=metrics.COUNT_BUCKETS
+)
+_FACES = metrics.counter(
+    "camera_alert_faces_total", "Detected faces by whether they were encoded or reused from a track",
+    ["encoding"]
+)
+_FACES_ENCODED = _FACES.labels("encoded")
+_FACES_REUSED  = _FACES.labels("reused")
+_REJECTED = metrics.counter(
+    "camera_alert_faces_rejected_total", "Detected faces not encoded, by failed quality check",
+    ["reason"]
+)
+
+# reason -> faces skipped by the quality gate since start
+quality_rejections = {"size": 0, "blur": 0, "pose": 0}
+
+def load_known_faces(directory: str, use_cache: bool = USE_ENCODING_CACHE):
     """
     Load and encode known faces from the specified directory.
     Returns two lists: encodings and corresponding names.
+
+    With the encoding cache enabled only new or changed images are encoded;
+    see camera_alert.encoding_cache.
     """
+    if use_cache:
+        known_encs, known_names, stats = sync_cache(directory)
+        print(
+            f"[INFO] Loaded {len(known_encs)} known faces "
+            f"({stats['encoded']} encoded, {stats['reused']} from cache)"
+        )
+        return known_encs, known_names
+
     known_encs = []
     known_names = []
     for filename in os.listdir(directory):
@@ -28,33 +74,199 @@ def load_known_faces(directory: str):
                 known_names.append(os.path.splitext(filename)[0])
     return known_encs, known_names
 
-def recognize_faces(frame: np.ndarray, known_encodings, known_names):
+def sharpness(rgb, loc, size=64):
+    """
+    Variance of the Laplacian of a face crop resized to size x size; low
+    values mean motion blur or defocus.
+    """
+    top, right, bottom, left = loc
+    crop = rgb[max(top, 0):bottom, max(left, 0):right]
+    if crop.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+    gray = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+def yaw_ratio(landmarks):
+    """
+    Head turn from 5-point landmarks: how far the nose tip sits from the
+    midpoint between the eyes, along the eye line, in eye distances. About
+    0 for a frontal face, rising towards profile.
+    """
+    left  = np.mean(landmarks["left_eye"], axis=0)
+    right = np.mean(landmarks["right_eye"], axis=0)
+    nose  = np.mean(landmarks["nose_tip"], axis=0)
+    axis  = right - left
+    dist2 = float(axis @ axis)
+    if dist2 == 0:
+        return float("inf")
+    return abs(float((nose - (left + right) / 2) @ axis)) / dist2
+
+
+def face_quality(rgb, locations, min_size=FACE_MIN_SIZE,
+                 min_sharpness=FACE_MIN_SHARPNESS, max_yaw=FACE_MAX_YAW, scale=1.0):
+    """
+    For each (top, right, bottom, left) location, None if the face is worth
+    encoding, else why not: "size", "blur" or "pose". Checks run cheapest
+    first, and landmarks are only computed for faces that passed the others.
+
+    scale is the size of rgb relative to the full frame (DETECTION_SCALE),
+    so that min_size is in full-frame pixels whatever the detection scale.
+    """
+    reasons = [None] * len(locations)
+    pose_todo = []
+    for i, loc in enumerate(locations):
+        top, right, bottom, left = loc
+        if min_size and min(bottom - top, right - left) / scale < min_size:
+            reasons[i] = "size"
+        elif min_sharpness and sharpness(rgb, loc) < min_sharpness:
+            reasons[i] = "blur"
+        else:
+            pose_todo.append(i)
+
+    if max_yaw and pose_todo:
+        marks = face_recognition.face_landmarks(
+            rgb, [locations[i] for i in pose_todo], model="small"
+        )
+        for i, landmarks in zip(pose_todo, marks):
+            if yaw_ratio(landmarks) > max_yaw:
+                reasons[i] = "pose"
+
+    for reason in reasons:
+        if reason:
+            quality_rejections[reason] += 1
+            _REJECTED.labels(reason).inc()
+    return reasons
+
+
+def recognize_faces(frame: np.ndarray, known_encodings, known_names=None,
+                    regions=None, tracker=None, pool=None,
+                    upsample=DETECTION_UPSAMPLE, model=DETECTION_MODEL,
+                    rgb=None, canvas=None, canvas_scale=1.0, quality=True, seq=None,
+                    scale=1.0):
     """
     Detects faces and returns:
       - enc_list: list of face encoding arrays
       - face_ids: list of strings (known name or Unknown_<hash>)
       - annotated_frame: BGR image with drawn boxes and labels
+      - fresh: list of bools, True where the encoding was computed for this
+        frame rather than reused from a track
+
+    known_encodings may be a GalleryMatcher (preferred, built once) or a
+    list of encodings with matching known_names.
+
+    regions, if given, is a list of (top, right, bottom, left) boxes; faces
+    are searched only inside them (e.g. MotionResult.regions()).
+
+    tracker, if given, is a FaceTracker for this camera: faces on an
+    established track reuse its encoding and identity instead of being
+    encoded and matched again. seq, the frame's capture sequence number,
+    keeps frames that finish out of order from moving the tracks back.
+
+    pool, if given, is a RecognitionPool: detection, encoding and gallery
+    matching run in its worker processes against their copy of the gallery.
+
+    upsample and model are passed to face_recognition.face_locations.
+
+    quality, if true, drops faces that fail face_quality() before encoding;
+    they are left out of the results and outlined in grey on the canvas.
+
+    scale is the size of frame relative to the full camera frame (the
+    detection downscale), so that face sizes are judged, and tracks kept,
+    in full-frame pixels whatever detection scale is in use.
+
+    rgb, if given, is frame already converted to RGB (FrameContext.rgb()).
+    canvas, if given, is drawn on in place instead of a copy of frame, with
+    box coordinates multiplied by canvas_scale; pass the full-size frame and
+    1/scale to annotate it without resizing a downscaled copy back up.
     """
-    rgb       = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    locations = face_recognition.face_locations(rgb)
-    enc_list  = face_recognition.face_encodings(rgb, locations)
+    if isinstance(known_encodings, GalleryMatcher):
+        gallery = known_encodings
+    else:
+        gallery = GalleryMatcher(known_encodings, known_names or [])
 
-    annotated = frame.copy()
+    if rgb is None:
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    handle    = pool.frame(rgb) if pool is not None else None
+    try:
+        with _DETECT_SECONDS.time():
+            if handle is not None:
+                locations = handle.detect(regions, upsample, model)
+            elif regions is None:
+                locations = face_recognition.face_locations(rgb, upsample, model)
+            else:
+                locations = []
+                for top, right, bottom, left in regions:
+                    crop = rgb[top:bottom, left:right]
+                    for t, r, b, l in face_recognition.face_locations(crop, upsample, model):
+                        locations.append((t + top, r + left, b + top, l + left))
+        _FACES_PER_FRAME.observe(len(locations))
+
+        # Only new, moved or expired tracks need a fresh encoding
+        tracked = None
+        if tracker is not None:
+            # Full-frame boxes, so tracks survive a change of detection scale
+            tracked = tracker.update(
+                [tuple(int(round(v / scale)) for v in loc) for loc in locations], seq=seq
+            )
+        if tracked is not None:
+            todo = [i for i, (_, needs) in enumerate(tracked) if needs]
+        else:
+            todo = list(range(len(locations)))
+
+        # Tiny, blurred and turned faces rarely match; don't pay to encode them
+        rejected = set()
+        if quality and todo:
+            reasons = face_quality(rgb, [locations[i] for i in todo], scale=scale)
+            rejected = {i for i, reason in zip(todo, reasons) if reason}
+            todo = [i for i in todo if i not in rejected]
+
+        _FACES_ENCODED.inc(len(todo))
+        _FACES_REUSED.inc(len(locations) - len(todo) - len(rejected))
+        if handle is not None:
+            with _ENCODE_SECONDS.time():
+                fresh, fresh_matches = handle.encode([locations[i] for i in todo])
+        else:
+            with _ENCODE_SECONDS.time():
+                fresh = face_recognition.face_encodings(rgb, [locations[i] for i in todo])
+            # match every new face in the frame against the gallery at once
+            with _MATCH_SECONDS.time():
+                fresh_matches, _ = gallery.best(fresh, TOLERANCE)
+    finally:
+        if handle is not None:
+            handle.release()
+
+    enc_list = [None] * len(locations)
+    matches  = [None] * len(locations)
+    is_fresh = [False] * len(locations)
+    for i, enc, match in zip(todo, fresh, fresh_matches):
+        enc_list[i], matches[i], is_fresh[i] = enc, match, True
+        if tracked is not None:
+            tracker.identify(tracked[i][0], enc, match, gallery=gallery)
+    if tracked is not None:
+        for i, (track, needs) in enumerate(tracked):
+            if not needs:
+                enc_list[i], matches[i] = track.encoding, track.name
+
+    annotated = canvas if canvas is not None else frame.copy()
     face_ids  = []
+    thickness = max(1, int(round(2 * canvas_scale)))
 
-    for loc, enc in zip(locations, enc_list):
-        # match against known encodings
-        if known_encodings:
-            dists    = face_recognition.face_distance(known_encodings, enc)
-            best_idx = int(np.argmin(dists))
-            if dists[best_idx] < TOLERANCE:
-                fid = known_names[best_idx]
-                from camera_alert.logger import update_employee_log
-                update_employee_log(fid)
+    for i in rejected:
+        top, right, bottom, left = (int(v * canvas_scale) for v in locations[i])
+        cv2.rectangle(annotated, (left, top), (right, bottom), (128, 128, 128), 1)
+    if rejected:
+        keep = [i for i in range(len(locations)) if i not in rejected]
+        locations = [locations[i] for i in keep]
+        enc_list  = [enc_list[i] for i in keep]
+        matches   = [matches[i] for i in keep]
+        is_fresh  = [is_fresh[i] for i in keep]
 
-            else:
-                h = hashlib.sha256(enc.tobytes()).hexdigest()[:8]
-                fid = f"Unknown_{h}"
+    for loc, enc, match in zip(locations, enc_list, matches):
+        if match is not None:
+            fid = match
+            attendance.seen(fid)
         else:
             h = hashlib.sha256(enc.tobytes()).hexdigest()[:8]
             fid = f"Unknown_{h}"
@@ -62,11 +274,11 @@ def recognize_faces(frame: np.ndarray, known_encodings, known_names):
         face_ids.append(fid)
 
         # draw box & label
-        top, right, bottom, left = loc
-        cv2.rectangle(annotated, (left, top), (right, bottom), (0, 0, 255), 2)
+        top, right, bottom, left = (int(v * canvas_scale) for v in loc)
+        cv2.rectangle(annotated, (left, top), (right, bottom), (0, 0, 255), thickness)
         cv2.putText(
-            annotated, fid, (left, top - 10),
-            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2
+            annotated, fid, (left, top - int(10 * canvas_scale)),
+            cv2.FONT_HERSHEY_SIMPLEX, 0.5 * canvas_scale, (0, 0, 255), thickness
         )
 
-    return enc_list, face_ids, annotated
\ No newline at end of file
+    return enc_list, face_ids, annotated, is_fresh
@@ -0,0 +1,129 @@
+# camera_alert/frame_context.py
+
+import os
+import threading
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+# ── Frame preprocessing settings ──────────────────────────────────────────────
+BLACK_FRAME_LEVEL = float(os.getenv("BLACK_FRAME_LEVEL", "1"))   # mean intensity below = black
+BLACK_FRAME_STEP  = int(os.getenv("BLACK_FRAME_STEP", "16"))     # sample every Nth row/column
+BUFFER_POOL_SIZE  = int(os.getenv("FRAME_BUFFER_POOL", "8"))     # spare buffers kept per shape
+
+
+def is_black(frame, level=BLACK_FRAME_LEVEL, step=BLACK_FRAME_STEP):
+    """
+    True for a blank frame from a stalled decoder. Looks at every step-th
+    pixel in both directions (1/256 of the frame by default) instead of
+    summing the whole image.
+    """
+    return float(frame[::step, ::step].mean()) < level
+
+
+class BufferPool:
+    """
+    Reusable uint8 arrays keyed by shape, so per-frame views do not allocate
+    a new image for every frame. Buffers taken and never returned are simply
+    garbage collected.
+    """
+
+    def __init__(self, keep=BUFFER_POOL_SIZE):
+        self.keep = keep
+        self._free = defaultdict(list)
+        self._lock = threading.Lock()
+        self.allocated = 0
+
+    def take(self, shape):
+        with self._lock:
+            free = self._free.get(shape)
+            if free:
+                return free.pop()
+            self.allocated += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def give(self, buf):
+        with self._lock:
+            free = self._free[buf.shape]
+            if len(free) < self.keep:
+                free.append(buf)
+
+
+_pool = BufferPool()
+
+
+class FrameContext:
+    """
+    One captured BGR frame plus the derived views the pipeline needs, each
+    computed at most once: grayscale at the motion size, the downscaled
+    frame for detection and its RGB conversion.
+
+    Views are written into pooled buffers and stay valid until release(),
+    which hands the buffers to the next frame; copy anything that must
+    outlive the frame. The full frame itself is never pooled.
+    """
+
+    __slots__ = ("frame", "_views", "_buffers")
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._views = {}
+        self._buffers = []
+
+    @property
+    def shape(self):
+        return self.frame.shape
+
+    def _buffer(self, shape):
+        buf = _pool.take(shape)
+        self._buffers.append(buf)
+        return buf
+
+    def _size(self, scale):
+        h, w = self.frame.shape[:2]
+        return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
+    def small(self, scale):
+        """BGR frame resized by scale (as cv2.resize with fx=fy=scale)."""
+        if scale == 1.0:
+            return self.frame
+        key = ("bgr", scale)
+        view = self._views.get(key)
+        if view is None:
+            w, h = self._size(scale)
+            view = cv2.resize(self.frame, (w, h), dst=self._buffer((h, w, 3)))
+            self._views[key] = view
+        return view
+
+    def rgb(self, scale=1.0):
+        """RGB version of small(scale), for face_recognition."""
+        key = ("rgb", scale)
+        view = self._views.get(key)
+        if view is None:
+            bgr = self.small(scale)
+            view = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=self._buffer(bgr.shape))
+            self._views[key] = view
+        return view
+
+    def gray(self, size):
+        """Grayscale frame resized to size=(width, height) with area averaging."""
+        key = ("gray", size)
+        view = self._views.get(key)
+        if view is None:
+            w, h = size
+            if (w, h) == self.frame.shape[1::-1]:
+                small = self.frame
+            else:
+                small = cv2.resize(self.frame, size, dst=self._buffer((h, w, 3)),
+                                   interpolation=cv2.INTER_AREA)
+            view = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self._buffer((h, w)))
+            self._views[key] = view
+        return view
+
+    def release(self):
+        """Return the view buffers to the pool; the views must not be used afterwards."""
+        buffers, self._buffers = self._buffers, []
+        self._views.clear()
+        for buf in buffers:
+            _pool.give(buf)
@@ -0,0 +1,87 @@
+# camera_alert/gallery_watcher.py
+
+import os
+import time
+import threading
+
+from camera_alert.encoding_cache import list_images, sync_cache
+from camera_alert.matcher import GalleryMatcher
+
+GALLERY_POLL_INTERVAL = float(os.getenv("GALLERY_POLL_INTERVAL", "5"))  # seconds, 0 = off
+
+
+def directory_signature(directory):
+    """{filename: (size, mtime)} for every image in directory."""
+    sig = {}
+    for filename in list_images(directory):
+        try:
+            st = os.stat(os.path.join(directory, filename))
+        except FileNotFoundError:
+            continue    # deleted between listdir and stat
+        sig[filename] = (st.st_size, st.st_mtime)
+    return sig
+
+
+class GalleryWatcher(threading.Thread):
+    """
+    Polls the known-faces directory and, when it changes, re-encodes only
+    the new or modified images (via the encoding cache) on this background
+    thread, then hands a fresh GalleryMatcher to on_reload.
+
+    A change is applied only once the directory looks the same on two
+    consecutive polls, so half-copied files are not encoded.
+    """
+
+    def __init__(self, directory, on_reload, interval=GALLERY_POLL_INTERVAL):
+        super().__init__(name="gallery-watcher", daemon=True)
+        self.directory = directory
+        self.on_reload = on_reload
+        self.interval = interval
+        self.reloads = 0
+        self._stop_event = threading.Event()
+        self._current = directory_signature(directory)
+
+    def run(self):
+        pending = None
+        while not self._stop_event.wait(self.interval):
+            try:
+                sig = directory_signature(self.directory)
+            except OSError as e:
+                print(f"[ERROR] Cannot scan {self.directory}: {e}")
+                continue
+
+            if sig == self._current:
+                pending = None
+            elif sig != pending:
+                pending = sig       # wait one more poll for writes to settle
+            else:
+                self._reload(sig)
+                pending = None
+
+    def _reload(self, sig):
+        added   = len(set(sig) - set(self._current))
+        removed = len(set(self._current) - set(sig))
+        changed = sum(
+            1 for f in set(sig) & set(self._current) if sig[f] != self._current[f]
+        )
+
+        t0 = time.time()
+        try:
+            encs, names, stats = sync_cache(self.directory)
+            gallery = GalleryMatcher(encs, names)
+        except Exception as e:
+            print(f"[ERROR] Gallery reload failed: {e}")
+            return
+        self.on_reload(gallery)
+        self._current = sig
+        self.reloads += 1
+
+        print(
+            f"[INFO] Gallery reloaded: {len(gallery)} faces "
+            f"(+{added} -{removed} ~{changed} files, {stats['encoded']} encoded) "
+            f"in {time.time() - t0:.2f}s"
+        )
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=2)
@@ -0,0 +1,194 @@
+# camera_alert/live_feed.py
+
+import os
+import bisect
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# ── Live feed settings ────────────────────────────────────────────────────────
+LIVE_POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", "0.5"))  # s between live_feed polls
+LIVE_BUFFER_SIZE   = int(os.getenv("LIVE_BUFFER_SIZE", "1000"))     # recent events kept in memory
+LIVE_REPLAY_MAX    = int(os.getenv("LIVE_REPLAY_MAX", "5000"))      # most events replayed on resume
+LIVE_HEARTBEAT     = float(os.getenv("LIVE_HEARTBEAT", "15"))       # s between keep-alive comments
+LIVE_LINGER        = float(os.getenv("LIVE_LINGER", "30"))          # s to keep polling with no viewers
+
+
+def publish(conn, kind, payload):
+    """
+    Append a change to live_feed on an open connection, inside the caller's
+    transaction. The monitor's writes go through camera_alert.logger instead.
+    """
+    conn.execute(
+        "INSERT INTO live_feed (kind, payload) VALUES (?, ?)",
+        (kind, json.dumps(payload))
+    )
+
+
+def _sse(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+class LiveFeed:
+    """
+    Fans the live_feed change log out to server-sent-event viewers.
+
+    One thread per process polls live_feed for rows after the last id it
+    has seen and renders each into its SSE text once; viewers wait on a
+    condition and write the shared text, so hundreds of them cost one query
+    per poll. The newest LIVE_BUFFER_SIZE events stay in memory for clients
+    resuming with Last-Event-ID; older gaps are replayed from the table, and
+    a `reset` event tells the client to reload when rows were pruned.
+    """
+
+    def __init__(self, db_path="alerts.db", render=None,
+                 poll_interval=LIVE_POLL_INTERVAL, buffer_size=LIVE_BUFFER_SIZE,
+                 linger=LIVE_LINGER):
+        self.db_path = db_path
+        self.render = render or (lambda kind, payload: payload)
+        self.poll_interval = poll_interval
+        self.linger = linger
+
+        self._cond = threading.Condition()
+        self._ids = deque(maxlen=buffer_size)
+        self._texts = deque(maxlen=buffer_size)
+        self._subscribers = 0
+        self._thread = None
+        self.latest_id = 0
+        self.errors = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA query_only=1")
+        return conn
+
+    def _fetch(self, conn, after_id, limit):
+        rows = conn.execute(
+            "SELECT id, kind, payload FROM live_feed WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit)
+        ).fetchall()
+        return [(i, _sse(i, kind, self.render(kind, json.loads(p)))) for i, kind, p in rows]
+
+    # -- viewers --
+    def subscribe(self):
+        with self._cond:
+            self._subscribers += 1
+            if self._thread is None or not self._thread.is_alive():
+                # New viewers without Last-Event-ID start from the current end
+                conn = self._connect()
+                try:
+                    self.latest_id = conn.execute(
+                        "SELECT COALESCE(MAX(id), 0) FROM live_feed"
+                    ).fetchone()[0]
+                finally:
+                    conn.close()
+                self._ids.clear()
+                self._texts.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name=f"live-feed:{self.db_path}", daemon=True
+                )
+                self._thread.start()
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+
+    def since(self, last_id):
+        """
+        (events, reset) after last_id, as [(id, sse_text)]. reset is True if
+        some events are gone and the client should reload from the REST API.
+        """
+        with self._cond:
+            if last_id > self.latest_id:
+                return [], True         # id from a different database
+            if last_id == self.latest_id:
+                return [], False
+            if self._ids and last_id >= self._ids[0] - 1:
+                start = bisect.bisect_right(self._ids, last_id)
+                return [(self._ids[i], self._texts[i])
+                        for i in range(start, len(self._ids))], False
+
+        # Older than the buffer: replay from the table
+        conn = self._connect()
+        try:
+            events = self._fetch(conn, last_id, LIVE_REPLAY_MAX)
+        finally:
+            conn.close()
+        reset = bool(events) and events[0][0] != last_id + 1
+        return events, reset
+
+    def stream(self, last_id=None, heartbeat=LIVE_HEARTBEAT):
+        """Generator of SSE text for one viewer; unsubscribes when closed."""
+        self.subscribe()
+        try:
+            if last_id is None:
+                last_id = self.latest_id
+            yield "retry: 3000\n\n"
+            while True:
+                events, reset = self.since(last_id)
+                if reset:
+                    last_id = events[-1][0] if events else self.latest_id
+                    yield _sse(last_id, "reset", {})
+                    continue
+                if events:
+                    last_id = events[-1][0]
+                    yield "".join(text for _, text in events)
+                    continue
+                with self._cond:
+                    fresh = self._cond.wait_for(lambda: self.latest_id > last_id, heartbeat)
+                if not fresh:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe()
+
+    # -- poller --
+    def _run(self):
+        conn = None
+        idle_since = None
+        try:
+            while True:
+                with self._cond:
+                    if self._subscribers > 0:
+                        idle_since = None
+                    elif idle_since is None:
+                        idle_since = time.time()
+                    elif time.time() - idle_since >= self.linger:
+                        self._thread = None
+                        return
+                    after = self.latest_id
+
+                try:
+                    conn = conn or self._connect()
+                    events = self._fetch(conn, after, LIVE_REPLAY_MAX)
+                except sqlite3.Error as e:
+                    self.errors += 1
+                    print(f"[ERROR] Live feed poll failed: {e}")
+                    if conn is not None:
+                        conn.close()
+                        conn = None
+                    events = []
+
+                if events:
+                    with self._cond:
+                        for event_id, text in events:
+                            self._ids.append(event_id)
+                            self._texts.append(text)
+                        self.latest_id = events[-1][0]
+                        self._cond.notify_all()
+                else:
+                    time.sleep(self.poll_interval)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "subscribers": self._subscribers,
+                "running":     self._thread is not None,
+                "latest_id":   self.latest_id,
+                "buffered":    len(self._ids),
+                "errors":      self.errors,
+            }
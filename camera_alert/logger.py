@@ -1,12 +1,38 @@
 # camera_alert/logger.py
 
+import os
+import atexit
+import queue
 import sqlite3
+import threading
+import time
 from datetime import datetime
 
+from camera_alert import metrics
+
+# ── Writer settings ───────────────────────────────────────────────────────────
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "1.0"))  # seconds
+DB_MAX_BATCH      = int(os.getenv("DB_MAX_BATCH", "500"))
+LIVE_FEED_KEEP    = int(os.getenv("LIVE_FEED_KEEP", "10000"))    # change-feed rows kept for resume
+DB_RETRY_BASE     = float(os.getenv("DB_RETRY_BASE", "1"))       # s before retrying a failed batch
+DB_RETRY_MAX      = float(os.getenv("DB_RETRY_MAX", "30"))       # cap on the doubling retry delay
+
+_DB_BATCH_SECONDS = metrics.histogram(
+    "camera_alert_db_batch_seconds", "Time to commit one batch of queued SQLite writes"
+)
+_DB_STATEMENTS = metrics.counter(
+    "camera_alert_db_statements_total", "Queued SQLite statements by outcome", ["result"]
+)
+_DB_WRITTEN = _DB_STATEMENTS.labels("written")
+_DB_FAILED  = _DB_STATEMENTS.labels("failed")
+_DB_RETRIED = _DB_STATEMENTS.labels("retried")
+
 
 def init_db(db_path="alerts.db"):
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
+    # WAL lets the dashboard read while the monitor writes
+    cursor.execute("PRAGMA journal_mode=WAL")
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS unknown_faces (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -26,49 +52,318 @@ def init_db(db_path="alerts.db"):
         )
     """)
 
+    # One attendance row per employee per day. Older databases may hold
+    # duplicates, so merge them before the unique index is created.
+    has_index = cursor.execute("""
+        SELECT 1 FROM sqlite_master
+         WHERE type = 'index' AND name = 'idx_employee_log_name_date'
+    """).fetchone()
+    if not has_index:
+        cursor.execute("""
+            UPDATE employee_log
+               SET first_seen = (SELECT MIN(e.first_seen) FROM employee_log e
+                                  WHERE e.employee_name = employee_log.employee_name
+                                    AND e.date = employee_log.date),
+                   last_seen  = (SELECT MAX(e.last_seen) FROM employee_log e
+                                  WHERE e.employee_name = employee_log.employee_name
+                                    AND e.date = employee_log.date)
+             WHERE id IN (SELECT MIN(id) FROM employee_log
+                           GROUP BY employee_name, date HAVING COUNT(*) > 1)
+        """)
+        cursor.execute("""
+            DELETE FROM employee_log
+             WHERE id NOT IN (SELECT MIN(id) FROM employee_log
+                               GROUP BY employee_name, date)
+        """)
+        cursor.execute("""
+            CREATE UNIQUE INDEX idx_employee_log_name_date
+                ON employee_log (employee_name, date)
+        """)
+
+    # Change feed read by the dashboard's /api/live stream; ids never repeat
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS live_feed (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL
+        )
+    """)
+
+    # Date-range filters and keyset pagination in the dashboard API
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_unknown_faces_timestamp
+            ON unknown_faces (timestamp)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_employee_log_date_name
+            ON employee_log (date, employee_name)
+    """)
+
     conn.commit()
     conn.close()
 
+
+# ── Batched writer ────────────────────────────────────────────────────────────
+_INSERT_EVENT = """
+    INSERT INTO unknown_faces (name, timestamp, snapshot_path)
+    VALUES (?, ?, ?)
+"""
+
+_UPSERT_ATTENDANCE = """
+    INSERT INTO employee_log (employee_name, date, first_seen, last_seen)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (employee_name, date)
+    DO UPDATE SET last_seen = MAX(COALESCE(last_seen, ''), excluded.last_seen)
+"""
+
+# Each write above is followed by a live_feed row carrying the stored values.
+# The writer's single connection keeps last_insert_rowid() pointing at the event.
+_FEED_EVENT = """
+    INSERT INTO live_feed (kind, payload)
+    SELECT 'unknown_face', json_object('id', id, 'name', name, 'timestamp', timestamp,
+                                       'snapshot_path', snapshot_path)
+      FROM unknown_faces WHERE id = last_insert_rowid()
+"""
+
+_FEED_ATTENDANCE = """
+    INSERT INTO live_feed (kind, payload)
+    SELECT 'attendance', json_object('name', employee_name, 'date', date,
+                                     'first_seen', first_seen, 'last_seen', last_seen)
+      FROM employee_log WHERE employee_name = ? AND date = ?
+"""
+
+_PRUNE_FEED = """
+    DELETE FROM live_feed WHERE id <= (SELECT MAX(id) FROM live_feed) - ?
+"""
+
+
+# SQLITE_BUSY, SQLITE_LOCKED, SQLITE_IOERR, SQLITE_FULL: the database, not the
+# statement, is the problem, so the same writes can succeed later
+_TRANSIENT_CODES = (5, 6, 10, 13)
+
+
+def _transient(error):
+    code = getattr(error, "sqlite_errorcode", None)     # Python 3.11+
+    if code is not None:
+        return code & 0xFF in _TRANSIENT_CODES
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+class DBWriter(threading.Thread):
+    """
+    Single long-lived SQLite connection that collects inserts and upserts
+    from any thread and commits them in batches, at most every
+    flush_interval seconds or every max_batch statements.
+
+    A batch that fails because the database is busy, locked, full or
+    unreadable (e.g. "database is locked" while the dashboard writes) is
+    kept and retried, together with what arrives meanwhile, after a delay
+    doubling from retry_base to retry_max; flush() waits for it. Other
+    errors come from a statement itself, so the batch is replayed one
+    statement at a time and only those that fail are dropped.
+    """
+
+    def __init__(self, db_path="alerts.db",
+                 flush_interval=DB_FLUSH_INTERVAL, max_batch=DB_MAX_BATCH,
+                 retry_base=DB_RETRY_BASE, retry_max=DB_RETRY_MAX):
+        super().__init__(name=f"db-writer:{db_path}", daemon=True)
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self._queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._retry = []            # items of a failed batch, written first next time
+        self._retry_at = 0.0
+        self._failures = 0
+
+    # -- enqueue API (non-blocking) --
+    def enqueue(self, sql, params):
+        self._queue.put((sql, params))
+
+    def flush(self, timeout=None):
+        """Block until everything enqueued so far has been committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=10):
+        """Commit what is pending and stop the thread."""
+        if self.is_alive():
+            self.flush(timeout)
+        self._stop_event.set()
+        self.join(timeout=timeout)
+
+    # -- writer thread --
+    def run(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        next_prune = time.time()
+        try:
+            while not self._stop_event.is_set():
+                self._write_batch(conn, self._collect())
+                if time.time() >= next_prune:
+                    next_prune = time.time() + 60
+                    self._prune_feed(conn)
+        finally:
+            self._write_batch(conn, self._drain(), final=True)
+            conn.close()
+
+    def _collect(self):
+        """Wait up to flush_interval for statements, returning early on a flush."""
+        batch = []
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            if isinstance(item, threading.Event):
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _prune_feed(self, conn):
+        try:
+            with conn:
+                conn.execute(_PRUNE_FEED, (LIVE_FEED_KEEP,))
+        except sqlite3.Error as e:
+            print(f"[ERROR] Pruning live_feed failed: {e}")
+
+    def _write_batch(self, conn, batch, final=False):
+        batch = self._retry + batch
+        if self._retry and not final and time.time() < self._retry_at:
+            self._retry = batch     # still backing off
+            return
+        self._retry = []
+        statements = [item for item in batch if not isinstance(item, threading.Event)]
+        if statements:
+            t0 = time.perf_counter()
+            try:
+                with conn:
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+                self.written += len(statements)
+                self.batches += 1
+                self._failures = 0
+                _DB_WRITTEN.inc(len(statements))
+            except sqlite3.Error as e:
+                self.errors += 1
+                if not _transient(e):
+                    print(f"[ERROR] DB batch of {len(statements)} failed: {e}; "
+                          f"writing statements one by one.")
+                    self._write_each(conn, statements)
+                elif not final:
+                    self._failures += 1
+                    delay = min(self.retry_max, self.retry_base * 2 ** (self._failures - 1))
+                    self._retry_at = time.time() + delay
+                    self._retry = batch
+                    _DB_RETRIED.inc(len(statements))
+                    print(f"[ERROR] DB batch of {len(statements)} failed: {e}; "
+                          f"retrying in {delay:.1f}s.")
+                    return
+                else:
+                    _DB_FAILED.inc(len(statements))
+                    print(f"[ERROR] DB batch of {len(statements)} failed on shutdown: {e}")
+            _DB_BATCH_SECONDS.observe(time.perf_counter() - t0)
+        for item in batch:
+            if isinstance(item, threading.Event):
+                item.set()
+
+    def _write_each(self, conn, statements):
+        for sql, params in statements:
+            try:
+                with conn:
+                    conn.execute(sql, params)
+                self.written += 1
+                _DB_WRITTEN.inc()
+            except sqlite3.Error as e:
+                _DB_FAILED.inc()
+                print(f"[ERROR] Dropped one queued DB statement: {e}")
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_path="alerts.db"):
+    """The shared DBWriter for db_path, started on first use."""
+    with _writers_lock:
+        writer = _writers.get(db_path)
+        if writer is None or not writer.is_alive():
+            writer = _writers[db_path] = DBWriter(db_path)
+            writer.start()
+        return writer
+
+
+def flush_writes(timeout=None):
+    """Block until all queued writes have been committed."""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.flush(timeout)
+
+
+def close_writers(timeout=10):
+    """Flush and stop every writer; called on shutdown."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close(timeout)
+
+
+atexit.register(close_writers)
+
+metrics.gauge_fn(
+    "camera_alert_db_queue_depth", "Statements waiting for the background DB writer",
+    lambda: {path: w._queue.qsize() for path, w in list(_writers.items())}, ["db"]
+)
+
+
 def log_event(name, snapshot_path, db_path="alerts.db"):
     """
     Records one unknown-face event into the SQLite table,
     storing the given name, current timestamp, and path.
+    The row is queued and committed by the background writer.
     """
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO unknown_faces (name, timestamp, snapshot_path)
-        VALUES (?, ?, ?)
-    """, (name, timestamp, snapshot_path))
-    conn.commit()
-    conn.close()
+    writer = get_writer(db_path)
+    writer.enqueue(_INSERT_EVENT, (name, timestamp, snapshot_path))
+    writer.enqueue(_FEED_EVENT, ())
 
-def update_employee_log(name, db_path="alerts.db"):
-        from datetime import datetime
-        date = datetime.now().strftime("%Y-%m-%d")
-        time_now = datetime.now().strftime("%H:%M:%S")
-
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+def upsert_attendance(name, date, first_seen, last_seen, db_path="alerts.db"):
+    """
+    Queues one attendance upsert: inserts the day's row, or advances
+    last_seen if the row already exists. first_seen is never overwritten.
+    """
+    writer = get_writer(db_path)
+    writer.enqueue(_UPSERT_ATTENDANCE, (name, date, first_seen, last_seen))
+    writer.enqueue(_FEED_ATTENDANCE, (name, date))
 
-        cursor.execute("""
-            SELECT id FROM employee_log
-            WHERE employee_name = ? AND date = ?
-        """, (name, date))
-        row = cursor.fetchone()
-
-        if row:
-            cursor.execute("""
-                UPDATE employee_log
-                SET last_seen = ?
-                WHERE id = ?
-            """, (time_now, row[0]))
-        else:
-            cursor.execute("""
-                INSERT INTO employee_log (employee_name, date, first_seen, last_seen)
-                VALUES (?, ?, ?, ?)
-            """, (name, date, time_now, time_now))
-
-        conn.commit()
-        conn.close()
+def update_employee_log(name, db_path="alerts.db"):
+    """
+    Records a sighting of a known employee: creates today's row on first
+    sighting, otherwise advances last_seen. Queued, not blocking.
+    """
+    now = datetime.now()
+    date = now.strftime("%Y-%m-%d")
+    time_now = now.strftime("%H:%M:%S")
+    upsert_attendance(name, date, time_now, time_now, db_path)
@@ -3,8 +3,10 @@
 import os
 import cv2
 import time
+import argparse
+import signal
+import threading
 from dotenv import load_dotenv
-import face_recognition
 
 # Load environment variables
 load_dotenv()
@@ -13,111 +15,211 @@ load_dotenv()
 if hasattr(cv2, 'utils') and hasattr(cv2.utils, 'logging'):
     cv2.utils.logging.setLogLevel(cv2.utils.logging.LOG_LEVEL_ERROR)
 
-from camera_alert.face_recognizer import load_known_faces, recognize_faces
+from camera_alert import metrics
+from camera_alert.analysis import FaceAnalyzer, dispatch_alert
+from camera_alert.attendance import tracker as attendance
+from camera_alert.clips import close_clip_recorders, get_clip_recorder
+from camera_alert.face_recognizer import TOLERANCE, load_known_faces
+from camera_alert.gallery_watcher import GALLERY_POLL_INTERVAL, GalleryWatcher
 from camera_alert.motion_detector import MotionDetector
-from camera_alert.logger import init_db, log_event
-from camera_alert.notifier import send_alert
-from camera_alert.utils import save_snapshot
-from camera_alert.time_utils import get_timestamped_filename
+from camera_alert.logger import close_writers, init_db
+from camera_alert.notifier import close_dispatcher
+from camera_alert.pipeline import (
+    ANALYSIS_WORKERS, FRAME_QUEUE_SIZE, IO_QUEUE_SIZE, SHUTDOWN_DRAIN_TIMEOUT,
+    STATS_INTERVAL, CaptureThread, DropOldestQueue, Stage, format_stats
+)
+from camera_alert.recognition_pool import RECOGNITION_PROCESSES, RecognitionPool
+from camera_alert.scheduler import AnalysisScheduler
+from camera_alert.snapshot_store import SNAPSHOT_DIR, close_snapshot_writers
+from camera_alert.supervisor import CameraSupervisor, load_camera_definitions
+from camera_alert.utils import open_rtsp_stream
 # from camera_alert.time_utils import is_within_operating_hours
 
-def main():
-    init_db()
-    os.makedirs("snapshots", exist_ok=True)
+# ── Service settings ──────────────────────────────────────────────────────────
+HEADLESS = os.getenv("HEADLESS", "0") != "0"   # no preview window or GUI calls
 
-    rtsp_url = os.getenv("CAMERA_RTSP")
-    if not rtsp_url:
-        print("[ERROR] CAMERA_RTSP not set in .env file.")
-        return
 
-    ALERT_INTERVAL = float(os.getenv("ALERT_INTERVAL", "300"))
-    CLUSTER_THRESHOLD = float(os.getenv("CLUSTER_THRESHOLD", "0.5"))
+def run_single_camera(rtsp_url, analyzer, workers=ANALYSIS_WORKERS,
+                      headless=HEADLESS, stop_event=None):
+    """
+    Monitor one camera until 'q' is pressed in the preview window or, in
+    headless mode, until stop_event is set (SIGTERM/SIGINT).
+    """
+    stop_event = stop_event or threading.Event()
+    motion_detector = MotionDetector()      # ROI from $MOTION_ROI
+    motion_lock = threading.Lock()
 
-    known_encs, known_names = load_known_faces("camera_alert/known_faces")
-    motion_detector = MotionDetector()
-
-    unknown_memory = {}         # cluster_id -> encoding
-    last_alert = {}             # cluster_id -> timestamp
-    next_cluster_id = 1
+    display_lock = threading.Lock()
+    latest_annotated = [None]   # (seq, frame) of the newest annotated frame
 
     print(f"[INFO] Connecting to RTSP stream: {rtsp_url}")
-    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = (
-        "rtsp_transport;tcp|buffer_size;1024000|max_delay;500000|"
-        "stimeout;10000000|fps;15|flags;low_delay|loglevel;quiet"
+    cam = open_rtsp_stream(rtsp_url)
+    if cam is None:
+        print("[WARNING] Could not open RTSP stream; retrying in the background.")
+
+    # ── Analysis stage: motion gate → recognition → clustering ───────────────
+    def analyze(packet):
+        try:
+            # MotionDetector keeps the previous frame, so calls must be serialised
+            with motion_lock:
+                packet.motion = motion_detector.detect(packet.context)
+            if not analyzer.admit(packet):
+                return None
+
+            annotated, jobs = analyzer.analyze(packet)
+        finally:
+            packet.release()
+        if not headless:
+            with display_lock:
+                latest_annotated[0] = (packet.seq, annotated)
+        return jobs
+
+    frame_queue = DropOldestQueue(FRAME_QUEUE_SIZE)
+    io_queue    = DropOldestQueue(IO_QUEUE_SIZE)
+
+    capture  = CaptureThread(cam, frame_queue, opener=lambda: open_rtsp_stream(rtsp_url),
+                             recorder=get_clip_recorder())
+    analysis = Stage("analysis", analyze, frame_queue, io_queue,
+                     workers=workers, ordered=True)
+    io_stage = Stage("io", dispatch_alert, io_queue)
+
+    io_stage.start()
+    analysis.start()
+    capture.start()
+
+    if headless:
+        print("[INFO] Monitoring started (headless)... Send SIGTERM or Ctrl+C to stop.")
+    else:
+        print("[INFO] Monitoring started... Press 'q' to quit.")
+    last_stats = time.time()
+    shown_seq = 0
+    try:
+        while not stop_event.is_set():
+            # Optional time restriction logic
+            # if not is_within_operating_hours():
+            #     time.sleep(60)
+            #     continue
+
+            if STATS_INTERVAL and time.time() - last_stats >= STATS_INTERVAL:
+                last_stats = time.time()
+                print("[STATS] " + format_stats({
+                    "capture":   capture.snapshot(),
+                    "analysis":  analysis.snapshot(),
+                    "io":        io_stage.snapshot(),
+                    "scheduler": analyzer.scheduler.snapshot(),
+                }))
+
+            if headless:
+                stop_event.wait(1)
+                continue
+
+            packet = capture.latest()
+            if packet is None or packet.seq == shown_seq:
+                time.sleep(0.01)
+                continue
+            shown_seq = packet.seq
+
+            # Keep showing the last annotation until a newer frame replaces it
+            display = packet.frame
+            with display_lock:
+                if latest_annotated[0] is not None:
+                    ann_seq, annotated = latest_annotated[0]
+                    if packet.seq - ann_seq <= FRAME_QUEUE_SIZE:
+                        display = annotated
+
+            # Display feed
+            cv2.imshow("Camera Feed", display)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    finally:
+        print("[INFO] Stopping capture and draining pending work...")
+        capture.stop()
+        analysis.stop(drain_timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        io_stage.stop(drain_timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        if not headless:
+            cv2.destroyAllWindows()
+
+
+def install_signal_handlers(stop_event):
+    """
+    SIGTERM and SIGINT ask the monitor to stop and drain; a second signal
+    aborts the drain.
+    """
+    def handle(signum, frame):
+        if stop_event.is_set():
+            raise KeyboardInterrupt
+        print(f"[INFO] Received {signal.Signals(signum).name}, shutting down...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, handle)
+    signal.signal(signal.SIGINT, handle)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Camera alert monitor")
+    parser.add_argument(
+        "--cameras", metavar="FILE",
+        help="JSON list of camera definitions; runs in multi-camera supervisor mode"
+    )
+    parser.add_argument(
+        "--headless", action="store_true", default=HEADLESS,
+        help="run without the preview window (for servers and process supervisors)"
     )
+    args = parser.parse_args(argv)
 
-    cam = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
-    cam.set(cv2.CAP_PROP_BUFFERSIZE, 0)
+    init_db()
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    metrics.serve()
 
-    if not cam.isOpened():
-        print("[ERROR] Could not open RTSP stream.")
+    cameras = load_camera_definitions(args.cameras)
+    rtsp_url = os.getenv("CAMERA_RTSP")
+    if not cameras and not rtsp_url:
+        print("[ERROR] CAMERA_RTSP not set in .env file.")
         return
 
-    print("[INFO] Monitoring started... Press 'q' to quit.")
-    while True:
-        # Optional time restriction logic
-        # if not is_within_operating_hours():
-        #     time.sleep(60)
-        #     continue
-
-        ret, frame = cam.read()
-        if not ret or frame is None or frame.sum() < 1000:
-            print("[WARNING] Corrupted or black frame skipped.")
-            time.sleep(1)
-            continue
-
-        display = frame.copy()
-
-        if motion_detector.detect(frame):
-            # Downscale for performance
-            small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-
-            enc_list, raw_ids, annotated = recognize_faces(
-                small_frame, known_encs, known_names
-            )
-
-            # Resize annotated result back to original size
-            annotated = cv2.resize(annotated, (frame.shape[1], frame.shape[0]))
-            display = annotated
-
-            now = time.time()
-
-            for enc, raw_id in zip(enc_list, raw_ids):
-                if raw_id in known_names:
-                    continue
-
-                # Cluster similar unknowns
-                cluster_id = None
-                for cid, centroid in unknown_memory.items():
-                    if face_recognition.face_distance([centroid], enc)[0] < CLUSTER_THRESHOLD:
-                        cluster_id = cid
-                        break
-
-                if cluster_id is None:
-                    cluster_id = next_cluster_id
-                    unknown_memory[cluster_id] = enc
-                    next_cluster_id += 1
-
-                # Alert throttling
-                last = last_alert.get(cluster_id)
-                if last is None or (now - last) >= ALERT_INTERVAL:
-                    last_alert[cluster_id] = now
-                    face_label = f"Unknown_{cluster_id}"
-
-                    print(f"[ALERT] {face_label} detected! Saving snapshot...")
-                    fname = get_timestamped_filename(prefix=face_label, ext="jpg")
-                    path = save_snapshot(annotated, fname)
-
-                    log_event(face_label, path)
-                    send_alert(face_label, path)
-
-        # Display feed
-        cv2.imshow("Camera Feed", display)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-    cam.release()
-    cv2.destroyAllWindows()
+    known_faces_dir = "camera_alert/known_faces"
+    known_encs, known_names = load_known_faces(known_faces_dir)
+
+    # Optional multi-process detection/encoding backend
+    pool = None
+    if RECOGNITION_PROCESSES:
+        pool = RecognitionPool(known_encs, known_names, TOLERANCE)
+        print(f"[INFO] Recognition pool started with {pool.workers} processes.")
+
+    # Enough analysis threads to keep every pool process busy
+    workers = max(ANALYSIS_WORKERS, pool.workers if pool else 1)
+    analyzer = FaceAnalyzer(
+        known_encs, known_names, pool=pool,
+        scheduler=AnalysisScheduler(workers=workers)
+    )
+
+    # Pick up enrolments/removals without restarting the monitor
+    watcher = None
+    if GALLERY_POLL_INTERVAL:
+        watcher = GalleryWatcher(known_faces_dir, analyzer.swap_gallery)
+        watcher.start()
+
+    stop_event = threading.Event()
+    install_signal_handlers(stop_event)
+
+    try:
+        if cameras:
+            CameraSupervisor(cameras, analyzer, workers=workers).run(stop_event=stop_event)
+        else:
+            run_single_camera(rtsp_url, analyzer, workers=workers,
+                              headless=args.headless, stop_event=stop_event)
+    finally:
+        if watcher:
+            watcher.stop()
+        if pool:
+            pool.close()
+        analyzer.clusters.save()    # no-op unless UNKNOWN_CLUSTER_FILE is set
+        close_clip_recorders()
+        close_snapshot_writers()
+        # Deliver queued alerts, then commit pending attendance and rows
+        close_dispatcher()
+        attendance.close()
+        close_writers()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,88 @@
+# camera_alert/matcher.py
+
+import numpy as np
+
+
+def pairwise_distances(queries, matrix, matrix_sq_norms=None):
+    """
+    Euclidean distances between every row of queries (m, d) and every row
+    of matrix (n, d), computed as one matrix product. Returns (m, n) float32.
+    """
+    q = np.asarray(queries, dtype=np.float32).reshape(-1, matrix.shape[1])
+    if matrix_sq_norms is None:
+        matrix_sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+    q_sq = np.einsum("ij,ij->i", q, q)
+    # |a - b|^2 = |a|^2 + |b|^2 - 2ab; clamp rounding noise below zero
+    d2 = q_sq[:, None] + matrix_sq_norms[None, :] - 2.0 * (q @ matrix.T)
+    np.maximum(d2, 0.0, out=d2)
+    return np.sqrt(d2, out=d2)
+
+
+class GalleryMatcher:
+    """
+    Known-face gallery held as one contiguous float32 matrix with
+    precomputed squared norms, so all faces in a frame are matched against
+    all identities in a single batched operation.
+    """
+
+    def __init__(self, encodings, names):
+        if len(encodings) != len(names):
+            raise ValueError("encodings and names must have the same length")
+        self.names = list(names)
+        self.matrix = np.ascontiguousarray(
+            np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        )
+        self.sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self._name_set = frozenset(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._name_set
+
+    def distances(self, queries):
+        """(m, n) distance matrix between queries and the gallery."""
+        if not len(self) or not len(queries):
+            return np.empty((len(queries), len(self)), dtype=np.float32)
+        return pairwise_distances(queries, self.matrix, self.sq_norms)
+
+    def match(self, queries, k=1):
+        """
+        Top-k gallery entries for each query.
+        Returns one list of (name, distance) pairs per query, nearest first.
+        """
+        dists = self.distances(queries)
+        if not dists.size:
+            return [[] for _ in range(len(queries))]
+
+        k = min(k, len(self))
+        if k < len(self):
+            idx = np.argpartition(dists, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.tile(np.arange(len(self)), (len(dists), 1))
+        top = np.take_along_axis(dists, idx, axis=1)
+        order = np.argsort(top, axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+
+        return [
+            [(self.names[j], float(d)) for j, d in zip(row_idx, row_d)]
+            for row_idx, row_d in zip(idx, top)
+        ]
+
+    def best(self, queries, tolerance):
+        """
+        Nearest identity per query if closer than tolerance, else None.
+        Returns (names, distances).
+        """
+        dists = self.distances(queries)
+        if not dists.size:
+            return [None] * len(queries), np.full(len(queries), np.inf)
+        best_idx = np.argmin(dists, axis=1)
+        best_d = dists[np.arange(len(dists)), best_idx]
+        names = [
+            self.names[i] if d < tolerance else None
+            for i, d in zip(best_idx, best_d)
+        ]
+        return names, best_d
@@ -1,20 +1,190 @@
 # camera_alert/motion_detector.py
+import os
+import json
 import cv2
+import numpy as np
+
+from camera_alert import metrics
+from camera_alert.frame_context import FrameContext
+
+# ── Motion settings ───────────────────────────────────────────────────────────
+MOTION_WIDTH      = int(os.getenv("MOTION_WIDTH", "320"))         # analysis width, px
+MOTION_MIN_AREA   = float(os.getenv("MOTION_MIN_AREA", "1500"))   # full-res px
+MOTION_THRESHOLD  = int(os.getenv("MOTION_THRESHOLD", "25"))      # pixel delta
+MOTION_BACKGROUND = os.getenv("MOTION_BACKGROUND", "running")     # running | mog2
+MOTION_ALPHA      = float(os.getenv("MOTION_ALPHA", "0.05"))      # running-average rate
+MOTION_ROI        = os.getenv("MOTION_ROI")                       # JSON polygons
+
+_MOTION_SECONDS = metrics.histogram("camera_alert_motion_seconds", "Motion detection time per frame")
+_MOTION_FRAMES  = metrics.counter(
+    "camera_alert_motion_frames_total", "Frames checked for motion, by result", ["result"]
+)
+_MOTION_HIT  = _MOTION_FRAMES.labels("motion")
+_MOTION_MISS = _MOTION_FRAMES.labels("still")
+
+
+class MotionResult:
+    """
+    Moving regions found in one frame.
+    boxes are (x, y, w, h) in full-frame pixels; area is their total
+    contour area. Truthy when at least one region passed the thresholds.
+    """
+
+    __slots__ = ("boxes", "area")
+
+    def __init__(self, boxes=None, area=0.0):
+        self.boxes = boxes or []
+        self.area = area
+
+    def __bool__(self):
+        return bool(self.boxes)
+
+    def regions(self, frame_shape, scale=1.0, pad=0.25, min_size=96):
+        """
+        Padded, merged (top, right, bottom, left) regions for a frame of
+        frame_shape that is `scale` times the captured frame, suitable for
+        running face detection on crops. Faces usually sit at the top of a
+        moving body, so boxes are padded before merging.
+        """
+        h, w = frame_shape[:2]
+        rects = []
+        for x, y, bw, bh in self.boxes:
+            x, y, bw, bh = x * scale, y * scale, bw * scale, bh * scale
+            px = max(bw * pad, (min_size - bw) / 2, 0)
+            py = max(bh * pad, (min_size - bh) / 2, 0)
+            rects.append([
+                max(0, int(x - px)), max(0, int(y - py)),
+                min(w, int(x + bw + px)), min(h, int(y + bh + py)),
+            ])
+
+        # Merge overlapping rectangles until none overlap
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(rects)):
+                for j in range(i + 1, len(rects)):
+                    a, b = rects[i], rects[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        rects[i] = [min(a[0], b[0]), min(a[1], b[1]),
+                                    max(a[2], b[2]), max(a[3], b[3])]
+                        del rects[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+
+        return [(y0, x1, y1, x0) for x0, y0, x1, y1 in rects]
+
+
+def parse_roi(roi):
+    """
+    ROI polygons as a list of [[x, y], ...] point lists in fractions of the
+    frame (0..1). Accepts a JSON string, a list, or None.
+    """
+    if not roi:
+        return None
+    if isinstance(roi, str):
+        roi = json.loads(roi)
+    return [np.asarray(poly, dtype=np.float32) for poly in roi]
+
 
 class MotionDetector:
-    def __init__(self):
-        self.previous_frame = None
+    """
+    Background-model motion engine working on a downscaled grayscale frame.
+
+    method "running" keeps a running-average background (cheap, adapts to
+    slow lighting changes); "mog2" uses OpenCV's MOG2 subtractor. Changed
+    pixels outside the ROI mask are ignored and contours smaller than
+    min_area (in full-resolution pixels) are discarded.
+    """
+
+    def __init__(self, width=None, min_area=None, roi=MOTION_ROI,
+                 method=None, threshold=None, alpha=None):
+        self.width = width or MOTION_WIDTH
+        self.min_area = MOTION_MIN_AREA if min_area is None else float(min_area)
+        self.method = method or MOTION_BACKGROUND
+        self.threshold = threshold or MOTION_THRESHOLD
+        self.alpha = alpha or MOTION_ALPHA
+        self.roi = parse_roi(roi)
+
+        self.background = None
+        self._mog = None
+        self._mask = None
+        self._blur = None
+        self._shape = None
+        self._scale = 1.0
+        self._kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+
+    def _prepare(self, frame):
+        """(Re)compute scale and ROI mask when the frame size changes."""
+        h, w = frame.shape[:2]
+        self._shape = (h, w)
+        self._scale = min(1.0, self.width / float(w))
+        sw, sh = int(round(w * self._scale)), int(round(h * self._scale))
+        self._small_size = (sw, sh)
+        self._blur = np.empty((sh, sw), dtype=np.uint8)
+
+        self._mask = None
+        if self.roi:
+            self._mask = np.zeros((sh, sw), dtype=np.uint8)
+            polys = [(p * [sw, sh]).astype(np.int32) for p in self.roi]
+            cv2.fillPoly(self._mask, polys, 255)
+
+        self.background = None
+        if self.method == "mog2":
+            self._mog = cv2.createBackgroundSubtractorMOG2(
+                history=500, varThreshold=16, detectShadows=False
+            )
 
     def detect(self, frame):
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, (21, 21), 0)
-
-        if self.previous_frame is None:
-            self.previous_frame = gray
-            return False
-
-        delta = cv2.absdiff(self.previous_frame, gray)
-        self.previous_frame = gray
-        thresh = cv2.threshold(delta, 25, 255, cv2.THRESH_BINARY)[1]
-        movement = cv2.countNonZero(thresh)
-        return movement 
\ No newline at end of file
+        """
+        MotionResult for a BGR frame or a FrameContext; with a context the
+        grayscale view is shared with anything else that needs it.
+        """
+        own = not isinstance(frame, FrameContext)
+        ctx = FrameContext(frame) if own else frame
+        try:
+            with _MOTION_SECONDS.time():
+                result = self._detect(ctx)
+        finally:
+            if own:
+                ctx.release()
+        (_MOTION_HIT if result else _MOTION_MISS).inc()
+        return result
+
+    def _detect(self, ctx):
+        if self._shape != ctx.shape[:2]:
+            self._prepare(ctx.frame)
+
+        gray = cv2.GaussianBlur(ctx.gray(self._small_size), (5, 5), 0, dst=self._blur)
+
+        if self.method == "mog2":
+            thresh = self._mog.apply(gray)
+        else:
+            if self.background is None:
+                self.background = gray.astype(np.float32)
+                return MotionResult()
+            delta = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+            cv2.accumulateWeighted(gray, self.background, self.alpha)
+            thresh = cv2.threshold(delta, self.threshold, 255, cv2.THRESH_BINARY)[1]
+
+        if self._mask is not None:
+            thresh = cv2.bitwise_and(thresh, self._mask)
+        thresh = cv2.dilate(thresh, self._kernel, iterations=2)
+
+        contours, _ = cv2.findContours(
+            thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
+
+        inv = 1.0 / self._scale
+        min_area_small = self.min_area * self._scale * self._scale
+        boxes, area = [], 0.0
+        for c in contours:
+            a = cv2.contourArea(c)
+            if a < min_area_small:
+                continue
+            x, y, w, h = cv2.boundingRect(c)
+            boxes.append((int(x * inv), int(y * inv), int(w * inv), int(h * inv)))
+            area += a * inv * inv
+
+        return MotionResult(boxes, area)
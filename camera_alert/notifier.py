@@ -2,35 +2,403 @@
 
 import os
 import time
+import queue
+import random
+import sqlite3
+import threading
 import requests
 import smtplib
+from datetime import datetime
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 
+from camera_alert import metrics
+
 # Load environment variables
 load_dotenv()
 
 # ── Telegram settings ─────────────────────────────────────────────────────────
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID   = os.getenv("TELEGRAM_CHAT_ID")
+TELEGRAM_API_URL   = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
 
 # ── SMTP / Email settings ────────────────────────────────────────────────────
-SMTP_SERVER = os.getenv("SMTP_SERVER")
-SMTP_PORT   = int(os.getenv("SMTP_PORT", "587"))
-SMTP_USER   = os.getenv("SMTP_USER")
-SMTP_PASS   = os.getenv("SMTP_PASS")
-EMAIL_FROM  = os.getenv("EMAIL_FROM", SMTP_USER)
-EMAIL_TO    = os.getenv("EMAIL_TO")  # comma-separated list
+SMTP_SERVER   = os.getenv("SMTP_SERVER")
+SMTP_PORT     = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER     = os.getenv("SMTP_USER")
+SMTP_PASS     = os.getenv("SMTP_PASS")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"
+EMAIL_FROM    = os.getenv("EMAIL_FROM", SMTP_USER)
+EMAIL_TO      = os.getenv("EMAIL_TO")  # comma-separated list
 
 # ── Alert throttling ──────────────────────────────────────────────────────────
 ALERT_INTERVAL   = float(os.getenv("ALERT_INTERVAL", "300"))  # seconds
 _last_alert_time = {}
 
+# ── Dispatcher settings ───────────────────────────────────────────────────────
+ALERT_QUEUE_DB      = os.getenv("ALERT_QUEUE_DB", "alerts.db")
+ALERT_DIGEST_WINDOW = float(os.getenv("ALERT_DIGEST_WINDOW", "5"))     # s to coalesce a burst
+ALERT_MAX_ATTEMPTS  = int(os.getenv("ALERT_MAX_ATTEMPTS", "8"))
+ALERT_RETRY_BASE    = float(os.getenv("ALERT_RETRY_BASE", "2"))        # s, doubles per attempt
+ALERT_RETRY_MAX     = float(os.getenv("ALERT_RETRY_MAX", "300"))       # s
+ALERT_DIGEST_MAX    = 20                                               # alerts per message
+SMTP_IDLE_CHECK     = 60                                               # s before NOOP probe
+
+_SEND_SECONDS = metrics.histogram(
+    "camera_alert_alert_send_seconds", "Time to deliver one alert message per channel", ["channel"]
+)
+_DELIVERY_LATENCY = metrics.histogram(
+    "camera_alert_alert_delivery_seconds", "Time from alert raised to delivered per channel",
+    ["channel"], buckets=(1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+)
+_ALERT_RESULTS = metrics.counter(
+    "camera_alert_alert_messages_total", "Alerts per channel by outcome", ["channel", "result"]
+)
+
+
+def format_message(face_id, snapshot_path):
+    return f"🚨 {face_id} detected. Snapshot saved: {snapshot_path}"
+
+
+def format_digest(alerts):
+    """
+    (subject, text) for one or more (face_id, snapshot_path, created_at)
+    alerts; a single alert keeps the original wording.
+    """
+    if len(alerts) == 1:
+        face_id, snapshot_path, _ = alerts[0]
+        return f"Camera Alert: {face_id} Detected", format_message(face_id, snapshot_path)
+    lines = [f"🚨 {len(alerts)} alerts:"]
+    for face_id, snapshot_path, created_at in alerts:
+        ts = datetime.fromtimestamp(created_at).strftime("%H:%M:%S")
+        lines.append(f"• {ts} {face_id} — {snapshot_path}")
+    return f"Camera Alert: {len(alerts)} faces detected", "\n".join(lines)
+
+
+class TelegramChannel:
+    """Sends messages through a pooled, keep-alive requests.Session."""
+
+    name = "telegram"
+
+    def __init__(self, token=TELEGRAM_BOT_TOKEN, chat_id=TELEGRAM_CHAT_ID,
+                 api_url=TELEGRAM_API_URL, session=None):
+        self.token = token
+        self.chat_id = chat_id
+        self.api_url = api_url.rstrip("/")
+        self.session = session or requests.Session()
+
+    @property
+    def enabled(self):
+        return bool(self.token and self.chat_id)
+
+    def send(self, subject, text):
+        url = f"{self.api_url}/bot{self.token}/sendMessage"
+        resp = self.session.post(
+            url, data={"chat_id": self.chat_id, "text": text}, timeout=10
+        )
+        resp.raise_for_status()
+
+    def close(self):
+        self.session.close()
+
+
+class EmailChannel:
+    """Keeps one authenticated SMTP connection open and reuses it."""
+
+    name = "email"
+
+    def __init__(self, server=SMTP_SERVER, port=SMTP_PORT, user=SMTP_USER,
+                 password=SMTP_PASS, starttls=SMTP_STARTTLS,
+                 sender=EMAIL_FROM, recipients=EMAIL_TO):
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.sender = sender or user
+        self.recipients = [r.strip() for r in (recipients or "").split(",") if r.strip()]
+        self._smtp = None
+        self._last_used = 0.0
+
+    @property
+    def enabled(self):
+        return bool(self.server and self.recipients and self.sender)
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.server, self.port, timeout=10)
+        if self.starttls:
+            smtp.starttls()
+        if self.user and self.password:
+            smtp.login(self.user, self.password)
+        self._smtp = smtp
+
+    def _ensure_connected(self):
+        if self._smtp is not None and time.time() - self._last_used > SMTP_IDLE_CHECK:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self.close()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self._smtp is None:
+            self._connect()
+
+    def send(self, subject, text):
+        msg = MIMEMultipart()
+        msg["From"]    = self.sender
+        msg["To"]      = ", ".join(self.recipients)
+        msg["Subject"] = subject
+        msg.attach(MIMEText(text, "plain"))
+
+        for attempt in (1, 2):
+            self._ensure_connected()
+            try:
+                self._smtp.sendmail(self.sender, self.recipients, msg.as_string())
+                self._last_used = time.time()
+                return
+            except smtplib.SMTPServerDisconnected:
+                # Server dropped the idle connection; reconnect once
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+class AlertDispatcher(threading.Thread):
+    """
+    Background sender for alerts.
+
+    Alerts are persisted to the alert_queue table (one row per channel), so
+    anything not yet delivered survives a restart. Due alerts for a channel
+    are coalesced into one digest message once the oldest has waited
+    digest_window seconds; failures are retried with jittered exponential
+    backoff up to max_attempts. Database errors (e.g. "database is locked")
+    are logged and retried with the same backoff; alerts taken from the
+    inbox stay in memory until they have been written.
+    """
+
+    def __init__(self, channels=None, db_path=ALERT_QUEUE_DB,
+                 digest_window=ALERT_DIGEST_WINDOW, max_attempts=ALERT_MAX_ATTEMPTS,
+                 retry_base=ALERT_RETRY_BASE, retry_max=ALERT_RETRY_MAX):
+        super().__init__(name="alert-dispatcher", daemon=True)
+        if channels is None:
+            channels = [TelegramChannel(), EmailChannel()]
+        self.channels = {c.name: c for c in channels if c.enabled}
+        self.db_path = db_path
+        self.digest_window = digest_window
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.db_errors = 0
+        self._inbox = queue.Queue()
+        self._unsaved = []          # taken from the inbox, not yet in alert_queue
+        self._stop_event = threading.Event()
+
+    def enqueue(self, face_id, snapshot_path):
+        """Non-blocking: hand an alert to the dispatcher thread."""
+        self._inbox.put((face_id, snapshot_path, time.time()))
+
+    def close(self, timeout=30):
+        """Send what is due now (ignoring the digest window) and stop."""
+        self._stop_event.set()
+        self._inbox.put(None)
+        self.join(timeout=timeout)
+
+    # -- dispatcher thread --
+    def run(self):
+        conn = sqlite3.connect(self.db_path)
+        ready = False
+        failures = 0
+        try:
+            while True:
+                stopping = self._stop_event.is_set()
+                try:
+                    if not ready:
+                        self._create_table(conn)
+                        ready = True
+                    self._persist_inbox(conn, wait=0 if stopping else self._next_wait(conn))
+                    self._send_due(conn, flush=stopping)
+                    failures = 0
+                except sqlite3.Error as e:
+                    self.db_errors += 1
+                    failures += 1
+                    if stopping:
+                        print(f"[ERROR] Alert queue database error on shutdown: {e}; "
+                              f"{len(self._unsaved)} alert(s) not saved.")
+                        break
+                    delay = min(self.retry_max, self.retry_base * 2 ** (failures - 1))
+                    print(f"[ERROR] Alert queue database error: {e}; retrying in {delay:.1f}s.")
+                    self._stop_event.wait(delay)
+                    continue
+                if stopping:
+                    break
+        finally:
+            for channel in self.channels.values():
+                channel.close()
+            conn.close()
+
+    @staticmethod
+    def _create_table(conn):
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS alert_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    channel TEXT NOT NULL,
+                    face_id TEXT NOT NULL,
+                    snapshot_path TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL
+                )
+            """)
+
+    def _next_wait(self, conn):
+        row = conn.execute("""
+            SELECT MIN(MAX(next_attempt_at, created_at + ?)) FROM alert_queue
+        """, (self.digest_window,)).fetchone()
+        if row[0] is None:
+            return 1.0
+        return min(1.0, max(0.0, row[0] - time.time()))
+
+    def _persist_inbox(self, conn, wait):
+        items = self._unsaved
+        try:
+            item = self._inbox.get(timeout=wait) if wait else self._inbox.get_nowait()
+            while True:
+                if item is not None:
+                    items.append(item)
+                item = self._inbox.get_nowait()
+        except queue.Empty:
+            pass
+        if items:
+            self._unsaved = items   # kept for the next pass if the insert fails
+            with conn:
+                conn.executemany("""
+                    INSERT INTO alert_queue
+                        (channel, face_id, snapshot_path, created_at, next_attempt_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, [
+                    (name, face_id, path, created, created)
+                    for face_id, path, created in items
+                    for name in self.channels
+                ])
+            self._unsaved = []
+
+    def _send_due(self, conn, flush=False):
+        now = time.time()
+        for name, channel in self.channels.items():
+            rows = conn.execute("""
+                SELECT id, face_id, snapshot_path, created_at, attempts
+                  FROM alert_queue
+                 WHERE channel = ? AND next_attempt_at <= ?
+                 ORDER BY id
+                 LIMIT ?
+            """, (name, now, ALERT_DIGEST_MAX)).fetchall()
+            if not rows:
+                continue
+            # Let a burst accumulate into one digest
+            if not flush and rows[0][3] + self.digest_window > now:
+                continue
+
+            subject, text = format_digest([(r[1], r[2], r[3]) for r in rows])
+            ids = [(r[0],) for r in rows]
+            try:
+                with _SEND_SECONDS.labels(name).time():
+                    channel.send(subject, text)
+            except Exception as e:
+                self._retry(conn, name, rows, e)
+                continue
+
+            with conn:
+                conn.executemany("DELETE FROM alert_queue WHERE id = ?", ids)
+            self.sent += len(rows)
+            _ALERT_RESULTS.labels(name, "sent").inc(len(rows))
+            delivered = time.time()
+            latency = _DELIVERY_LATENCY.labels(name)
+            for r in rows:
+                latency.observe(delivered - r[3])
+
+    def _retry(self, conn, name, rows, error):
+        # One jittered delay for the whole digest keeps it together on retry
+        attempts = max(r[4] for r in rows) + 1
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+        retry_at = time.time() + delay * random.uniform(0.8, 1.2)
+
+        updates, dropped = [], []
+        for row_id, _, _, _, row_attempts in rows:
+            if row_attempts + 1 >= self.max_attempts:
+                dropped.append((row_id,))
+            else:
+                updates.append((row_attempts + 1, retry_at, row_id))
+
+        with conn:
+            conn.executemany("""
+                UPDATE alert_queue SET attempts = ?, next_attempt_at = ? WHERE id = ?
+            """, updates)
+            conn.executemany("DELETE FROM alert_queue WHERE id = ?", dropped)
+        self.retried += len(updates)
+        self.failed += len(dropped)
+        _ALERT_RESULTS.labels(name, "retried").inc(len(updates))
+        _ALERT_RESULTS.labels(name, "failed").inc(len(dropped))
+        print(f"[ERROR] {name.capitalize()} alert failed: {error}")
+        if dropped:
+            print(f"[ERROR] Gave up on {len(dropped)} {name} alert(s) after "
+                  f"{self.max_attempts} attempts.")
+
+    def snapshot(self):
+        return {
+            "sent":    self.sent,
+            "retried": self.retried,
+            "failed":  self.failed,
+            "inbox":   self._inbox.qsize() + len(self._unsaved),
+            "db_errors": self.db_errors,
+        }
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """The shared AlertDispatcher, started on first use."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = AlertDispatcher()
+            _dispatcher.start()
+        return _dispatcher
+
+
+metrics.gauge_fn(
+    "camera_alert_alert_inbox_depth", "Alerts waiting to be persisted by the dispatcher",
+    lambda: _dispatcher.snapshot()["inbox"] if _dispatcher is not None else 0
+)
+
+
+def close_dispatcher(timeout=30):
+    """Deliver what is due and stop the dispatcher; called on shutdown."""
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.close(timeout)
+
 
 def send_alert(face_id: str, snapshot_path: str):
     """
-    Sends a notification message via Telegram and/or email for the given face.
+    Queues a notification via Telegram and/or email for the given face.
+    Delivery happens on the background dispatcher.
     """
     global _last_alert_time
 
@@ -40,30 +408,4 @@ def send_alert(face_id: str, snapshot_path: str):
         return
     _last_alert_time[face_id] = now
 
-    message = f"🚨 {face_id} detected. Snapshot saved: {snapshot_path}"
-
-    # 1) Telegram alert
-    if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
-        try:
-            url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-            data = {"chat_id": TELEGRAM_CHAT_ID, "text": message}
-            resp = requests.post(url, data=data, timeout=10)
-            resp.raise_for_status()
-        except Exception as e:
-            print(f"[ERROR] Telegram alert failed: {e}")
-
-    # 2) Email alert
-    if SMTP_SERVER and SMTP_USER and SMTP_PASS and EMAIL_TO:
-        try:
-            msg = MIMEMultipart()
-            msg["From"]    = EMAIL_FROM
-            msg["To"]      = EMAIL_TO
-            msg["Subject"] = f"Camera Alert: {face_id} Detected"
-            msg.attach(MIMEText(message, "plain"))
-
-            with smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=10) as server:
-                server.starttls()
-                server.login(SMTP_USER, SMTP_PASS)
-                server.sendmail(EMAIL_FROM, EMAIL_TO.split(","), msg.as_string())
-        except Exception as e:
-            print(f"[ERROR] Email alert failed: {e}")
+    get_dispatcher().enqueue(face_id, snapshot_path)
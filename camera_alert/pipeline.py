@@ -0,0 +1,519 @@
+# camera_alert/pipeline.py
+
+import os
+import queue
+import random
+import threading
+import time
+import weakref
+from collections import deque
+
+import cv2
+
+from camera_alert import metrics
+from camera_alert.frame_context import FrameContext, is_black
+
+# ── Pipeline settings ─────────────────────────────────────────────────────────
+FRAME_QUEUE_SIZE       = int(os.getenv("FRAME_QUEUE_SIZE", "2"))
+IO_QUEUE_SIZE          = int(os.getenv("IO_QUEUE_SIZE", "64"))
+ANALYSIS_WORKERS       = int(os.getenv("ANALYSIS_WORKERS", "1"))
+STATS_INTERVAL         = float(os.getenv("STATS_INTERVAL", "30"))          # seconds, 0 = off
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))  # s per stage for queued work
+
+# ── Capture reconnection ──────────────────────────────────────────────────────
+CAPTURE_MAX_FAILURES = int(os.getenv("CAPTURE_MAX_FAILURES", "3"))     # failed reads before reopening
+STREAM_STALE_SECONDS = float(os.getenv("STREAM_STALE_SECONDS", "15"))  # stream clock stopped this long
+RECONNECT_BASE       = float(os.getenv("RECONNECT_BASE", "1"))         # first retry delay, s
+RECONNECT_MAX        = float(os.getenv("RECONNECT_MAX", "60"))         # cap on the retry delay, s
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+_STAGE_SECONDS = metrics.histogram(
+    "camera_alert_stage_seconds", "Time spent in each pipeline stage handler", ["stage"]
+)
+_FRAMES = metrics.counter(
+    "camera_alert_frames_total", "Frames read per camera by outcome", ["camera", "result"]
+)
+_RECONNECTS = metrics.counter(
+    "camera_alert_reconnects_total", "Times a camera stream was reopened", ["camera"]
+)
+_running_stages = weakref.WeakSet()
+metrics.gauge_fn(
+    "camera_alert_queue_depth", "Items waiting in each stage's inbox",
+    lambda: {s.name: s.inbox.depth() for s in list(_running_stages)}, ["stage"]
+)
+metrics.gauge_fn(
+    "camera_alert_queue_dropped_total", "Items dropped from each stage's full inbox",
+    lambda: {s.name: s.inbox.dropped for s in list(_running_stages)}, ["stage"],
+    kind="counter"
+)
+
+
+class DropOldestQueue:
+    """
+    Bounded FIFO shared between pipeline stages.
+    When full, put() discards the oldest item instead of blocking the producer,
+    so a slow consumer always sees the freshest work.
+    """
+
+    def __init__(self, maxsize=1):
+        self.maxsize = max(1, int(maxsize))
+        self._items = deque()
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        """Enqueue item. Returns False if an older item had to be dropped."""
+        with self._cond:
+            dropped = len(self._items) >= self.maxsize
+            if dropped:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+        return not dropped
+
+    def get(self, timeout=None):
+        """Dequeue the oldest item, raising queue.Empty after timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout):
+                raise queue.Empty
+            return self._items.popleft()
+
+    def depth(self):
+        with self._cond:
+            return len(self._items)
+
+
+class FairQueue:
+    """
+    One bounded drop-oldest queue per key (e.g. camera), served round-robin
+    so a busy camera cannot starve the others of recognition time.
+    """
+
+    def __init__(self, maxsize_per_key=1, key=lambda item: item.camera):
+        self.maxsize = max(1, int(maxsize_per_key))
+        self.key = key
+        self._queues = {}
+        self._order = []
+        self._next = 0
+        self._cond = threading.Condition()
+        self.dropped = 0
+        self.dropped_by_key = {}
+
+    def put(self, item):
+        k = self.key(item)
+        with self._cond:
+            q = self._queues.get(k)
+            if q is None:
+                q = self._queues[k] = deque()
+                self._order.append(k)
+                self.dropped_by_key[k] = 0
+            dropped = len(q) >= self.maxsize
+            if dropped:
+                q.popleft()
+                self.dropped += 1
+                self.dropped_by_key[k] += 1
+            q.append(item)
+            self._cond.notify()
+        return not dropped
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: any(self._queues.values()), timeout
+            ):
+                raise queue.Empty
+            for _ in range(len(self._order)):
+                k = self._order[self._next % len(self._order)]
+                self._next += 1
+                if self._queues[k]:
+                    return self._queues[k].popleft()
+            raise queue.Empty
+
+    def depth(self):
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+    def depth_of(self, k):
+        with self._cond:
+            q = self._queues.get(k)
+            return len(q) if q else 0
+
+
+class StageStats:
+    """Thread-safe counters for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.errors = 0
+        self.last_latency = 0.0   # seconds spent in the handler
+        self.avg_latency = 0.0    # exponential moving average of the above
+        self.max_latency = 0.0
+        self.last_lag = 0.0       # capture -> end of this stage, seconds
+
+    def record(self, latency, lag=None):
+        with self._lock:
+            self.processed += 1
+            self.last_latency = latency
+            self.avg_latency = latency if self.processed == 1 else (
+                0.9 * self.avg_latency + 0.1 * latency
+            )
+            self.max_latency = max(self.max_latency, latency)
+            if lag is not None:
+                self.last_lag = lag
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "processed":       self.processed,
+                "errors":          self.errors,
+                "last_latency_ms": round(self.last_latency * 1000, 1),
+                "avg_latency_ms":  round(self.avg_latency * 1000, 1),
+                "max_latency_ms":  round(self.max_latency * 1000, 1),
+                "last_lag_ms":     round(self.last_lag * 1000, 1),
+            }
+
+
+class FramePacket:
+    """
+    A captured frame travelling through the pipeline. context holds the
+    derived views (gray, downscaled, RGB); whoever finishes with the packet
+    calls release() so their buffers go to the next frame.
+    """
+
+    __slots__ = ("seq", "frame", "captured_at", "camera", "motion", "context")
+
+    def __init__(self, seq, frame, captured_at=None, camera=None):
+        self.seq = seq
+        self.frame = frame
+        self.captured_at = captured_at if captured_at is not None else time.time()
+        self.camera = camera
+        self.motion = None      # MotionResult once the frame passed the gate
+        self.context = FrameContext(frame)
+
+    def release(self):
+        self.context.release()
+
+
+_WAITING = object()
+
+
+class ReorderBuffer:
+    """
+    Puts the results of frames handled in parallel back into capture order.
+
+    begin(item) registers a frame as it is taken from the queue; finish(item,
+    results) returns every result list that is now in order, holding back
+    results while an earlier frame of the same key (camera) is still being
+    handled. Frames are ordered by item.seq; frames dropped before begin()
+    are simply never waited for.
+    """
+
+    def __init__(self, key=lambda item: item.camera):
+        self.key = key
+        self.held = 0               # results that had to wait for an earlier frame
+        self._pending = {}          # key -> {seq: results, or _WAITING}
+        self._lock = threading.Lock()
+
+    def begin(self, item):
+        with self._lock:
+            self._pending.setdefault(self.key(item), {})[item.seq] = _WAITING
+
+    def finish(self, item, results):
+        with self._lock:
+            pending = self._pending[self.key(item)]
+            pending[item.seq] = results or []
+            ready = []
+            for seq in sorted(pending):
+                if pending[seq] is _WAITING:
+                    break
+                ready.extend(pending.pop(seq))
+            if item.seq in pending:
+                self.held += 1
+            return ready
+
+    def flush(self):
+        """Everything finished but still held, in order; used on shutdown."""
+        with self._lock:
+            ready = []
+            for pending in self._pending.values():
+                for seq in sorted(pending):
+                    if pending[seq] is not _WAITING:
+                        ready.extend(pending.pop(seq))
+            return ready
+
+
+class Stage:
+    """
+    Runs handler(item) on one or more worker threads fed from inbox.
+    The handler returns None or a list of items for outbox.
+
+    With ordered=True (items are FramePackets) results reach outbox in
+    capture order per camera even though several workers finish frames
+    out of order; see ReorderBuffer.
+    """
+
+    def __init__(self, name, handler, inbox, outbox=None, workers=1, ordered=False):
+        self.name = name
+        self.handler = handler
+        self.inbox = inbox
+        self.outbox = outbox
+        self.workers = max(1, int(workers))
+        self.reorder = ReorderBuffer() if ordered else None
+        self.stats = StageStats(name)
+        self._latency = _STAGE_SECONDS.labels(name)
+        self._stop_event = threading.Event()
+        self._take_lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        _running_stages.add(self)
+        for i in range(self.workers):
+            t = threading.Thread(
+                target=self._run, name=f"{self.name}-{i}", daemon=True
+            )
+            t.start()
+            self._threads.append(t)
+
+    def _take(self):
+        if self.reorder is None:
+            return self.inbox.get(timeout=0.2)
+        # Taking and registering together keeps the registration order
+        # the same as the queue order
+        with self._take_lock:
+            item = self.inbox.get(timeout=0.2)
+            self.reorder.begin(item)
+            return item
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                item = self._take()
+            except queue.Empty:
+                continue
+            t0 = time.time()
+            try:
+                results = self.handler(item)
+            except Exception as e:
+                results = None
+                self.stats.record_error()
+                print(f"[ERROR] {self.name} stage failed: {e}")
+            else:
+                t1 = time.time()
+                self._latency.observe(t1 - t0)
+                captured_at = getattr(item, "captured_at", None)
+                self.stats.record(t1 - t0, t1 - captured_at if captured_at else None)
+            if self.reorder is not None:
+                results = self.reorder.finish(item, results)
+            self._emit(results)
+
+    def _emit(self, results):
+        if results and self.outbox is not None:
+            for result in results:
+                self.outbox.put(result)
+
+    def stop(self, drain_timeout=0.0):
+        """Stop the workers, optionally waiting for the inbox to empty first."""
+        deadline = time.time() + drain_timeout
+        while self.inbox.depth() and time.time() < deadline:
+            time.sleep(0.05)
+        self._stop_event.set()
+        for t in self._threads:
+            t.join(timeout=2)
+        if self.reorder is not None:
+            # Results held behind a frame that never finished
+            self._emit(self.reorder.flush())
+        _running_stages.discard(self)
+
+    def snapshot(self):
+        snap = self.stats.snapshot()
+        snap["depth"] = self.inbox.depth()
+        snap["dropped"] = self.inbox.dropped
+        if self.reorder is not None:
+            snap["reordered"] = self.reorder.held
+        return snap
+
+
+class CaptureThread(threading.Thread):
+    """
+    Reads frames as fast as the camera delivers them and publishes each one
+    to outbox, so downstream stages never work on a stale buffered frame.
+
+    With an opener (a callable returning a fresh capture or None) the stream
+    is reopened after CAPTURE_MAX_FAILURES failed reads in a row, or when
+    the stream position (CAP_PROP_POS_MSEC) has not advanced for
+    STREAM_STALE_SECONDS: a frozen decoder keeps returning its last frame.
+    The image itself is not compared, since a still, denoised scene can
+    encode to identical frames. Backends that report no position are only
+    reopened on read failures. Attempts back off exponentially from
+    RECONNECT_BASE to RECONNECT_MAX seconds with jitter, so cameras behind
+    one recorder do not all retry at once. cam may be None to start by
+    connecting.
+
+    recorder, if given, is a ClipRecorder offered every good frame for the
+    pre-event clip buffer.
+    """
+
+    def __init__(self, cam, outbox, name="capture", camera=None, opener=None,
+                 stale_after=STREAM_STALE_SECONDS, recorder=None):
+        super().__init__(name=name, daemon=True)
+        self.cam = cam
+        self.outbox = outbox
+        self.camera = camera
+        self.opener = opener
+        self.stale_after = stale_after
+        self.recorder = recorder
+        self.stats = StageStats(name)
+        self.skipped = 0
+        self.reconnects = 0
+        self.fps = 0.0
+        self._last_frame_at = None
+        self._failures = 0
+        self._pos_msec = None
+        self._changed_at = time.time()
+        self._seq = 0
+        self._latest = None
+        self._latest_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        self.label = camera or name
+        self._frames_read    = _FRAMES.labels(self.label, "read")
+        self._frames_corrupt = _FRAMES.labels(self.label, "corrupt")
+        self._frames_black   = _FRAMES.labels(self.label, "black")
+        self._reconnects     = _RECONNECTS.labels(self.label)
+
+    def _stale(self, now):
+        return self.stale_after and now - self._changed_at > self.stale_after
+
+    def _reconnect(self):
+        """Reopen the stream, backing off until it works or we are stopped."""
+        if self.cam is not None:
+            self.cam.release()
+            self.cam = None
+        attempt = 0
+        while not self._stop_event.is_set():
+            delay = min(RECONNECT_MAX, RECONNECT_BASE * 2 ** attempt)
+            delay *= random.uniform(0.5, 1.0)
+            attempt += 1
+            print(f"[INFO] [{self.label}] Reconnecting in {delay:.1f}s (attempt {attempt})...")
+            if self._stop_event.wait(delay):
+                return
+            cam = self.opener()
+            if cam is not None:
+                self.cam = cam
+                self.reconnects += 1
+                self._reconnects.inc()
+                self._failures = 0
+                self._pos_msec = None
+                self._changed_at = time.time()
+                print(f"[INFO] [{self.label}] Stream reconnected.")
+                return
+
+    def run(self):
+        if self.cam is None and self.opener is not None:
+            self._reconnect()
+        while not self._stop_event.is_set():
+            t0 = time.time()
+            if self.opener is not None and self._stale(t0):
+                print(f"[WARNING] [{self.label}] Stream position stuck for {self.stale_after:g}s; "
+                      f"stream looks stale.")
+                self._reconnect()
+                continue
+
+            ret, frame = self.cam.read()
+            if not ret or frame is None:
+                self.skipped += 1
+                self._failures += 1
+                self._frames_corrupt.inc()
+                print("[WARNING] Corrupted frame skipped.")
+                if self.opener is not None and self._failures >= CAPTURE_MAX_FAILURES:
+                    self._reconnect()
+                else:
+                    self._stop_event.wait(1)
+                continue
+            self._failures = 0
+            if is_black(frame):
+                self.skipped += 1
+                self._frames_black.inc()
+                print("[WARNING] Black frame skipped.")
+                continue
+            self._frames_read.inc()
+
+            # A frozen stream repeats its last frame without the clock moving;
+            # 0 means the backend has no position, so never call it stale
+            pos = self.cam.get(cv2.CAP_PROP_POS_MSEC)
+            if pos <= 0 or pos != self._pos_msec:
+                self._pos_msec = pos
+                self._changed_at = t0
+
+            if self._last_frame_at is not None and t0 > self._last_frame_at:
+                inst = 1.0 / (t0 - self._last_frame_at)
+                self.fps = inst if not self.fps else 0.9 * self.fps + 0.1 * inst
+            self._last_frame_at = t0
+
+            if self.recorder is not None:
+                self.recorder.offer(frame, t0)
+
+            self._seq += 1
+            packet = FramePacket(self._seq, frame, t0, self.camera)
+            with self._latest_lock:
+                self._latest = packet
+            self.outbox.put(packet)
+            self.stats.record(time.time() - t0)
+
+    def latest(self):
+        """Newest captured FramePacket, or None before the first frame."""
+        with self._latest_lock:
+            return self._latest
+
+    def stop(self):
+        """Stop reading and release the current capture."""
+        self._stop_event.set()
+        self.join(timeout=2)
+        # A read still blocked in FFmpeg must not have its capture freed under it
+        if not self.is_alive() and self.cam is not None:
+            self.cam.release()
+            self.cam = None
+
+    def snapshot(self):
+        snap = self.stats.snapshot()
+        snap["skipped"] = self.skipped
+        snap["fps"] = round(self.fps, 1)
+        if self.opener is not None:
+            snap["reconnects"] = self.reconnects
+        if self.recorder is not None:
+            snap["clip_ring_kb"] = self.recorder.snapshot()["ring_kb"]
+        return snap
+
+
+def format_stats(stats):
+    """One-line summary of {stage: snapshot} for console output."""
+    parts = []
+    for name, s in stats.items():
+        if "level" in s:    # AnalysisScheduler.snapshot()
+            parts.append(
+                f"{name}: analysed={s['analysed']} skipped={sum(s['skipped'].values())} "
+                f"avg={s['latency_ms']}ms level={s['level']}"
+            )
+            continue
+        part = f"{name}: n={s['processed']} avg={s['avg_latency_ms']}ms"
+        if "fps" in s:
+            part += f" fps={s['fps']}"
+        if "depth" in s:
+            part += f" depth={s['depth']} dropped={s['dropped']}"
+        if s.get("last_lag_ms"):
+            part += f" lag={s['last_lag_ms']}ms"
+        if s.get("reconnects"):
+            part += f" reconnects={s['reconnects']}"
+        if s.get("reordered"):
+            part += f" reordered={s['reordered']}"
+        if "clip_ring_kb" in s:
+            part += f" clip_ring={s['clip_ring_kb']}KB"
+        parts.append(part)
+    return " | ".join(parts)
@@ -0,0 +1,119 @@
+# camera_alert/queries.py
+
+import os
+import json
+import base64
+import sqlite3
+from datetime import date, timedelta
+
+# ── Query settings ────────────────────────────────────────────────────────────
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "500"))   # rows per fetchmany
+
+
+def day_range(start, end):
+    """
+    Inclusive YYYY-MM-DD dates as a half-open [start, end + 1 day) range,
+    so `col >= ? AND col < ?` can use an index on a date or timestamp column.
+    Raises ValueError on malformed dates.
+    """
+    lo = date.fromisoformat(start)
+    hi = date.fromisoformat(end) + timedelta(days=1)
+    return lo.isoformat(), hi.isoformat()
+
+
+def encode_cursor(*values):
+    """Opaque pagination cursor for the sort key of the last row on a page."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, arity):
+    """Sort key from encode_cursor(); ValueError if it is not a valid cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(values, list) or len(values) != arity:
+        raise ValueError("invalid cursor")
+    return values
+
+
+def _where(clauses):
+    return f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+
+def events_query(start=None, end=None, cursor=None):
+    """
+    (sql, params) for unknown_faces, newest first, optionally within
+    [start, end] dates and after a cursor. Uses idx_unknown_faces_timestamp.
+    """
+    clauses, params = [], []
+    if start and end:
+        clauses.append("timestamp >= ? AND timestamp < ?")
+        params += day_range(start, end)
+    if cursor:
+        ts, row_id = decode_cursor(cursor, 2)
+        # The leading bound keeps this an index range scan
+        clauses.append("timestamp <= ? AND (timestamp < ? OR id < ?)")
+        params += [ts, ts, row_id]
+    sql = f"""
+        SELECT id, name, timestamp, snapshot_path
+          FROM unknown_faces{_where(clauses)}
+         ORDER BY timestamp DESC, id DESC
+    """
+    return sql, params
+
+
+def event_cursor(row):
+    return encode_cursor(row["timestamp"], row["id"])
+
+
+def attendance_query(start=None, end=None, cursor=None):
+    """
+    (sql, params) for employee_log, newest date first then by name, optionally
+    within [start, end] and after a cursor. Uses idx_employee_log_date_name.
+    """
+    clauses, params = [], []
+    if start and end:
+        clauses.append("date >= ? AND date < ?")
+        params += day_range(start, end)
+    if cursor:
+        day, name = decode_cursor(cursor, 2)
+        clauses.append("date <= ? AND (date < ? OR employee_name > ?)")
+        params += [day, day, name]
+    sql = f"""
+        SELECT employee_name AS name,
+               date            AS date,
+               first_seen,
+               last_seen
+          FROM employee_log{_where(clauses)}
+         ORDER BY date DESC, employee_name
+    """
+    return sql, params
+
+
+def attendance_cursor(row):
+    return encode_cursor(row["date"], row["name"])
+
+
+def iter_rows(sql, params, limit=None, db_path="alerts.db", batch=QUERY_BATCH_SIZE):
+    """
+    Yield sqlite3.Row objects in batches of `batch` from their own connection,
+    so callers can stream large results. The connection is closed when the
+    generator finishes or is closed.
+    """
+    if limit:
+        sql += " LIMIT ?"
+        params = list(params) + [limit]
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        cur = conn.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
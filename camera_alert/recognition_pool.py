@@ -0,0 +1,316 @@
+# camera_alert/recognition_pool.py
+
+import os
+import queue
+import itertools
+import threading
+import time
+import multiprocessing as mp
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from camera_alert.matcher import GalleryMatcher
+
+# ── Pool settings ─────────────────────────────────────────────────────────────
+RECOGNITION_PROCESSES = int(os.getenv("RECOGNITION_PROCESSES", "0"))     # 0 = in-process
+RECOGNITION_TIMEOUT   = float(os.getenv("RECOGNITION_TIMEOUT", "5.0"))   # s per task
+
+
+def _worker_main(task_q, result_q, encodings, names, tolerance):
+    """Worker process: keeps its own gallery and serves detect/encode tasks."""
+    import face_recognition
+
+    gallery = GalleryMatcher(encodings, names)
+    attached = {}
+
+    while True:
+        msg = task_q.get()
+        if msg is None:
+            break
+        kind = msg[0]
+        if kind == "gallery":
+            gallery = GalleryMatcher(msg[1], msg[2])
+            continue
+
+        _, task_id, shm_name, shape, payload = msg
+        try:
+            shm = attached.get(shm_name)
+            if shm is None:
+                if len(attached) > 64:
+                    for old in attached.values():
+                        old.close()
+                    attached.clear()
+                # Spawned workers share the parent's resource tracker, so
+                # attaching here does not make the worker own the segment
+                shm = attached[shm_name] = shared_memory.SharedMemory(name=shm_name)
+            rgb = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+
+            if kind == "detect":
+                regions, upsample, model = payload
+                if regions is None:
+                    result = face_recognition.face_locations(rgb, upsample, model)
+                else:
+                    result = []
+                    for top, right, bottom, left in regions:
+                        crop = rgb[top:bottom, left:right]
+                        for t, r, b, l in face_recognition.face_locations(crop, upsample, model):
+                            result.append((t + top, r + left, b + top, l + left))
+            else:   # "encode"
+                encs = face_recognition.face_encodings(rgb, payload)
+                matches, _ = gallery.best(encs, tolerance)
+                result = (encs, matches)
+            del rgb
+            result_q.put((task_id, True, result))
+        except Exception as e:
+            result_q.put((task_id, False, repr(e)))
+
+    for shm in attached.values():
+        shm.close()
+
+
+class FrameHandle:
+    """A frame copied into a shared-memory slot; tasks read it in place."""
+
+    def __init__(self, pool, slot, shape):
+        self.pool = pool
+        self.slot = slot
+        self.shape = shape
+
+    def detect(self, regions=None, upsample=1, model="hog"):
+        """Face locations in the frame (optionally only inside regions)."""
+        return self.pool._run("detect", self, (regions, upsample, model))
+
+    def encode(self, locations):
+        """(encodings, matched names or None) for the given locations."""
+        if not locations:
+            return [], []
+        return self.pool._run("encode", self, list(locations))
+
+    def release(self):
+        """Return the slot to the pool; the handle must not be used after."""
+        if self.slot is not None:
+            self.pool._release(self.slot)
+            self.slot = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class RecognitionPool:
+    """
+    Runs face detection and encoding in worker processes.
+
+    Frames are written once into a shared-memory slot and read in place by
+    the workers instead of being pickled. Each worker loads the gallery at
+    start and matches encodings itself; set_gallery() broadcasts a new one.
+    Tasks go to the worker with the fewest tasks in flight and complete in
+    no particular order; callers that need frame order keep it themselves
+    (an ordered Stage reorders results, FaceTracker ignores older frames).
+
+    A slot released while a task on it is still running is only reused once
+    the worker has answered. A worker that does not answer within timeout
+    is terminated, and one that dies is replaced; either way its unanswered
+    tasks fail and their slots are freed.
+    """
+
+    def __init__(self, encodings, names, tolerance, workers=None,
+                 timeout=RECOGNITION_TIMEOUT):
+        self.workers = workers or RECOGNITION_PROCESSES or os.cpu_count() or 1
+        self.timeout = timeout
+        self.tolerance = tolerance
+
+        self._ctx = mp.get_context("spawn")
+        self._result_q = self._ctx.Queue()
+        self._gallery = (np.asarray(encodings, dtype=np.float32).reshape(-1, 128), list(names))
+        self._task_qs = [None] * self.workers
+        self._procs = [None] * self.workers
+        for i in range(self.workers):
+            self._spawn(i)
+
+        # Two slots per worker keep every worker busy while frames are copied
+        self._free_slots = queue.Queue()
+        self._slots = [None] * (self.workers * 2)
+        for i in range(len(self._slots)):
+            self._free_slots.put(i)
+        self._slot_tasks = [0] * len(self._slots)   # unanswered tasks reading each slot
+        self._released = set()                      # released slots waiting on those tasks
+
+        self._ids = itertools.count()
+        self._pending = {}          # task_id -> (Future, worker index, slot)
+        self._inflight = [0] * self.workers
+        self._lock = threading.Lock()
+        self._closing = False
+        self.timeouts = 0
+        self.respawns = 0
+        self._collector = threading.Thread(
+            target=self._collect, name="recognition-results", daemon=True
+        )
+        self._collector.start()
+
+    def _spawn(self, i):
+        """Start worker i with a fresh task queue and the current gallery."""
+        q = self._ctx.Queue()
+        encodings, names = self._gallery
+        p = self._ctx.Process(
+            target=_worker_main, name=f"recognition-{i}", daemon=True,
+            args=(q, self._result_q, encodings, names, self.tolerance),
+        )
+        p.start()
+        self._task_qs[i] = q
+        self._procs[i] = p
+
+    # -- frames --
+    def frame(self, rgb, timeout=None):
+        """Copy an RGB uint8 frame into a free slot; use as a context manager."""
+        try:
+            slot = self._free_slots.get(timeout=timeout or self.timeout)
+        except queue.Empty:
+            raise FutureTimeout("no free shared-memory slot")
+        rgb = np.ascontiguousarray(rgb, dtype=np.uint8)
+        shm = self._slots[slot]
+        if shm is None or shm.size < rgb.nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = self._slots[slot] = shared_memory.SharedMemory(
+                create=True, size=rgb.nbytes
+            )
+        view = np.ndarray(rgb.shape, dtype=np.uint8, buffer=shm.buf)
+        view[...] = rgb
+        del view
+        return FrameHandle(self, slot, rgb.shape)
+
+    def _release(self, slot):
+        with self._lock:
+            if self._slot_tasks[slot]:
+                # A worker may still be reading it; _done() frees it later
+                self._released.add(slot)
+                return
+        self._free_slots.put(slot)
+
+    def _done(self, task_id):
+        """Forget an answered (or lost) task; returns its Future or None. Holds _lock."""
+        future, worker, slot = self._pending.pop(task_id, (None, None, None))
+        if worker is None:
+            return None
+        self._inflight[worker] -= 1
+        self._slot_tasks[slot] -= 1
+        if not self._slot_tasks[slot] and slot in self._released:
+            self._released.discard(slot)
+            self._free_slots.put(slot)
+        return future
+
+    # -- tasks --
+    def _submit(self, kind, handle, payload):
+        future = Future()
+        with self._lock:
+            task_id = next(self._ids)
+            worker = min(range(self.workers), key=self._inflight.__getitem__)
+            self._inflight[worker] += 1
+            self._slot_tasks[handle.slot] += 1
+            self._pending[task_id] = (future, worker, handle.slot)
+            task_q = self._task_qs[worker]
+        task_q.put(
+            (kind, task_id, self._slots[handle.slot].name, handle.shape, payload)
+        )
+        return task_id, future
+
+    def _run(self, kind, handle, payload):
+        task_id, future = self._submit(kind, handle, payload)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            with self._lock:
+                _, worker, _ = self._pending.get(task_id, (None, None, None))
+                proc = self._procs[worker] if worker is not None else None
+            if proc is not None:
+                # A hung worker would hold its slots forever
+                self._restart(worker, proc, f"did not answer within {self.timeout:g}s")
+            raise
+
+    def _collect(self):
+        next_check = 0.0
+        while True:
+            try:
+                msg = self._result_q.get(timeout=1.0)
+            except queue.Empty:
+                msg = ()
+            if msg is None:
+                break
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + 1.0
+            if not msg:
+                continue
+            task_id, ok, result = msg
+            with self._lock:
+                future = self._done(task_id)
+            if future is None or future.done():
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(result))
+
+    def _check_workers(self):
+        """Replace dead workers."""
+        for i, p in enumerate(list(self._procs)):
+            if not p.is_alive():
+                self._restart(i, p, f"exited with code {p.exitcode}")
+
+    def _restart(self, i, proc, why):
+        """Replace worker i, if it is still proc, and fail the tasks it will never answer."""
+        if self._closing:
+            return
+        if proc.is_alive():
+            proc.terminate()
+            proc.join(timeout=2)
+        with self._lock:
+            if self._procs[i] is not proc:
+                return      # already replaced
+            print(f"[WARNING] Recognition worker {proc.name} {why}; restarting.")
+            lost = [tid for tid, (_, worker, _) in self._pending.items() if worker == i]
+            futures = [self._done(tid) for tid in lost]
+            self._spawn(i)
+            self.respawns += 1
+        for future in futures:
+            if future is not None and not future.done():
+                future.set_exception(RuntimeError(f"{proc.name} {why}"))
+
+    # -- gallery --
+    def set_gallery(self, encodings, names):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        with self._lock:
+            self._gallery = (encodings, list(names))
+            task_qs = list(self._task_qs)
+        for q in task_qs:
+            q.put(("gallery", encodings, list(names)))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "workers":  self.workers,
+                "inflight": sum(self._inflight),
+                "timeouts": self.timeouts,
+                "respawns": self.respawns,
+            }
+
+    def close(self):
+        self._closing = True
+        for q in self._task_qs:
+            q.put(None)
+        for p in self._procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        self._result_q.put(None)
+        for shm in self._slots:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
@@ -0,0 +1,217 @@
+# camera_alert/scheduler.py
+
+import os
+import threading
+import time
+
+from camera_alert import metrics
+
+# ── Scheduler settings ────────────────────────────────────────────────────────
+ANALYSIS_MOTION_FPS = float(os.getenv("ANALYSIS_MOTION_FPS", "5"))   # per camera, 0 = every motion frame
+ANALYSIS_IDLE_FPS   = float(os.getenv("ANALYSIS_IDLE_FPS", "0"))     # without motion, 0 = never
+SCHEDULER_HEADROOM  = float(os.getenv("SCHEDULER_HEADROOM", "0.8"))  # share of worker time to fill
+# Overloaded below DEGRADE_BELOW x the motion rate; recovered once the previous
+# (costlier) level's measured latency would allow RECOVER_ABOVE x. Each is held
+# for DEGRADE_HOLD seconds before the detection setting changes
+DEGRADE_BELOW       = float(os.getenv("DEGRADE_BELOW", "0.75"))
+RECOVER_ABOVE       = float(os.getenv("RECOVER_ABOVE", "1.0"))
+DEGRADE_HOLD        = float(os.getenv("DEGRADE_HOLD", "5"))
+DEGRADE_SCALES      = (0.75, 0.5)      # extra downscale steps after dropping upsampling
+
+_ACTIVE_WINDOW = 2.0    # s a camera counts as competing for workers after its last frame
+_RATIO_SAMPLES = 10     # analyses at a new level before its cost ratio is taken
+
+_SKIPPED = metrics.counter(
+    "camera_alert_frames_skipped_total", "Frames not analysed, by camera and reason",
+    ["camera", "reason"]
+)
+_DEGRADE = metrics.counter(
+    "camera_alert_degrade_changes_total", "Detection setting changes under load", ["direction"]
+)
+
+
+def degrade_ladder(scale, upsample):
+    """
+    (scale, upsample) detection settings from full quality to cheapest:
+    drop one level of upsampling first, then downscale further.
+    """
+    steps = [(scale, upsample)]
+    if upsample > 0:
+        steps.append((scale, upsample - 1))
+    for factor in DEGRADE_SCALES:
+        steps.append((scale * factor, steps[-1][1]))
+    return steps
+
+
+class _CameraState:
+    __slots__ = ("last_run", "last_seen")
+
+    def __init__(self):
+        self.last_run = 0.0
+        self.last_seen = 0.0
+
+
+class AnalysisScheduler:
+    """
+    Decides which frames are analysed and at what detection setting.
+
+    Each camera is analysed at most motion_fps while it has motion and
+    idle_fps otherwise. The interval also stretches with the measured
+    analysis latency so that the active cameras together use no more than
+    `headroom` of the workers; frames in between are skipped, and since the
+    frame queues keep only the newest frame, the next one analysed is the
+    freshest. When that still leaves less than DEGRADE_BELOW of motion_fps
+    for DEGRADE_HOLD seconds the scheduler steps down degrade_ladder().
+
+    Latency is averaged per level, since a cheaper level is much faster
+    (no upsampling is about 4x cheaper for HOG). On degrading, the ratio of
+    the old level's cost to the new one's is measured, and stepping back up
+    is judged on the current latency times that ratio (the previous level's
+    cost at today's load), once it would leave RECOVER_ABOVE of motion_fps.
+    Judging on the current level's own latency would recover and degrade
+    again every DEGRADE_HOLD.
+
+    One instance is shared by every camera on a FaceAnalyzer.
+    """
+
+    def __init__(self, motion_fps=ANALYSIS_MOTION_FPS, idle_fps=ANALYSIS_IDLE_FPS,
+                 workers=1, headroom=SCHEDULER_HEADROOM, adaptive=True):
+        self.motion_fps = motion_fps
+        self.idle_fps = idle_fps
+        self.workers = max(1, int(workers))
+        self.headroom = headroom
+        self.adaptive = adaptive
+
+        self.level = 0
+        self.max_level = len(DEGRADE_SCALES) + 1
+        self.latency = 0.0          # moving average of analysis time at the current level, s
+        self._latency = {}          # level -> moving average of analysis time, s
+        self._ratio = {}            # level -> its cost / the next level's, measured on degrading
+        self._samples = 0           # analyses since the level last changed
+        self.analysed = 0
+        self.skipped = {}           # reason -> frames
+        self.degraded = 0
+        self.recovered = 0
+        self._cameras = {}
+        self._pressure_since = None
+        self._relief_since = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def unlimited(cls):
+        """Analyse every motion frame at full quality (benchmarks, tests)."""
+        return cls(motion_fps=0, idle_fps=0, adaptive=False)
+
+    def _skip(self, camera, reason):
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+        _SKIPPED.labels(camera or "", reason).inc()
+        return False
+
+    def _active(self, now):
+        return max(1, sum(1 for s in self._cameras.values()
+                          if now - s.last_seen < _ACTIVE_WINDOW))
+
+    def _capacity(self, now, latency=None):
+        """Analyses per second each active camera can get from the workers."""
+        latency = self.latency if latency is None else latency
+        if not self.adaptive or latency <= 0:
+            return float("inf")
+        return self.workers * self.headroom / (latency * self._active(now))
+
+    def admit(self, camera, motion, now=None):
+        """True if this frame should be analysed now; counts the skip otherwise."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            state = self._cameras.get(camera)
+            if state is None:
+                state = self._cameras[camera] = _CameraState()
+            state.last_seen = now
+
+            target = self.motion_fps if motion else self.idle_fps
+            if not motion and target <= 0:
+                return self._skip(camera, "idle")
+
+            capacity = self._capacity(now)
+            rate = min(target, capacity) if target > 0 else capacity
+            if rate == float("inf"):
+                state.last_run = now
+                return True
+            interval = 1.0 / rate
+            if now - state.last_run < interval:
+                return self._skip(camera, "rate" if rate == target else "load")
+
+            # Advance on the schedule rather than to now, so frame timing
+            # jitter does not erode the rate; resync after a pause
+            late = now - state.last_run >= 2 * interval
+            state.last_run = now if late else state.last_run + interval
+            return True
+
+    def record(self, latency, now=None):
+        """Feed one analysis time; may move the degrade level."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            self.analysed += 1
+            # A level's average restarts when it is entered, so it reflects today's load
+            avg = self._latency.get(self.level) if self._samples else None
+            self.latency = self._latency[self.level] = (
+                latency if not avg else 0.8 * avg + 0.2 * latency
+            )
+            self._samples += 1
+            prev = self.level - 1
+            if prev >= 0 and prev not in self._ratio and self._samples >= _RATIO_SAMPLES:
+                self._ratio[prev] = self._latency[prev] / max(self.latency, 1e-6)
+            if not self.adaptive or self.motion_fps <= 0:
+                return
+
+            capacity = self._capacity(now)
+            # What the costlier level would cost now
+            above = self.latency * self._ratio[prev] if prev in self._ratio else None
+            if capacity < DEGRADE_BELOW * self.motion_fps:
+                self._relief_since = None
+                self._pressure_since = self._pressure_since or now
+                if now - self._pressure_since >= DEGRADE_HOLD:
+                    self._change(+1)
+            elif above and self._capacity(now, above) > RECOVER_ABOVE * self.motion_fps:
+                self._pressure_since = None
+                self._relief_since = self._relief_since or now
+                if now - self._relief_since >= DEGRADE_HOLD:
+                    self._change(-1)
+            else:
+                self._pressure_since = self._relief_since = None
+
+    def _change(self, step):
+        level = max(0, min(self.level + step, self.max_level))
+        self._pressure_since = self._relief_since = None
+        if level == self.level:
+            return
+        if step > 0:
+            self._ratio.pop(self.level, None)   # re-measured against the new level
+        self.level = level
+        self._samples = 0
+        if step > 0:
+            self.degraded += 1
+            _DEGRADE.labels("degrade").inc()
+            print(f"[WARNING] Analysis overloaded; detection degraded to level {level}.")
+        else:
+            self.recovered += 1
+            _DEGRADE.labels("recover").inc()
+            print(f"[INFO] Analysis load eased; detection back to level {level}.")
+
+    def settings(self, scale, upsample):
+        """Detection (scale, upsample) for the current level, from the base setting."""
+        ladder = degrade_ladder(scale, upsample)
+        with self._lock:
+            self.max_level = len(ladder) - 1
+            return ladder[min(self.level, self.max_level)]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "level":      self.level,
+                "latency_ms": round(self.latency * 1000, 1),
+                "level_latency_ms": {lv: round(v * 1000, 1) for lv, v in sorted(self._latency.items())},
+                "analysed":   self.analysed,
+                "skipped":    dict(self.skipped),
+                "degraded":   self.degraded,
+                "recovered":  self.recovered,
+            }
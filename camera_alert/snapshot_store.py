@@ -0,0 +1,227 @@
+# camera_alert/snapshot_store.py
+
+import os
+import re
+import atexit
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+
+import cv2
+
+from camera_alert import metrics
+
+# ── Snapshot settings ─────────────────────────────────────────────────────────
+SNAPSHOT_DIR            = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_QUALITY        = int(os.getenv("SNAPSHOT_QUALITY", "95"))
+THUMBNAIL_WIDTH         = int(os.getenv("THUMBNAIL_WIDTH", "320"))
+THUMBNAIL_QUALITY       = int(os.getenv("THUMBNAIL_QUALITY", "70"))
+SNAPSHOT_RETENTION_DAYS = float(os.getenv("SNAPSHOT_RETENTION_DAYS", "30"))  # 0 = keep forever
+SNAPSHOT_MAX_MB         = float(os.getenv("SNAPSHOT_MAX_MB", "0"))           # 0 = no budget
+SNAPSHOT_SWEEP_INTERVAL = float(os.getenv("SNAPSHOT_SWEEP_INTERVAL", "3600"))
+SNAPSHOT_QUEUE_SIZE     = int(os.getenv("SNAPSHOT_QUEUE_SIZE", "32"))
+
+THUMB_DIR = "thumbs"
+_DATE_DIR = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+_WRITE_SECONDS = metrics.histogram(
+    "camera_alert_snapshot_write_seconds", "Time to encode and write a snapshot and its thumbnail"
+)
+
+
+def shard_path(filename, when=None, folder=SNAPSHOT_DIR):
+    """folder/YYYY-MM-DD/filename for the day a snapshot was taken."""
+    day = (when or datetime.now()).strftime("%Y-%m-%d")
+    return os.path.join(folder, day, filename)
+
+
+def thumbnail_path(path):
+    """Thumbnail that sits next to a full snapshot: <day>/thumbs/<name>."""
+    head, name = os.path.split(path)
+    return os.path.join(head, THUMB_DIR, name)
+
+
+def _write_jpeg(path, img, quality):
+    """Encode and write atomically, so readers never see a partial file."""
+    ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise ValueError(f"JPEG encode failed for {path}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(buf.tobytes())
+    os.replace(tmp, path)
+    return len(buf)
+
+
+def make_thumbnail(frame, width=THUMBNAIL_WIDTH):
+    h, w = frame.shape[:2]
+    if w <= width:
+        return frame
+    size = (width, max(1, round(h * width / w)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def sweep_snapshots(folder=SNAPSHOT_DIR, retention_days=SNAPSHOT_RETENTION_DAYS,
+                    max_mb=SNAPSHOT_MAX_MB, today=None):
+    """
+    Delete date directories older than retention_days, then the oldest
+    snapshots until the rest fit in max_mb. Only YYYY-MM-DD directories
+    are touched. Returns the number of files removed.
+    """
+    try:
+        days = sorted(d for d in os.listdir(folder)
+                      if _DATE_DIR.match(d) and os.path.isdir(os.path.join(folder, d)))
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    if retention_days:
+        cutoff = ((today or datetime.now()) - timedelta(days=retention_days)).strftime("%Y-%m-%d")
+        while days and days[0] < cutoff:
+            day_dir = os.path.join(folder, days.pop(0))
+            removed += sum(len(files) for _, _, files in os.walk(day_dir))
+            shutil.rmtree(day_dir, ignore_errors=True)
+
+    if max_mb:
+        budget = max_mb * 1024 * 1024
+        files = []      # (mtime, size, path) of every full snapshot + thumbnail
+        for day in days:
+            for root, _, names in os.walk(os.path.join(folder, day)):
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        files.sort()
+        for _, size, path in files:
+            if total <= budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+
+    if removed:
+        print(f"[INFO] Snapshot retention removed {removed} files from {folder}")
+    return removed
+
+
+class SnapshotWriter(threading.Thread):
+    """
+    Encodes and writes snapshots off the calling thread.
+
+    submit() returns the final path straight away; the full-quality JPEG
+    and a THUMBNAIL_WIDTH thumbnail are written in the background under a
+    per-day directory. The retention sweep runs on the same thread every
+    SNAPSHOT_SWEEP_INTERVAL seconds.
+    """
+
+    def __init__(self, folder=SNAPSHOT_DIR, quality=SNAPSHOT_QUALITY,
+                 thumb_width=THUMBNAIL_WIDTH, thumb_quality=THUMBNAIL_QUALITY,
+                 sweep_interval=SNAPSHOT_SWEEP_INTERVAL, max_pending=SNAPSHOT_QUEUE_SIZE):
+        super().__init__(name=f"snapshot-writer:{folder}", daemon=True)
+        self.folder = folder
+        self.quality = quality
+        self.thumb_width = thumb_width
+        self.thumb_quality = thumb_quality
+        self.sweep_interval = sweep_interval
+        self.written = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stop_event = threading.Event()
+
+    def submit(self, frame, filename):
+        """Queue frame for writing and return the path it will have."""
+        path = shard_path(filename, folder=self.folder)
+        # Blocks when the writer falls behind, pushing back on the I/O stage
+        self._queue.put((path, frame))
+        return path
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far is on disk."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=10):
+        if self.is_alive():
+            self.flush(timeout)
+        self._stop_event.set()
+        self.join(timeout=timeout)
+
+    def run(self):
+        next_sweep = time.time()
+        while not self._stop_event.is_set():
+            if self.sweep_interval and time.time() >= next_sweep:
+                next_sweep = time.time() + self.sweep_interval
+                try:
+                    sweep_snapshots(self.folder)
+                except OSError as e:
+                    print(f"[ERROR] Snapshot sweep failed: {e}")
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            self._write(*item)
+
+    def _write(self, path, frame):
+        try:
+            with _WRITE_SECONDS.time():
+                self.bytes_written += _write_jpeg(path, frame, self.quality)
+                thumb = make_thumbnail(frame, self.thumb_width)
+                self.bytes_written += _write_jpeg(thumbnail_path(path), thumb, self.thumb_quality)
+            self.written += 1
+        except (OSError, ValueError, cv2.error) as e:
+            self.errors += 1
+            print(f"[ERROR] Could not write snapshot {path}: {e}")
+
+    def snapshot(self):
+        return {
+            "pending":       self._queue.qsize(),
+            "written":       self.written,
+            "bytes_written": self.bytes_written,
+            "errors":        self.errors,
+        }
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_snapshot_writer(folder=SNAPSHOT_DIR):
+    """The shared SnapshotWriter for folder, started on first use."""
+    with _writers_lock:
+        writer = _writers.get(folder)
+        if writer is None or not writer.is_alive():
+            writer = _writers[folder] = SnapshotWriter(folder)
+            writer.start()
+        return writer
+
+
+def close_snapshot_writers(timeout=10):
+    """Write out pending snapshots and stop every writer; called on shutdown."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close(timeout)
+
+
+atexit.register(close_snapshot_writers)
+
+metrics.gauge_fn(
+    "camera_alert_snapshot_pending", "Snapshots queued for writing",
+    lambda: sum(w._queue.qsize() for w in list(_writers.values()))
+)
@@ -0,0 +1,285 @@
+# camera_alert/streaming.py
+
+import os
+import time
+import threading
+from collections import OrderedDict, namedtuple
+import cv2
+import numpy as np
+
+from camera_alert.utils import redact_url
+
+STREAM_JPEG_QUALITY = int(os.getenv("STREAM_JPEG_QUALITY", "60"))
+STREAM_LINGER       = float(os.getenv("STREAM_LINGER", "5"))  # s to keep capturing with no viewers
+STREAM_MAX_FPS      = float(os.getenv("STREAM_MAX_FPS", "15"))
+STREAM_MAX_VARIANTS = int(os.getenv("STREAM_MAX_VARIANTS", "8"))
+STREAM_KEEPALIVE    = float(os.getenv("STREAM_KEEPALIVE", "2"))    # s between repeats with no new frame
+STREAM_NO_SIGNAL    = float(os.getenv("STREAM_NO_SIGNAL", "60"))   # s without frames before closing
+
+# An encoded variant of the stream: target width (None = native) and JPEG quality
+StreamProfile = namedtuple("StreamProfile", ["width", "quality"])
+
+# Auto mode steps down this ladder when the client cannot keep up
+AUTO_LADDER = [
+    StreamProfile(None, 70),
+    StreamProfile(1280, 60),
+    StreamProfile(960, 55),
+    StreamProfile(640, 50),
+    StreamProfile(480, 45),
+    StreamProfile(320, 40),
+]
+
+
+def make_profile(width=None, quality=None):
+    """Clamp client-supplied values and snap width to a multiple of 32,
+    so near-identical requests share one cached encode."""
+    if width:
+        width = max(160, min(3840, int(width) // 32 * 32))
+    quality = max(10, min(95, int(quality or STREAM_JPEG_QUALITY)))
+    return StreamProfile(width or None, quality)
+
+
+_placeholder = None
+
+
+def no_signal_jpeg():
+    """A small "No signal" JPEG shown until the camera delivers a frame."""
+    global _placeholder
+    if _placeholder is None:
+        img = np.zeros((360, 640, 3), np.uint8)
+        cv2.putText(img, "No signal", (215, 190), cv2.FONT_HERSHEY_SIMPLEX,
+                    1.2, (200, 200, 200), 2, cv2.LINE_AA)
+        _placeholder = cv2.imencode(".jpg", img)[1].tobytes()
+    return _placeholder
+
+
+class _Variant:
+    __slots__ = ("seq", "jpeg", "lock")
+
+    def __init__(self):
+        self.seq = 0
+        self.jpeg = None
+        self.lock = threading.Lock()
+
+
+class AutoQuality:
+    """
+    Adapts a viewer's profile and frame rate to its connection.
+
+    The WSGI server resumes a streaming generator only after the previous
+    chunk has been written to the socket, so the time spent in `yield` is
+    how long the write blocked on a full send buffer. Slow writes step down
+    AUTO_LADDER (then halve the frame rate); sustained fast writes step back up.
+    """
+
+    def __init__(self, max_fps):
+        self.max_fps = max_fps
+        self.fps = max_fps
+        self.level = 0
+        self._fast = 0
+
+    @property
+    def profile(self):
+        return AUTO_LADDER[self.level]
+
+    def observe(self, write_seconds):
+        budget = 1.0 / self.fps
+        if write_seconds > 0.5 * budget:
+            self._fast = 0
+            if self.level < len(AUTO_LADDER) - 1:
+                self.level += 1
+            else:
+                self.fps = max(1.0, self.fps / 2)
+        elif write_seconds < 0.1 * budget:
+            self._fast += 1
+            if self._fast >= 3 * self.fps:        # ~3 s of headroom
+                self._fast = 0
+                if self.fps < self.max_fps:
+                    self.fps = min(self.max_fps, self.fps * 2)
+                elif self.level > 0:
+                    self.level -= 1
+
+
+class FrameBroadcaster:
+    """
+    One capture loop per camera that publishes the latest frame to any
+    number of viewers.
+
+    The loop starts with the first subscriber and stops STREAM_LINGER
+    seconds after the last one leaves. Every viewer simply takes the newest
+    frame when it is ready for one, so a slow client skips frames instead
+    of holding back the others. Frames are JPEG-encoded lazily per
+    StreamProfile and cached, so viewers asking for the same profile share
+    one encode per frame.
+    """
+
+    def __init__(self, source, quality=STREAM_JPEG_QUALITY, linger=STREAM_LINGER,
+                 max_variants=STREAM_MAX_VARIANTS):
+        self.source = source
+        self.label = redact_url(source)     # for logs; the URL may carry credentials
+        self.quality = quality
+        self.linger = linger
+        self.max_variants = max_variants
+
+        self._cond = threading.Condition()
+        self._subscribers = 0
+        self._frame = None
+        self._seq = 0
+        self._thread = None
+        self._variants = OrderedDict()      # StreamProfile -> _Variant, LRU
+        self._variants_lock = threading.Lock()
+        self.frames_encoded = 0
+
+    # -- viewers --
+    def subscribe(self):
+        with self._cond:
+            self._subscribers += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"broadcast:{self.label}", daemon=True
+                )
+                self._thread.start()
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+            self._cond.notify_all()
+
+    def wait_frame(self, after_seq, timeout=5.0):
+        """Block until a frame newer than after_seq exists; (seq, frame) or (after_seq, None)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq, timeout)
+            if self._seq > after_seq:
+                return self._seq, self._frame
+            return after_seq, None
+
+    def encoded(self, seq, frame, profile):
+        """JPEG for frame `seq` in `profile`, encoding it at most once."""
+        with self._variants_lock:
+            variant = self._variants.get(profile)
+            if variant is None:
+                variant = self._variants[profile] = _Variant()
+                while len(self._variants) > self.max_variants:
+                    self._variants.popitem(last=False)
+            else:
+                self._variants.move_to_end(profile)
+
+        with variant.lock:
+            if variant.seq < seq:
+                img = frame
+                h, w = frame.shape[:2]
+                if profile.width and profile.width < w:
+                    size = (profile.width, max(1, round(h * profile.width / w)))
+                    img = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                ok, buf = cv2.imencode(
+                    ".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), profile.quality]
+                )
+                if ok:
+                    variant.seq, variant.jpeg = seq, buf.tobytes()
+                    self.frames_encoded += 1
+            return variant.jpeg
+
+    def frames(self, max_fps=STREAM_MAX_FPS, profile=None, auto=False,
+               keepalive=STREAM_KEEPALIVE, no_signal=STREAM_NO_SIGNAL):
+        """
+        Generator of JPEG bytes for one viewer; unsubscribes when closed.
+        With auto=True the profile and frame rate follow AutoQuality.
+
+        While the camera delivers nothing, the last JPEG (or a "No signal"
+        image) is repeated every `keepalive` seconds so the viewer and any
+        proxy see the connection is alive; after `no_signal` seconds without
+        a frame the stream ends.
+        """
+        profile = profile or make_profile(quality=self.quality)
+        tuner = AutoQuality(max_fps) if auto else None
+        self.subscribe()
+        try:
+            seq = 0
+            next_at = 0.0
+            last_jpg = None
+            last_frame_at = time.time()
+            while True:
+                fps = tuner.fps if tuner else max_fps
+                delay = next_at - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+                seq, frame = self.wait_frame(seq, timeout=keepalive)
+                if frame is None:
+                    if time.time() - last_frame_at >= no_signal:
+                        print(f"[WARNING] No frames from {self.label} for {no_signal:.0f}s; closing stream.")
+                        return
+                    yield last_jpg or no_signal_jpeg()
+                    continue
+                last_frame_at = time.time()
+                jpg = self.encoded(seq, frame, tuner.profile if tuner else profile)
+                if jpg is None:
+                    continue
+
+                last_jpg = jpg
+                next_at = time.time() + 1.0 / fps
+                t0 = time.time()
+                yield jpg
+                if tuner:
+                    tuner.observe(time.time() - t0)
+        finally:
+            self.unsubscribe()
+
+    # -- capture loop --
+    def _run(self):
+        cap = None
+        idle_since = None
+        try:
+            while True:
+                with self._cond:
+                    if self._subscribers > 0:
+                        idle_since = None
+                    elif idle_since is None:
+                        idle_since = time.time()
+                    elif time.time() - idle_since >= self.linger:
+                        self._thread = None
+                        return
+
+                if cap is None or not cap.isOpened():
+                    cap = cv2.VideoCapture(self.source)
+                    if not cap.isOpened():
+                        print(f"[ERROR] Cannot open stream for preview: {self.label}")
+                        time.sleep(2)
+                        continue
+
+                ret, frame = cap.read()
+                if not ret:
+                    cap.release()
+                    cap = None
+                    time.sleep(1)
+                    continue
+
+                with self._cond:
+                    self._frame = frame
+                    self._seq += 1
+                    self._cond.notify_all()
+        finally:
+            if cap is not None:
+                cap.release()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "subscribers":    self._subscribers,
+                "running":        self._thread is not None,
+                "frames_encoded": self.frames_encoded,
+                "variants":       len(self._variants),
+            }
+
+
+_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+
+
+def get_broadcaster(source):
+    """The shared FrameBroadcaster for source, created on first use."""
+    with _broadcasters_lock:
+        b = _broadcasters.get(source)
+        if b is None:
+            b = _broadcasters[source] = FrameBroadcaster(source)
+        return b
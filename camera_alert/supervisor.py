@@ -0,0 +1,181 @@
+# camera_alert/supervisor.py
+
+import os
+import json
+import threading
+import time
+
+from camera_alert.analysis import dispatch_alert
+from camera_alert.clips import get_clip_recorder
+from camera_alert.motion_detector import MotionDetector
+from camera_alert.pipeline import (
+    ANALYSIS_WORKERS, FRAME_QUEUE_SIZE, IO_QUEUE_SIZE, SHUTDOWN_DRAIN_TIMEOUT,
+    STATS_INTERVAL, CaptureThread, DropOldestQueue, FairQueue, Stage, StageStats,
+    format_stats
+)
+from camera_alert.utils import open_rtsp_stream
+
+
+def load_camera_definitions(path=None):
+    """
+    Read camera definitions from a JSON file (path or $CAMERAS_FILE) or from
+    inline JSON in $CAMERAS. Each entry needs "name" and "rtsp":
+
+        [{"name": "gate", "rtsp": "rtsp://..."}, ...]
+
+    Optional per-camera motion settings: "roi" (polygons of [x, y] points in
+    frame fractions) and "motion_min_area" (full-resolution pixels).
+
+    Returns an empty list when nothing is configured.
+    """
+    path = path or os.getenv("CAMERAS_FILE")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            cameras = json.load(f)
+    elif os.getenv("CAMERAS"):
+        cameras = json.loads(os.getenv("CAMERAS"))
+    else:
+        return []
+
+    names = set()
+    for cam in cameras:
+        if not cam.get("name") or not cam.get("rtsp"):
+            raise ValueError(f"Camera definition needs 'name' and 'rtsp': {cam}")
+        if cam["name"] in names:
+            raise ValueError(f"Duplicate camera name: {cam['name']}")
+        names.add(cam["name"])
+    return cameras
+
+
+class CameraWorker:
+    """
+    Capture and motion-gating stages for a single camera. admit(packet)
+    decides which gated frames go on to recognition.
+    """
+
+    def __init__(self, definition, recognition_queue, admit=lambda packet: bool(packet.motion)):
+        self.name = definition["name"]
+        self.rtsp_url = definition["rtsp"]
+        self.recognition_queue = recognition_queue
+        self.admit = admit
+
+        self.frames = DropOldestQueue(FRAME_QUEUE_SIZE)
+        self.motion_detector = MotionDetector(
+            min_area=definition.get("motion_min_area"),
+            roi=definition.get("roi"),
+        )
+        self.recognition = StageStats(f"{self.name}.recognition")
+        self.cam = None
+        self.capture = None
+        self.motion = None
+
+    def start(self):
+        print(f"[INFO] [{self.name}] Connecting to RTSP stream: {self.rtsp_url}")
+        self.cam = open_rtsp_stream(self.rtsp_url)
+        if self.cam is None:
+            print(f"[WARNING] [{self.name}] Could not open RTSP stream; retrying in the background.")
+
+        self.capture = CaptureThread(
+            self.cam, self.frames, name=f"{self.name}.capture", camera=self.name,
+            opener=lambda: open_rtsp_stream(self.rtsp_url),
+            recorder=get_clip_recorder(self.name)
+        )
+        self.motion = Stage(
+            f"{self.name}.motion", self._gate, self.frames, self.recognition_queue
+        )
+        self.motion.start()
+        self.capture.start()
+
+    def _gate(self, packet):
+        packet.motion = self.motion_detector.detect(packet.context)
+        if self.admit(packet):
+            return [packet]
+        packet.release()
+        return None
+
+    def stop(self, drain_timeout=0.0):
+        if self.capture:
+            self.capture.stop()     # also releases the stream
+        if self.motion:
+            self.motion.stop(drain_timeout=drain_timeout)
+
+    def snapshot(self):
+        snap = {
+            "capture":     self.capture.snapshot(),
+            "motion":      self.motion.snapshot(),
+            "recognition": self.recognition.snapshot(),
+        }
+        snap["recognition"]["depth"] = self.recognition_queue.depth_of(self.name)
+        snap["recognition"]["dropped"] = self.recognition_queue.dropped_by_key.get(self.name, 0)
+        return snap
+
+
+class CameraSupervisor:
+    """
+    Monitors N cameras in one process.
+    Each camera has its own capture and motion stages; recognition runs on a
+    shared worker pool that serves cameras round-robin, and the face gallery,
+    unknown clusters and DB/alert I/O stage are shared by all of them.
+    """
+
+    def __init__(self, definitions, analyzer, workers=ANALYSIS_WORKERS):
+        self.analyzer = analyzer
+        self.recognition_queue = FairQueue(1)
+        self.io_queue = DropOldestQueue(IO_QUEUE_SIZE)
+        self.cameras = {
+            d["name"]: CameraWorker(d, self.recognition_queue, analyzer.admit)
+            for d in definitions
+        }
+        self.recognition = Stage(
+            "recognition", self._recognize, self.recognition_queue,
+            self.io_queue, workers=workers, ordered=True
+        )
+        self.io = Stage("io", dispatch_alert, self.io_queue)
+
+    def _recognize(self, packet):
+        t0 = time.time()
+        try:
+            _, jobs = self.analyzer.analyze(packet)
+        finally:
+            packet.release()
+        t1 = time.time()
+        self.cameras[packet.camera].recognition.record(t1 - t0, t1 - packet.captured_at)
+        return jobs
+
+    def start(self):
+        self.io.start()
+        self.recognition.start()
+        for cam in self.cameras.values():
+            cam.start()
+
+    def stop(self):
+        """Stop capture, then drain each stage in pipeline order."""
+        for cam in self.cameras.values():
+            cam.stop(drain_timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        self.recognition.stop(drain_timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        self.io.stop(drain_timeout=SHUTDOWN_DRAIN_TIMEOUT)
+
+    def stats(self):
+        stats = {}
+        for name, cam in self.cameras.items():
+            for stage, snap in cam.snapshot().items():
+                stats[f"{name}.{stage}"] = snap
+        stats["recognition"] = self.recognition.snapshot()
+        stats["io"] = self.io.snapshot()
+        stats["scheduler"] = self.analyzer.scheduler.snapshot()
+        return stats
+
+    def run(self, stats_interval=STATS_INTERVAL, stop_event=None):
+        """Supervise until stop_event is set or Ctrl+C, then drain and stop."""
+        stop_event = stop_event or threading.Event()
+        self.start()
+        print(f"[INFO] Supervising {len(self.cameras)} camera(s)... Ctrl+C to quit.")
+        try:
+            while not stop_event.wait(stats_interval or 1):
+                if stats_interval:
+                    print("[STATS] " + format_stats(self.stats()))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print("[INFO] Shutting down...")
+            self.stop()
@@ -0,0 +1,167 @@
+# camera_alert/tracker.py
+
+import os
+import time
+import threading
+import numpy as np
+
+# ── Tracker settings ──────────────────────────────────────────────────────────
+TRACK_IOU_THRESHOLD = float(os.getenv("TRACK_IOU_THRESHOLD", "0.3"))
+TRACK_MAX_AGE       = float(os.getenv("TRACK_MAX_AGE", "2.0"))        # s unseen before drop
+TRACK_IDENTITY_TTL  = float(os.getenv("TRACK_IDENTITY_TTL", "10.0"))  # s, known faces
+TRACK_UNKNOWN_TTL   = float(os.getenv("TRACK_UNKNOWN_TTL", "2.0"))    # s, unknown faces
+TRACK_MOVE_RATIO    = float(os.getenv("TRACK_MOVE_RATIO", "0.5"))     # of box size
+
+
+def iou_matrix(a, b):
+    """IoU between (top, right, bottom, left) boxes a (m) and b (n)."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    top    = np.maximum(a[:, None, 0], b[None, :, 0])
+    right  = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left   = np.maximum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(bottom - top, 0, None) * np.clip(right - left, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 1] - a[:, 3])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 1] - b[:, 3])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class Track:
+    """One face followed across frames, with the identity last assigned to it."""
+
+    __slots__ = ("id", "box", "last_seen", "hits",
+                 "encoding", "name", "identified_at", "identified_box")
+
+    def __init__(self, track_id, box, now):
+        self.id = track_id
+        self.box = box
+        self.last_seen = now
+        self.hits = 1
+        self.encoding = None
+        self.name = None            # gallery name, or None for unknown
+        self.identified_at = None
+        self.identified_box = None
+
+    def needs_encoding(self, now, move_ratio, known_ttl, unknown_ttl):
+        if self.encoding is None:
+            return True
+        ttl = known_ttl if self.name else unknown_ttl
+        if now - self.identified_at > ttl:
+            return True
+        # Re-encode if the face moved or changed size noticeably
+        t0, r0, b0, l0 = self.identified_box
+        t1, r1, b1, l1 = self.box
+        size = max(b0 - t0, r0 - l0, 1)
+        shift = max(abs((t1 + b1) - (t0 + b0)), abs((l1 + r1) - (l0 + r0))) / 2.0
+        grow = abs((b1 - t1) - (b0 - t0))
+        return shift > move_ratio * size or grow > move_ratio * size
+
+
+class FaceTracker:
+    """
+    Associates face boxes across frames by IoU so that encoding and gallery
+    matching only run for new tracks, tracks that moved a lot, or tracks
+    whose identity has expired. Identities carry over along a track.
+    Boxes are full-frame coordinates, so a change of detection scale does
+    not break the IoU matching.
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU_THRESHOLD, max_age=TRACK_MAX_AGE,
+                 identity_ttl=TRACK_IDENTITY_TTL, unknown_ttl=TRACK_UNKNOWN_TTL,
+                 move_ratio=TRACK_MOVE_RATIO):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.identity_ttl = identity_ttl
+        self.unknown_ttl = unknown_ttl
+        self.move_ratio = move_ratio
+
+        self.tracks = []
+        self.last_seq = None        # newest frame seen, when callers pass seq
+        self.gallery = None         # gallery identities were last reset for
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.encoded = 0
+        self.reused = 0
+
+    def update(self, locations, now=None, seq=None):
+        """
+        Associate this frame's face locations with existing tracks.
+        Returns one (track, needs_encoding) pair per location, in order.
+
+        Frames analysed in parallel can finish out of order; with seq (the
+        capture sequence number) a frame older than one already seen leaves
+        the tracks alone and returns None, and its faces are encoded as usual.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if seq is not None:
+                if self.last_seq is not None and seq <= self.last_seq:
+                    return None
+                self.last_seq = seq
+            self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+
+            assigned = [None] * len(locations)
+            if self.tracks and locations:
+                ious = iou_matrix(locations, [t.box for t in self.tracks])
+                # Greedy: best remaining pair first
+                used = set()
+                for flat in np.argsort(ious, axis=None)[::-1]:
+                    i, j = np.unravel_index(flat, ious.shape)
+                    if ious[i, j] < self.iou_threshold:
+                        break
+                    if assigned[i] is None and j not in used:
+                        assigned[i] = self.tracks[j]
+                        used.add(j)
+
+            result = []
+            for i, loc in enumerate(locations):
+                track = assigned[i]
+                if track is None:
+                    track = Track(self._next_id, loc, now)
+                    self._next_id += 1
+                    self.tracks.append(track)
+                else:
+                    track.box = loc
+                    track.last_seen = now
+                    track.hits += 1
+
+                needs = track.needs_encoding(
+                    now, self.move_ratio, self.identity_ttl, self.unknown_ttl
+                )
+                if needs:
+                    self.encoded += 1
+                else:
+                    self.reused += 1
+                result.append((track, needs))
+            return result
+
+    def identify(self, track, encoding, name, now=None, gallery=None):
+        """
+        Store a fresh encoding and identity on a track. Ignored when made
+        against a gallery other than the one given to forget_identities().
+        """
+        with self._lock:
+            if gallery is not None and self.gallery is not None and gallery is not self.gallery:
+                return
+            track.encoding = encoding
+            track.name = name
+            track.identified_at = time.time() if now is None else now
+            track.identified_box = track.box
+
+    def forget_identities(self, gallery=None):
+        """Make every track encode and match again, e.g. against a new gallery."""
+        with self._lock:
+            self.gallery = gallery
+            for track in self.tracks:
+                track.encoding = None
+                track.name = None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "tracks":  len(self.tracks),
+                "encoded": self.encoded,
+                "reused":  self.reused,
+            }
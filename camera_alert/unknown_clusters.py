@@ -0,0 +1,205 @@
+# camera_alert/unknown_clusters.py
+
+import os
+import time
+import threading
+import numpy as np
+
+from camera_alert.matcher import pairwise_distances
+
+# ── Cluster store settings ────────────────────────────────────────────────────
+CLUSTER_THRESHOLD    = float(os.getenv("CLUSTER_THRESHOLD", "0.5"))
+UNKNOWN_MAX_CLUSTERS = int(os.getenv("UNKNOWN_MAX_CLUSTERS", "5000"))
+UNKNOWN_CLUSTER_TTL  = float(os.getenv("UNKNOWN_CLUSTER_TTL", str(7 * 24 * 3600)))  # s since last seen
+UNKNOWN_CLUSTER_FILE = os.getenv("UNKNOWN_CLUSTER_FILE")   # .npz path, unset = in memory only
+CENTROID_MAX_WEIGHT  = 50   # running mean stops hardening after this many sightings
+
+
+class UnknownClusterStore:
+    """
+    Online clustering index for unknown faces.
+
+    Centroids live in one preallocated float32 array and are updated as a
+    running mean on every sighting. Assignment is a single batched
+    nearest-centroid query per frame. Clusters unseen for ttl seconds are
+    dropped, and when the store is full the least recently seen cluster is
+    evicted. Alert throttling state (last_alert) is kept per cluster.
+    """
+
+    def __init__(self, threshold=CLUSTER_THRESHOLD, max_clusters=UNKNOWN_MAX_CLUSTERS,
+                 ttl=UNKNOWN_CLUSTER_TTL, path=UNKNOWN_CLUSTER_FILE):
+        self.threshold = threshold
+        self.capacity = max(1, max_clusters)
+        self.ttl = ttl
+        self.path = path
+
+        self.size = 0
+        self.next_id = 1
+        self.centroids  = np.zeros((self.capacity, 128), dtype=np.float32)
+        self.sq_norms   = np.zeros(self.capacity, dtype=np.float32)
+        self.ids        = np.zeros(self.capacity, dtype=np.int64)
+        self.counts     = np.zeros(self.capacity, dtype=np.int32)
+        self.last_seen  = np.zeros(self.capacity, dtype=np.float64)
+        self.last_alert = np.zeros(self.capacity, dtype=np.float64)  # 0 = never
+        self._index = {}            # cluster id -> row
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.evicted = 0
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return self.size
+
+    # -- assignment --
+    def assign(self, encodings, now=None):
+        """Cluster id for each encoding, creating clusters as needed."""
+        if not len(encodings):
+            return []
+        now = time.time() if now is None else now
+        encs = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+
+        with self._lock:
+            if now - self._last_sweep > 60:
+                self._sweep(now)
+
+            # Nearest existing cluster id per encoding (0 = none within threshold)
+            nearest = np.zeros(len(encs), dtype=np.int64)
+            if self.size:
+                n = self.size
+                dists = pairwise_distances(encs, self.centroids[:n], self.sq_norms[:n])
+                best = np.argmin(dists, axis=1)
+                hit = dists[np.arange(len(encs)), best] < self.threshold
+                nearest[hit] = self.ids[best[hit]]
+
+            result, created = [], []
+            for enc, cid in zip(encs, nearest):
+                # Look the row up now: evictions below may have moved it
+                row = self._index.get(int(cid), -1)
+                if row < 0:
+                    # May match a cluster created earlier in this same frame
+                    row = self._match_created(enc, created)
+                if row < 0:
+                    row = self._create(enc, now)
+                    created.append(int(self.ids[row]))
+                else:
+                    self._update(row, enc, now)
+                result.append(int(self.ids[row]))
+            return result
+
+    def _match_created(self, enc, created):
+        """Nearest row among clusters created during the current assign()."""
+        rows = [self._index[cid] for cid in created if cid in self._index]
+        if not rows:
+            return -1
+        d = pairwise_distances([enc], self.centroids[rows], self.sq_norms[rows])[0]
+        i = int(np.argmin(d))
+        return rows[i] if d[i] < self.threshold else -1
+
+    def _update(self, row, enc, now):
+        w = min(self.counts[row], CENTROID_MAX_WEIGHT)
+        c = self.centroids[row]
+        c += (enc - c) / (w + 1)
+        self.sq_norms[row] = c @ c
+        self.counts[row] += 1
+        self.last_seen[row] = now
+
+    def _create(self, enc, now):
+        if self.size >= self.capacity:
+            # Full: evict the least recently seen cluster
+            self._remove(int(np.argmin(self.last_seen[:self.size])))
+            self.evicted += 1
+        row = self.size
+        self.size += 1
+        self.centroids[row] = enc
+        self.sq_norms[row] = enc @ enc
+        self.ids[row] = self.next_id
+        self.counts[row] = 1
+        self.last_seen[row] = now
+        self.last_alert[row] = 0.0
+        self._index[self.next_id] = row
+        self.next_id += 1
+        return row
+
+    def _remove(self, row):
+        """Swap-remove so the live rows stay contiguous."""
+        last = self.size - 1
+        del self._index[int(self.ids[row])]
+        if row != last:
+            for arr in (self.centroids, self.sq_norms, self.ids,
+                        self.counts, self.last_seen, self.last_alert):
+                arr[row] = arr[last]
+            self._index[int(self.ids[row])] = row
+        self.size -= 1
+
+    def _sweep(self, now):
+        self._last_sweep = now
+        if not self.ttl:
+            return
+        expired = np.nonzero(now - self.last_seen[:self.size] > self.ttl)[0]
+        for row in sorted(expired, reverse=True):
+            self._remove(int(row))
+        self.evicted += len(expired)
+
+    # -- alert throttling --
+    def should_alert(self, cluster_id, interval, now=None):
+        """True (and records the alert) if cluster_id has not alerted within interval."""
+        now = time.time() if now is None else now
+        with self._lock:
+            row = self._index.get(cluster_id)
+            if row is None:
+                return False
+            last = self.last_alert[row]
+            if last and now - last < interval:
+                return False
+            self.last_alert[row] = now
+            return True
+
+    # -- persistence --
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            n = self.size
+            data = {
+                "centroids":  self.centroids[:n].copy(),
+                "ids":        self.ids[:n].copy(),
+                "counts":     self.counts[:n].copy(),
+                "last_seen":  self.last_seen[:n].copy(),
+                "last_alert": self.last_alert[:n].copy(),
+                "next_id":    np.array(self.next_id),
+            }
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, **data)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        try:
+            data = np.load(path)
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Could not load unknown-face clusters from {path}: {e}")
+            return
+        with self._lock:
+            # Keep the most recently seen clusters if the cap shrank
+            order = np.argsort(data["last_seen"])[::-1][:self.capacity]
+            n = len(order)
+            self.centroids[:n]  = data["centroids"][order]
+            self.ids[:n]        = data["ids"][order]
+            self.counts[:n]     = data["counts"][order]
+            self.last_seen[:n]  = data["last_seen"][order]
+            self.last_alert[:n] = data["last_alert"][order]
+            self.sq_norms[:n]   = np.einsum("ij,ij->i", self.centroids[:n], self.centroids[:n])
+            self.size = n
+            self.next_id = int(data["next_id"])
+            self._index = {int(cid): row for row, cid in enumerate(self.ids[:n])}
+        print(f"[INFO] Loaded {n} unknown-face clusters from {path}")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "clusters": self.size,
+                "capacity": self.capacity,
+                "evicted":  self.evicted,
+            }
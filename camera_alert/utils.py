@@ -2,9 +2,41 @@
 
 import cv2
 import os
+from urllib.parse import urlsplit, urlunsplit
 
-def save_snapshot(frame, filename, folder="snapshots"):
-    os.makedirs(folder, exist_ok=True)
-    path = os.path.join(folder, filename)
-    cv2.imwrite(path, frame, [cv2.IMWRITE_JPEG_QUALITY, 95])  # High quality
-    return path
+from camera_alert.snapshot_store import SNAPSHOT_DIR, get_snapshot_writer
+
+def save_snapshot(frame, filename, folder=SNAPSHOT_DIR):
+    """
+    Queue a snapshot (and its thumbnail) for the background writer.
+    Returns the path, under a per-day subfolder, that it will be written to.
+    """
+    return get_snapshot_writer(folder).submit(frame, filename)
+
+def redact_url(url):
+    """url without the user:password@ part, for log messages."""
+    try:
+        parts = urlsplit(str(url))
+    except ValueError:
+        return "<stream>"
+    if "@" not in parts.netloc:
+        return str(url)
+    return urlunsplit(parts._replace(netloc="***@" + parts.netloc.rsplit("@", 1)[1]))
+
+def open_rtsp_stream(rtsp_url):
+    """
+    Open an RTSP stream over TCP with low-latency FFmpeg options.
+    Returns the cv2.VideoCapture, or None if it could not be opened.
+    """
+    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = (
+        "rtsp_transport;tcp|buffer_size;1024000|max_delay;500000|"
+        "stimeout;10000000|fps;15|flags;low_delay|loglevel;quiet"
+    )
+
+    cam = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
+    cam.set(cv2.CAP_PROP_BUFFERSIZE, 0)
+
+    if not cam.isOpened():
+        cam.release()
+        return None
+    return cam
@@ -1,4 +1,5 @@
 document.addEventListener("DOMContentLoaded", () => {
+  connectLive();   // subscribe first so nothing written during the load is missed
   applyFilters();  // initial load
 });
 
@@ -25,24 +26,28 @@ function loadEvents() {
         container.innerHTML = "<li>No events in this range.</li>";
         return;
       }
-      events.forEach(ev => {
-        const li = document.createElement("li");
-        li.innerHTML = `
-          <div class="event-entry">
-            <a href="${ev.snapshot_path}" target="_blank" class="event-link">
-              <strong>${ev.name}</strong> — ${ev.timestamp}
-            </a>
-            <button class="btn btn-delete"
-                    title="Delete"
-                    onclick="deleteEvent(${ev.id})">
-              ❌
-            </button>
-          </div>`;
-        container.appendChild(li);
-      });
+      events.forEach(ev => container.appendChild(eventItem(ev)));
     });
 }
 
+function eventItem(ev) {
+  const li = document.createElement("li");
+  li.dataset.id = ev.id;
+  li.innerHTML = `
+    <div class="event-entry">
+      <a href="${ev.snapshot_path}" target="_blank" class="event-link">
+        <img src="${ev.thumbnail}" class="event-thumb" loading="lazy" alt="">
+        <strong>${ev.name}</strong> — ${ev.timestamp}
+      </a>
+      <button class="btn btn-delete"
+              title="Delete"
+              onclick="deleteEvent(${ev.id})">
+        ❌
+      </button>
+    </div>`;
+  return li;
+}
+
 function deleteEvent(id) {
   if (!confirm("Delete this event?")) return;
   fetch(`/api/delete_event/${id}`, { method: "DELETE" })
@@ -57,7 +62,7 @@ function clearEvents() {
 
 function exportEventsCSV() {
   const params = getDateRangeParams();
-  window.open(`/api/events${params}&format=csv`, "_blank");
+  window.open(`/api/events${params ? params + "&" : "?"}format=csv`, "_blank");
 }
 
 // ─── Employee attendance ────────────────────────────────────────────────────
@@ -72,20 +77,76 @@ function loadAttendance() {
         tbody.innerHTML = `<tr><td colspan="4" style="text-align:center">No records</td></tr>`;
         return;
       }
-      logs.forEach(emp => {
-        const row = document.createElement("tr");
-        row.innerHTML = `
-          <td>${emp.name}</td>
-          <td>${emp.date}</td>
-          <td>${emp.first_seen}</td>
-          <td>${emp.last_seen}</td>`;
-        tbody.appendChild(row);
-      });
+      logs.forEach(emp => tbody.appendChild(attendanceRow(emp)));
     });
 }
 
+function attendanceRow(emp) {
+  const row = document.createElement("tr");
+  row.dataset.key = `${emp.name}|${emp.date}`;
+  row.innerHTML = `
+    <td>${emp.name}</td>
+    <td>${emp.date}</td>
+    <td>${emp.first_seen}</td>
+    <td>${emp.last_seen}</td>`;
+  return row;
+}
+
 function exportAttendance() {
   const params = getDateRangeParams();
   // will download .xlsx via new /api/export_attendance endpoint
   window.location = `/api/export_attendance${params}`;
 }
+
+// ─── Live updates (server-sent events) ──────────────────────────────────────
+// EventSource reconnects on its own and resends the last event id, so the
+// server replays whatever was missed; "reset" means it could not.
+function inDateRange(day) {
+  const start = document.getElementById("filterStart").value;
+  const end   = document.getElementById("filterEnd").value;
+  return !(start && end) || (day >= start && day <= end);
+}
+
+function connectLive() {
+  const source = new EventSource("/api/live");
+
+  source.addEventListener("unknown_face", e => {
+    const ev = JSON.parse(e.data);
+    const container = document.getElementById("eventsList");
+    if (!inDateRange(ev.timestamp.slice(0, 10))) return;
+    if (container.querySelector(`li[data-id="${ev.id}"]`)) return;
+    if (!container.querySelector("li[data-id]")) container.innerHTML = "";
+    container.prepend(eventItem(ev));
+  });
+
+  source.addEventListener("attendance", e => {
+    const emp = JSON.parse(e.data);
+    const tbody = document.getElementById("attendanceBody");
+    if (!inDateRange(emp.date)) return;
+    const row = attendanceRow(emp);
+    const old = tbody.querySelector(`tr[data-key="${CSS.escape(row.dataset.key)}"]`);
+    if (old) {
+      old.replaceWith(row);
+    } else {
+      if (!tbody.querySelector("tr[data-key]")) tbody.innerHTML = "";
+      tbody.prepend(row);
+    }
+  });
+
+  source.addEventListener("event_deleted", e => {
+    const { id } = JSON.parse(e.data);
+    document.querySelector(`#eventsList li[data-id="${id}"]`)?.remove();
+  });
+
+  source.addEventListener("events_cleared", () => {
+    document.getElementById("eventsList").innerHTML = "";
+  });
+
+  source.addEventListener("attendance_deleted", e => {
+    const { name, date } = JSON.parse(e.data);
+    const key = CSS.escape(`${name}|${date}`);
+    document.querySelector(`#attendanceBody tr[data-key="${key}"]`)?.remove();
+  });
+
+  source.addEventListener("reset", () => applyFilters());
+}
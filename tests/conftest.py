@@ -0,0 +1,7 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Run from a checkout: make the camera_alert package importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,233 @@
+# tests/test_notifier.py
+#
+# AlertDispatcher against a local SMTP server and a fake Telegram endpoint:
+# digests, retries with backoff, giving up, SMTP connection reuse and restarts.
+
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from camera_alert.notifier import AlertDispatcher, EmailChannel, TelegramChannel
+
+
+class FakeSMTP(socketserver.ThreadingTCPServer):
+    """Just enough SMTP for smtplib: counts connections and stores messages."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.fail_next = 0      # answer DATA with a temporary error this many times
+        self.lock = threading.Lock()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 fake ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode().strip().upper()
+            if cmd.startswith(("EHLO", "HELO")):
+                self.reply("250 fake")
+            elif cmd.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif cmd == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                body = []
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b".\r\n", b""):
+                        break
+                    body.append(data)
+                with server.lock:
+                    failing = server.fail_next > 0
+                    if failing:
+                        server.fail_next -= 1
+                    else:
+                        server.messages.append(b"".join(body).decode(errors="replace"))
+                self.reply("451 Try again later" if failing else "250 Queued")
+            elif cmd == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+class FakeTelegram(ThreadingHTTPServer):
+    """Records sendMessage posts; fails the first fail_next of them with 500."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _TelegramHandler)
+        self.posts = []
+        self.attempts = []      # time of every request, successful or not
+        self.fail_next = 0
+        self.lock = threading.Lock()
+
+
+class _TelegramHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        with server.lock:
+            server.attempts.append(time.time())
+            failing = server.fail_next > 0
+            if failing:
+                server.fail_next -= 1
+            else:
+                server.posts.append((self.path, form["text"][0]))
+        self.send_response(500 if failing else 200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def smtp():
+    server = _serve(FakeSMTP())
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def telegram():
+    server = _serve(FakeTelegram())
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _email(smtp):
+    return EmailChannel(server="127.0.0.1", port=smtp.server_address[1], user=None,
+                        password=None, starttls=False, sender="camera@example.com",
+                        recipients="ops@example.com")
+
+
+def _telegram(telegram):
+    host, port = telegram.server_address
+    return TelegramChannel(token="123:abc", chat_id="42", api_url=f"http://{host}:{port}")
+
+
+def _dispatcher(tmp_path, channels, **kwargs):
+    options = dict(digest_window=0.2, max_attempts=4, retry_base=0.2, retry_max=1.0)
+    options.update(kwargs)
+    dispatcher = AlertDispatcher(channels, db_path=str(tmp_path / "alerts.db"), **options)
+    dispatcher.start()
+    return dispatcher
+
+
+def _wait_for(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def test_burst_is_sent_as_one_digest_per_channel(tmp_path, smtp, telegram):
+    dispatcher = _dispatcher(tmp_path, [_email(smtp), _telegram(telegram)])
+    try:
+        for i in range(3):
+            dispatcher.enqueue(f"Unknown_{i}", f"snapshots/{i}.jpg")
+        assert _wait_for(lambda: smtp.messages and telegram.posts)
+        time.sleep(0.5)     # nothing else may follow
+    finally:
+        dispatcher.close()
+
+    assert len(smtp.messages) == 1 and len(telegram.posts) == 1
+    path, text = telegram.posts[0]
+    assert path == "/bot123:abc/sendMessage"
+    assert "3 alerts" in text
+    assert all(f"Unknown_{i}" in text for i in range(3))
+    assert "Subject: Camera Alert: 3 faces detected" in smtp.messages[0]
+    assert dispatcher.sent == 6
+
+
+def test_failed_sends_are_retried_with_backoff(tmp_path, smtp, telegram):
+    telegram.fail_next = 2
+    smtp.fail_next = 1
+    dispatcher = _dispatcher(tmp_path, [_email(smtp), _telegram(telegram)])
+    try:
+        dispatcher.enqueue("Unknown_1", "snapshots/1.jpg")
+        assert _wait_for(lambda: smtp.messages and telegram.posts)
+    finally:
+        dispatcher.close()
+
+    assert len(telegram.attempts) == 3
+    gaps = [b - a for a, b in zip(telegram.attempts, telegram.attempts[1:])]
+    # Jittered exponential backoff: ~0.2 s, then ~0.4 s
+    assert gaps[0] >= 0.2 * 0.8 - 0.05
+    assert gaps[1] >= 0.4 * 0.8 - 0.05
+    assert dispatcher.retried == 3 and dispatcher.failed == 0
+    assert "Unknown_1" in telegram.posts[0][1]
+
+
+def test_gives_up_after_max_attempts(tmp_path, telegram):
+    telegram.fail_next = 100
+    dispatcher = _dispatcher(tmp_path, [_telegram(telegram)], max_attempts=2)
+    try:
+        dispatcher.enqueue("Unknown_1", "snapshots/1.jpg")
+        assert _wait_for(lambda: dispatcher.failed == 1)
+    finally:
+        dispatcher.close()
+
+    assert len(telegram.attempts) == 2
+    assert dispatcher.sent == 0 and dispatcher.retried == 1
+
+
+def test_smtp_connection_is_reused_between_digests(tmp_path, smtp):
+    dispatcher = _dispatcher(tmp_path, [_email(smtp)], digest_window=0.1)
+    try:
+        dispatcher.enqueue("Unknown_1", "snapshots/1.jpg")
+        assert _wait_for(lambda: len(smtp.messages) == 1)
+        dispatcher.enqueue("Unknown_2", "snapshots/2.jpg")
+        assert _wait_for(lambda: len(smtp.messages) == 2)
+    finally:
+        dispatcher.close()
+
+    assert smtp.connections == 1
+    assert "Unknown_1" in smtp.messages[0] and "Unknown_2" in smtp.messages[1]
+
+
+def test_undelivered_alerts_survive_a_restart(tmp_path, telegram):
+    telegram.fail_next = 1
+    dispatcher = _dispatcher(tmp_path, [_telegram(telegram)], retry_base=1.0)
+    dispatcher.enqueue("Unknown_1", "snapshots/1.jpg")
+    assert _wait_for(lambda: dispatcher.retried == 1)
+    dispatcher.close()      # before the retry is due
+    assert not telegram.posts
+
+    dispatcher = _dispatcher(tmp_path, [_telegram(telegram)], retry_base=1.0)
+    try:
+        assert _wait_for(lambda: telegram.posts)
+    finally:
+        dispatcher.close()
+    assert len(telegram.posts) == 1 and "Unknown_1" in telegram.posts[0][1]
+    assert dispatcher.sent == 1